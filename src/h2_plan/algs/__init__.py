@@ -1,5 +1,8 @@
+from .aggregation import get_aggregation_error
+from .benders import Benders
 from .dinklebach import Dinkelbach
+from .hedging import ProgressiveHedging
 from .pareto import Pareto
 from .sensitivity import get_weather_sensitivity
 
-__all__ = ['Dinkelbach', 'Pareto', 'get_weather_sensitivity']
\ No newline at end of file
+__all__ = ['get_aggregation_error', 'Benders', 'Dinkelbach', 'ProgressiveHedging', 'Pareto', 'get_weather_sensitivity']
\ No newline at end of file
@@ -0,0 +1,83 @@
+"""
+This file contains a function to measure the error in LCOH introduced by the
+representative-period mode, by solving the same configuration at full
+resolution and with aggregated weather.
+"""
+import csv
+import time
+from copy import deepcopy
+from pathlib import Path
+from h2_plan.opt.core import H2Planning
+from h2_plan.opt.store import SolutionStore, scenario_lcoh
+
+
+def get_aggregation_error(parameters, key, filename, filepath=None, aggregation_factor=10,
+                          solver='appsi_highs', mip_percentage=1, mode='pyomo'):
+    """
+    Solves a configuration at full resolution and with representative periods
+    of aggregation_factor hours on average, and compares the LCOH of each
+    scenario.
+
+    Args:
+        parameters (dict): The formulation parameters.
+        key (str): Label of the comparison; the builds are stored under
+            '{key}_full' and '{key}_aggregated'.
+        filename (str): Weather data file used to build the model.
+        filepath (str): Directory of the weather data file.
+        aggregation_factor (float): Mean number of hours per representative period.
+        solver (str): The solver to use.
+        mip_percentage (float): MIP gap percentage for the solver.
+        mode (str): Build mode, 'pyomo' or 'nodes'.
+
+    Returns:
+        dict: Number of nodes, build and solve times and LCOH per scenario of
+        both builds, and the absolute and relative LCOH error per scenario.
+        The report is also written to data/{key}_aggregation.csv.
+    """
+    data_dir = Path(__file__).resolve().parent.parent / 'data'
+    report = {}
+    for label, factor in (('full', 1), ('aggregated', aggregation_factor)):
+        build_parameters = deepcopy(parameters)
+        build_parameters['aggregation_factor'] = factor
+        build_key = f'{key}_{label}'
+
+        start_time = time.time()
+        model = H2Planning(build_parameters, build_key, filename, filepath, mode=mode)
+        build_time = time.time() - start_time
+
+        start_time = time.time()
+        H2Planning.class_solve(
+            key=build_key, solver=solver, mip_percentage=mip_percentage,
+            reinitialise=True, verbose=False
+        )
+        report[label] = {
+            'nodes': len(model.instance.full_set),
+            'build_time': build_time,
+            'solve_time': time.time() - start_time,
+            'lcoh': scenario_lcoh(SolutionStore.load(build_key)),
+        }
+
+    report['absolute_error'] = [
+        aggregated - full if not isinstance(full, str) and not isinstance(aggregated, str) else None
+        for full, aggregated in zip(report['full']['lcoh'], report['aggregated']['lcoh'])
+    ]
+    report['relative_error'] = [
+        error / full if error is not None else None
+        for error, full in zip(report['absolute_error'], report['full']['lcoh'])
+    ]
+    errors = [abs(error) for error in report['relative_error'] if error is not None]
+    print(
+        f"[INFO] Representative periods: {report['full']['nodes']} -> "
+        f"{report['aggregated']['nodes']} nodes, LCOH error mean "
+        f"{100 * sum(errors) / max(len(errors), 1):.2f}% max {100 * max(errors, default=0):.2f}%"
+    )
+
+    with open(data_dir / f'{key}_aggregation.csv', mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['scenario', 'full', 'aggregated', 'absolute_error', 'relative_error'])
+        for s, row in enumerate(zip(
+            report['full']['lcoh'], report['aggregated']['lcoh'],
+            report['absolute_error'], report['relative_error']
+        )):
+            writer.writerow([s, *row])
+    return report
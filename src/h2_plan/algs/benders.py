@@ -0,0 +1,495 @@
+"""
+This module implements a Benders (L-shaped) decomposition that separates the
+capacity design from the operation of the plant. A small master problem over
+the capacities and the production of each scenario is solved as an LP, and
+the LP-relaxed operation of each scenario path returns optimality cuts.
+The integrality of the capacities and of the operation is dropped throughout,
+so the decomposition solves the LP relaxation of the model and its LCOH is a
+relaxed estimate, not the LCOH of an integer plan.
+
+The recourse of a scenario is the operating cost of meeting a production
+target with given capacities, so cuts do not depend on the hydrogen price and
+are cached on disk for every run that shares the same tree and operating data.
+"""
+
+import os
+import csv
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from pathlib import Path
+from numpy import (
+    abs as np_abs, array, concatenate, empty, full, load, maximum, savez, zeros
+)
+from scipy.optimize import linprog
+from scipy.sparse import csr_matrix
+from pyomo.environ import (
+    Constraint, NonNegativeReals, Objective, Param, RangeSet, Suffix, TerminationCondition,
+    Var, minimize, value
+)
+from pyomo.repn import generate_standard_repn
+from h2_plan.opt.cache import recourse_hash
+from h2_plan.opt.solvers import Deadline, available_threads, get_backend
+from .scenarios import (
+    build_scenario, coupled_variables, refresh_subproblem, scenario_objective, scenario_paths,
+    scenario_production, scenario_solver, scenario_tree, solver_options
+)
+
+# State of a worker process, set up once by _initialise
+_WORKER = {}
+
+
+class CutCache:
+    """
+    Optimality cuts stored under a recourse hash. A cut of scenario s reads
+    theta_s >= constant + gradient @ capacities + production_gradient * production_s.
+
+    Attributes:
+    .. path: The .npz file holding the cuts, or None to keep them in memory only.
+    .. names: Names of the capacity variables, in gradient order.
+    .. scenario, constant, gradient, production_gradient: Arrays of the cuts.
+    .. center: Last accepted capacities and scenario productions, if any.
+    """
+
+    def __init__(self, digest, names, n_scenarios, directory=None):
+        if directory is None:
+            directory = Path(__file__).resolve().parent.parent / 'tmp' / 'cache' / 'cuts'
+        if digest is None:
+            self.path = None
+        else:
+            directory = Path(directory)
+            directory.mkdir(parents=True, exist_ok=True)
+            self.path = directory / f'{digest}.npz'
+        self.names = list(names)
+        self.scenario = empty(0, dtype=int)
+        self.constant = empty(0)
+        self.gradient = empty((0, len(names)))
+        self.production_gradient = empty(0)
+        self.center = None
+        if self.path is not None and self.path.exists():
+            with load(self.path) as cached:
+                if list(cached['names']) == self.names and int(cached['n_scenarios']) == n_scenarios:
+                    self.scenario = cached['scenario']
+                    self.constant = cached['constant']
+                    self.gradient = cached['gradient']
+                    self.production_gradient = cached['production_gradient']
+                    if 'center_capacities' in cached:
+                        self.center = (cached['center_capacities'], cached['center_production'])
+        self.n_scenarios = n_scenarios
+
+    def __len__(self):
+        return len(self.scenario)
+
+    def add(self, s, recourse, gradient, production_gradient, capacities, production):
+        """
+        Adds the cut of scenario s evaluated at the given capacities and production.
+        """
+        self.scenario = concatenate([self.scenario, [s]])
+        self.constant = concatenate([
+            self.constant,
+            [recourse - gradient @ capacities - production_gradient * production]
+        ])
+        self.gradient = concatenate([self.gradient, gradient[None, :]])
+        self.production_gradient = concatenate([self.production_gradient, [production_gradient]])
+
+    def save(self, capacities, production):
+        """
+        Writes the cuts and the current center to disk.
+        """
+        self.center = (capacities, production)
+        if self.path is None:
+            return
+        temporary = self.path.with_suffix(f'.{os.getpid()}.tmp.npz')
+        savez(
+            temporary, names=array(self.names), n_scenarios=self.n_scenarios,
+            scenario=self.scenario, constant=self.constant, gradient=self.gradient,
+            production_gradient=self.production_gradient,
+            center_capacities=capacities, center_production=production
+        )
+        os.replace(temporary, self.path)
+
+
+def capital_cost(instance, capacities):
+    """
+    Returns the linear coefficients of the capacity variables in CAPEX, and its constant.
+    """
+    repn = generate_standard_repn(instance.total_capital_expenditure.body)
+    coefficients = {id(v): c for v, c in zip(repn.linear_vars, repn.linear_coefs)}
+    return array([coefficients.get(id(v), 0) for v in capacities], dtype=float), repn.constant
+
+
+def _initialise(parameters, filename, filepath, nodes, solver, options, shortfall_price):
+    """
+    Prepares a worker process, which builds the LP recourse of its scenarios
+    on first use and keeps them loaded in their solvers.
+    """
+    _WORKER.update(
+        parameters=parameters, filename=filename, filepath=filepath, nodes=nodes,
+        paths=scenario_paths(nodes), solver=solver, backend=get_backend(solver),
+        options=options, shortfall_price=shortfall_price, subproblems={}
+    )
+
+
+def _subproblem(s):
+    """
+    Returns the recourse subproblem of scenario s held by the worker, building
+    the LP relaxation of its scenario path on first use. The capacities and the
+    production target are mutable parameters, so only they change between solves.
+    """
+    state = _WORKER
+    if s in state['subproblems']:
+        return state['subproblems'][s]
+    instance = build_scenario(
+        state['parameters'], state['filename'], state['filepath'], s, relax=True
+    )
+    capacities = coupled_variables(instance, state['nodes'], 'capacity')[0]
+    produced = scenario_production(instance, state['nodes'], state['paths'][s])
+
+    instance.benders_set = RangeSet(0, len(capacities) - 1)
+    instance.benders_capacity = Param(instance.benders_set, mutable=True, initialize=0)
+    instance.benders_fix = Constraint(
+        instance.benders_set, rule=lambda m, i: capacities[i] == m.benders_capacity[i]
+    )
+    instance.benders_target = Param(mutable=True, initialize=0)
+    instance.benders_shortfall = Var(within=NonNegativeReals)
+    instance.benders_demand = Constraint(
+        expr=produced + instance.benders_shortfall >= instance.benders_target
+    )
+    instance.benders_objective = Objective(
+        expr=instance.OPEX[s] + state['shortfall_price'] * instance.benders_shortfall / 1000,
+        sense=minimize
+    )
+    instance.total_capital_expenditure.deactivate()
+    instance.dual = Suffix(direction=Suffix.IMPORT)
+
+    solver, persistent = scenario_solver(state['solver'], state['options'], instance)
+    subproblem = state['subproblems'][s] = {
+        'instance': instance, 'capacities': capacities, 'produced': produced,
+        'solver': solver, 'persistent': persistent,
+    }
+    return subproblem
+
+
+def _wait_and_see(s):
+    """
+    Solves scenario s with free capacities, minimising its full scenario
+    objective, in a one-off solve that leaves the recourse subproblem unchanged.
+    """
+    state = _WORKER
+    subproblem = _subproblem(s)
+    instance = subproblem['instance']
+    recourse = (instance.benders_fix, instance.benders_demand, instance.benders_objective)
+    for component in recourse:
+        component.deactivate()
+    instance.total_capital_expenditure.activate()
+    instance.benders_free = Objective(
+        expr=scenario_objective(instance, state['nodes'], state['paths'][s], s), sense=minimize
+    )
+    try:
+        solver = state['backend'].create()
+        for option, setting in state['options'].items():
+            solver.options[option] = setting
+        return state['backend'].solve(solver, instance)
+    finally:
+        instance.del_component('benders_free')
+        instance.total_capital_expenditure.deactivate()
+        for component in recourse:
+            component.activate()
+
+
+def _solve_recourse(s, capacities=None, production=None):
+    """
+    Solves the operation of scenario s in a worker process. Without
+    capacities, the capacities are left free and the full scenario objective
+    is minimised (the wait-and-see solution used as a starting point).
+
+    Returns:
+        tuple: The scenario, the recourse value, its gradients with respect to
+        the capacities and the production target, the OPEX, the production,
+        and the capacities of the solution.
+    """
+    state = _WORKER
+    subproblem = _subproblem(s)
+    instance = subproblem['instance']
+
+    if capacities is None:
+        results = _wait_and_see(s)
+    else:
+        for i, capacity in enumerate(capacities):
+            instance.benders_capacity[i] = float(capacity)
+        instance.benders_target = float(production)
+        refresh_subproblem(
+            subproblem['solver'], subproblem['persistent'], state['backend'],
+            list(instance.benders_fix.values()) + [instance.benders_demand]
+        )
+        results = state['backend'].solve(subproblem['solver'], instance, subproblem['persistent'])
+    condition = results.solver.termination_condition
+    if condition != TerminationCondition.optimal:
+        raise RuntimeError(f'Scenario {s} recourse terminated with status {condition}')
+
+    opex = value(instance.OPEX[s])
+    solution = array([v.value for v in subproblem['capacities']], dtype=float)
+    if capacities is None:
+        return s, None, None, None, opex, value(subproblem['produced']), solution
+    gradient = array([instance.dual[instance.benders_fix[i]] for i in instance.benders_set])
+    return (
+        s, value(instance.benders_objective), gradient, instance.dual[instance.benders_demand],
+        opex, value(subproblem['produced']), solution
+    )
+
+
+class Benders:
+    """
+    L-shaped decomposition of a model into a capacity master problem and
+    per-scenario LP recourse subproblems, stabilised by a box trust region.
+
+    Each scenario path is operated independently given the capacities, so
+    nonanticipativity of the operation at shared tree nodes is relaxed, as in
+    the 'capacity' coupling of ProgressiveHedging. Every recourse subproblem is
+    built for its own scenario path only, and each worker process keeps the
+    subproblems of a fixed share of the scenarios, so no process holds the
+    extensive form of the whole tree.
+
+    Attributes:
+    .. key: Key of the run, naming its log.
+    .. nodes: NodeIndex of the whole tree.
+    .. names: Names of the capacity variables.
+    .. cuts: The CutCache of the recourse.
+    .. capacities: Capacities of the best solution found.
+    .. opex, production: OPEX and production of each scenario at that solution.
+    .. history: Bounds of each iteration.
+    .. objective: NPV of the best solution, None before solve().
+    .. relaxation: Always True; the decomposition solves the LP relaxation.
+    .. timed_out: Whether the last solve stopped at its deadline.
+    """
+    relaxation = True
+
+    def __init__(self, key, parameters, filename, filepath=None, tolerance=1e-4,
+                 max_iterations=100, shortfall_price=100, trust=1.0):
+        """
+        Args:
+            key (str): A string used to identify the run.
+            parameters (dict): The formulation parameters, with net_present_value set.
+            filename (str): Weather data file used to build the model.
+            filepath (str): Directory of the weather data file.
+            tolerance (float): Relative gap between the bounds at which to stop.
+            max_iterations (int): Maximum number of master iterations.
+            shortfall_price (float): Price ($/kg) charged for missing a production
+                target; it must exceed any hydrogen price the cuts are used with.
+            trust (float): Initial half-width of the trust region, relative to the center.
+        """
+        if not parameters['booleans']['net_present_value']:
+            raise ValueError(
+                'Benders decomposes the NPV objective; build the model with net_present_value set'
+            )
+        self.key = key
+        self.parameters = parameters
+        self.filename = filename
+        self.filepath = filepath
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.shortfall_price = shortfall_price
+        self.trust = trust
+        self.history = []
+
+        # CAPEX is the same on every scenario path, so it is read from the first
+        self.nodes = scenario_tree(parameters, filename, filepath)
+        instance = build_scenario(parameters, filename, filepath, 0, relax=True)
+        capacities = coupled_variables(instance, self.nodes, 'capacity')[0]
+        self.names = [v.name for v in capacities]
+        self.cost, self.cost_constant = capital_cost(instance, capacities)
+        self.n_scenarios = len(self.nodes.leaves)
+        self.hydrogen_price = value(instance.hydrogen_price)
+        try:
+            digest = recourse_hash(parameters, filename, filepath)
+        except FileNotFoundError as e:
+            print(f'[INFO] Cut cache skipped: {e}')
+            digest = None
+        self.cuts = CutCache(digest, self.names, self.n_scenarios)
+        self.capacities = None
+        self.opex = None
+        self.production = None
+        self.objective = None
+        self.timed_out = False
+
+    def master(self, center, delta, hydrogen_price):
+        """
+        Solves the master LP over the capacities, scenario productions and
+        recourse estimates, restricted to a box around the center.
+
+        Returns:
+            tuple: Capacities, productions, objective and whether the box binds.
+        """
+        n, S = len(self.names), self.n_scenarios
+        scale = maximum(np_abs(concatenate(center)), 1)
+        lower = maximum(concatenate(center) - delta * scale, 0)
+        upper = concatenate(center) + delta * scale
+
+        k = len(self.cuts)
+        rows = array(range(k))
+        A = csr_matrix(
+            (
+                concatenate([self.cuts.production_gradient, -1 * full(k, 1.0)]),
+                (concatenate([rows, rows]),
+                 concatenate([n + self.cuts.scenario, n + S + self.cuts.scenario]))
+            ),
+            shape=(k, n + 2 * S)
+        )
+        A = A + csr_matrix(
+            (self.cuts.gradient.ravel(), (rows.repeat(n), array(list(range(n)) * k))),
+            shape=(k, n + 2 * S)
+        )
+        c = concatenate([self.cost, full(S, -hydrogen_price / 1000 / S), full(S, 1 / S)])
+        bounds = list(zip(lower, upper)) + [(None, None)] * S
+        result = linprog(c, A_ub=A, b_ub=-self.cuts.constant, bounds=bounds, method='highs')
+        if result.status != 0:
+            raise RuntimeError(f'Benders master problem failed: {result.message}')
+
+        point = result.x[:n + S]
+        binding = (
+            ((point - lower < 1e-6 * scale) & (lower > 0)) | (upper - point < 1e-6 * scale)
+        ).any()
+        return point[:n], point[n:], result.fun + self.cost_constant, binding
+
+    def evaluate(self, pools, capacities, production):
+        """
+        Solves the recourse of every scenario at a point, adds the cuts and
+        returns the NPV of the point.
+        """
+        futures = [
+            pools[s % len(pools)].submit(_solve_recourse, s, capacities, production[s])
+            for s in range(self.n_scenarios)
+        ]
+        recourse = zeros(self.n_scenarios)
+        opex = zeros(self.n_scenarios)
+        produced = zeros(self.n_scenarios)
+        for future in futures:
+            s, recourse[s], gradient, production_gradient, opex[s], produced[s], _ = future.result()
+            self.cuts.add(s, recourse[s], gradient, production_gradient, capacities, production[s])
+        return recourse, opex, produced
+
+    def solve(self, hydrogen_price=None, workers=None, total_threads=None, solver='gurobi',
+              deadline=None):
+        """
+        Runs the decomposition of the LP relaxation, solving the scenario
+        recourse in worker processes and logging the bounds of every iteration
+        to cache/benders/{key}.csv. Scenario s is always solved by worker
+        s % workers, which builds its recourse once and keeps it in a
+        persistent solver where the solver has one.
+
+        Args:
+            hydrogen_price (float): Hydrogen price ($/kg) of the master problem
+                (default is the price the instance was built with).
+            workers (int): Number of worker processes (default is one per scenario,
+                capped at the thread budget).
+            total_threads (int): Global solver-thread budget (default is the
+                available CPUs, see available_threads).
+            solver (str): The LP solver used for the recourse (it must return duals).
+            deadline (float or Deadline): Optional wall-clock budget; once it runs
+                out the best solution so far is kept and timed_out is set.
+
+        Returns:
+            Benders: self, with capacities, opex and production set.
+        """
+        hydrogen_price = self.hydrogen_price if hydrogen_price is None else hydrogen_price
+        if hydrogen_price >= self.shortfall_price:
+            raise ValueError('The shortfall price must exceed the hydrogen price')
+        S = self.n_scenarios
+        deadline = Deadline.coerce(deadline)
+        self.timed_out = False
+        total_threads = total_threads or available_threads()
+        workers = max(1, min(workers or S, total_threads))
+        options = solver_options(solver, max(1, total_threads // workers), 0)
+
+        log_dir = Path(__file__).resolve().parent.parent.parent / 'cache' / 'benders'
+        log_dir.mkdir(parents=True, exist_ok=True)
+        print(f'[INFO] Benders over {len(self.names)} capacities and {S} scenarios '
+              f'on {workers} workers, {len(self.cuts)} cached cuts (LP relaxation, '
+              f'integrality of the capacities is dropped)')
+
+        start_time = time.time()
+        with open(log_dir / f'{self.key}.csv', mode='w', newline='') as file, ExitStack() as stack:
+            pools = [
+                stack.enter_context(ProcessPoolExecutor(
+                    max_workers=1, initializer=_initialise,
+                    initargs=(
+                        self.parameters, self.filename, self.filepath, self.nodes,
+                        solver, options, self.shortfall_price
+                    )
+                ))
+                for _ in range(workers)
+            ]
+            writer = csv.writer(file)
+            writer.writerow(['Iteration', 'Upper Bound', 'Lower Bound', 'Gap', 'Cuts', 'Time'])
+
+            if self.cuts.center is not None:
+                capacities, production = self.cuts.center
+            else:
+                # Start from the average of the wait-and-see capacities
+                solutions = [f.result() for f in [
+                    pools[s % workers].submit(_solve_recourse, s) for s in range(S)
+                ]]
+                capacities = sum(x for *_, x in solutions) / S
+                production = array([produced for *_, produced, _ in solutions])
+
+            recourse, opex, produced = self.evaluate(pools, capacities, production)
+            upper = self.cost @ capacities + self.cost_constant + (
+                recourse - hydrogen_price / 1000 * production
+            ).mean()
+            self.capacities, self.opex, self.production = capacities, opex, produced
+            delta = self.trust
+
+            for iteration in range(self.max_iterations):
+                if deadline is not None and deadline.expired():
+                    print(f'[INFO] Benders deadline reached for {self.key} after {iteration} iterations')
+                    self.timed_out = True
+                    break
+                x, y, lower, binding = self.master((capacities, production), delta, hydrogen_price)
+                gap = (upper - lower) / max(abs(upper), 1)
+                self.history.append({
+                    'Iteration': iteration, 'Upper Bound': upper, 'Lower Bound': lower,
+                    'Gap': gap, 'Cuts': len(self.cuts), 'Time': time.time() - start_time
+                })
+                writer.writerow(self.history[-1].values())
+                file.flush()
+                print(f'[INFO] Iteration {iteration}: bounds [{lower:.6g}, {upper:.6g}], '
+                      f'gap {gap:.3e}, trust region {delta:.3g}')
+                if gap < self.tolerance:
+                    if not binding:
+                        break
+                    delta *= 2
+                    continue
+
+                recourse, opex, produced = self.evaluate(pools, x, y)
+                candidate = self.cost @ x + self.cost_constant + (
+                    recourse - hydrogen_price / 1000 * y
+                ).mean()
+                if candidate < upper:
+                    # Serious step: move the center, and widen the box if it was binding
+                    capacities, production, upper = x, y, candidate
+                    self.capacities, self.opex, self.production = x, opex, produced
+                    if binding:
+                        delta *= 2
+                else:
+                    delta = max(delta / 2, 1e-3)
+
+            self.cuts.save(capacities, production)
+        self.objective = upper
+        return self
+
+    def lcoh(self):
+        """
+        Returns the LCOH ($/kg) of the best solution of the LP relaxation.
+        """
+        if self.objective is None:
+            raise RuntimeError('Benders has no solution yet, call solve() first')
+        capex = self.cost @ self.capacities + self.cost_constant
+        return 1000 * (capex + self.opex.mean()) / self.production.mean()
+
+    def capacity_dict(self):
+        """
+        Returns the capacities of the best solution by variable name.
+        """
+        if self.objective is None:
+            raise RuntimeError('Benders has no solution yet, call solve() first')
+        return dict(zip(self.names, map(float, self.capacities)))
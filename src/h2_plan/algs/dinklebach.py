@@ -2,12 +2,66 @@
 This module implements the Dinkelbach algorithm for optimizing the levelized cost of hydrogen (LCOH).
 """
 
+import csv
+import time
+from math import inf, isfinite
 from numpy import abs
 import pandas as pd
 from copy import deepcopy
 from pathlib import Path
 from h2_plan.opt import H2Planning
-import time
+from h2_plan.opt.store import LCOHKernel
+from h2_plan.opt.solvers import Deadline
+from .benders import Benders
+
+LOG_COLUMNS = ['Hydrogen Price', 'LCOH', 'Break Out']
+FRACTIONAL_COLUMNS = [
+    'Iteration', 'Hydrogen Price', 'LCOH', 'F', 'F Bound', 'Lower', 'Upper',
+    'Next Price', 'Build Time', 'Solve Time', 'Break Out'
+]
+UPDATES = ('newton', 'secant')
+
+
+def append_row(path, columns, row):
+    """
+    Appends a row to a CSV log, writing the header first if the log is new,
+    so that every iteration costs one short write.
+    """
+    path = Path(path)
+    new = not path.exists() or path.stat().st_size == 0
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, mode='a', newline='') as file:
+        writer = csv.writer(file)
+        if new:
+            writer.writerow(columns)
+        writer.writerow(row)
+
+
+def next_price(points, lower, upper, update='newton'):
+    """
+    Returns the hydrogen price of the next iteration of Dinkelbach.fractional.
+
+    F(price) = min CAPEX + mean OPEX - price * Y / 1000 is zero up to the
+    minimum LCOH and concave and decreasing above it. The Newton step is the
+    LCOH of the best solution found (upper); the secant step is the root of
+    the line through the last two iterates with F < 0, kept only if it falls
+    strictly inside the bracket (lower, upper).
+
+    Args:
+        points (list): The (price, F) of every iteration.
+        lower (float): Largest price proven not to exceed the minimum LCOH.
+        upper (float): Lowest LCOH found.
+        update (str): 'newton' or 'secant'.
+    """
+    if update == 'secant':
+        right = [(price, f) for price, f in points if f < 0]
+        if len(right) >= 2:
+            (p1, f1), (p2, f2) = right[-2:]
+            if f1 != f2:
+                secant = p2 - f2 * (p2 - p1) / (f2 - f1)
+                if lower < secant < upper:
+                    return secant
+    return upper
 
 
 class Dinkelbach:
@@ -29,7 +83,9 @@ class Dinkelbach:
         self.instance = model
 
     @classmethod
-    def warm_start(cls, key, original_parameters, initial_guess=5, tolerance=0.05, max_price=10, time_lim=None):
+    def warm_start(cls, key, original_parameters, initial_guess=5, tolerance=0.05, max_price=10, time_lim=None,
+                   filename='CoastalChile_15-20_Wind.csv', filepath=None, solver='gurobi', persistent=False,
+                   benders=False, mip_start=False):
         """
         Perform a warm start for the Dinkelbach algorithm.
 
@@ -39,104 +95,245 @@ class Dinkelbach:
             initial_guess (float): Initial guess for the LCOH value.
             tolerance (float): Convergence tolerance for the algorithm.
             max_price (float): Maximum allowable price for hydrogen.
-            time_lim (float): Optional time limit for the optimization process.
+            time_lim (float or Deadline): Optional wall-clock budget of the whole
+                run, builds included. Every solve gets the time that remains; once
+                it runs out the LCOH of the last solution is logged and returned.
+            filename (str): Weather data file used to build the model.
+            filepath (str): Directory of the weather data file.
+            solver (str): The solver to use.
+            persistent (bool): If True, the model is built once and held in a
+                persistent solver; later iterations only update the hydrogen
+                price and warm start from the previous solution.
+            benders (bool): If True, each iteration is solved by the Benders
+                decomposition over the LP relaxation, reusing the cached cuts, with
+                the time that remains. The iterations then converge on the LCOH of
+                the relaxation, a lower estimate of the LCOH of the MILP.
+            mip_start (bool): If True, each rebuilt model is started from the
+                stored solution of the previous iteration.
+
+        Returns:
+            float: The LCOH of the last iteration (of the LP relaxation with benders).
         """
         hydrogen_price = max_price
         break_out = False
+        built = False
+        decomposition = None
         LCOH = initial_guess
-        start_time = time.time()
+        deadline = Deadline.coerce(time_lim)
 
         # Get the current working directory
         current_dir = Path(__file__).resolve().parent
 
         # Target directory for presolved model
         cache_dir = current_dir.parent.parent / 'cache' 
+        log_file = cache_dir / f'dinklebach/{key}.csv'
+        label = ' (LP relaxation)' if benders else ''
+        if benders:
+            print(f'[INFO] Dinkelbach over Benders iterates on the LCOH of the LP relaxation of {key}')
 
         # Iterate until the difference between hydrogen_price and LCOH is within tolerance
         while abs(hydrogen_price - LCOH) > tolerance * hydrogen_price:
 
             try:
-                df = pd.read_csv(cache_dir / f'dinklebach/{key}.csv')
-                if not df.empty:
-                    # Retrieve the last row of the log file
-                    last_row = df.iloc[-1]
-                    hydrogen_price = last_row['Hydrogen Price']
-                    LCOH = last_row['LCOH']
-                    break_out = last_row['Break Out']
-                else:
-                    # Initialize the log file if empty
-                    df = pd.DataFrame(columns=['Hydrogen Price', 'LCOH', 'Break Out'])
-                    new_row = pd.DataFrame([{
-                        'Hydrogen Price': hydrogen_price,
-                        'LCOH': LCOH,
-                        'Break Out': break_out
-                    }])
-                    df = pd.concat([df, new_row], ignore_index=True)
-                    df.to_csv(cache_dir / f'dinklebach/{key}.csv', index=False)
+                df = pd.read_csv(log_file)
             except FileNotFoundError:
-                # Create a new log file if it does not exist
-                df = pd.DataFrame(columns=['Hydrogen Price', 'LCOH', 'Break Out'])
-                new_row = pd.DataFrame([{
-                    'Hydrogen Price': hydrogen_price,
-                    'LCOH': LCOH,
-                    'Break Out': break_out
-                }])
-                df = pd.concat([df, new_row], ignore_index=True)
-                df.to_csv(cache_dir / f'dinklebach/{key}.csv', index=False)
+                df = pd.DataFrame(columns=LOG_COLUMNS)
+            if not df.empty:
+                # Retrieve the last row of the log file
+                last_row = df.iloc[-1]
+                hydrogen_price = last_row['Hydrogen Price']
+                LCOH = last_row['LCOH']
+                break_out = last_row['Break Out']
+            else:
+                # Initialize the log file
+                append_row(log_file, LOG_COLUMNS, [hydrogen_price, LCOH, break_out])
+
+            if not break_out and deadline is not None and deadline.expired():
+                print(f'[INFO] Dinkelbach deadline reached for {key}, LCOH{label} = {LCOH}')
+                break
 
             if not break_out:
                 # Adjust LCOH if it exceeds the maximum price
                 if LCOH > max_price:
                     LCOH = max_price
 
-                # Update parameters with the current hydrogen price
-                parameters = deepcopy(original_parameters)
                 hydrogen_price = LCOH
-                parameters['hydrogen_price'] = LCOH
+                if persistent and built:
+                    # Only the objective coefficient changes between iterations
+                    H2Planning.update_hydrogen_price(hydrogen_price)
+                elif not benders:
+                    # Update parameters with the current hydrogen price
+                    parameters = deepcopy(original_parameters)
+                    parameters['hydrogen_price'] = LCOH
+                    H2Planning(parameters, key, filename, filepath)
 
-                # Solve the optimization model
-                H2Planning(parameters, key)
-                current_time = time.time()
-                if time_lim is not None:
-                    instance = H2Planning.class_solve(
-                        key=key,
-                        time=time_lim - (current_time - start_time),
-                        reinitialise=True
-                    ).instance
+                if benders:
+                    # The subproblems are built per scenario path by the decomposition
+                    # and its cuts do not depend on the price, so each iteration
+                    # starts from those of the last
+                    if decomposition is None:
+                        decomposition = Benders(key, original_parameters, filename, filepath)
+                    LCOH = decomposition.solve(
+                        hydrogen_price=hydrogen_price, solver=solver, deadline=deadline
+                    ).lcoh()
+                    built = True
                 else:
+                    # Solve the optimization model with the time left
+                    if deadline is not None and deadline.expired():
+                        print(f'[INFO] Dinkelbach deadline reached for {key} while building')
+                        break
                     instance = H2Planning.class_solve(
                         key=key,
-                        reinitialise=True
+                        solver=solver,
+                        deadline=deadline,
+                        reinitialise=not (persistent and built),
+                        persistent=persistent,
+                        start=key if mip_start and built and not persistent else None
                     ).instance
+                    built = True
 
-                # Calculate the discounted demand
-                discounted_demand = (
-                    (8760 / instance.end_time_index * instance.amortisation_plant *
-                     sum(
-                         sum(
-                             (instance.leaf_nodes[s, t, d]) *
-                             instance.energy_vector_production_flux[(s_v, t_v, d_v), q].value * d
-                             for s, t, d, s_v, t_v, d_v in instance.vector_set_time
-                         ) / 120
-                         for q in instance.vectors
-                     )) / len(instance.scenario.data())
-                )
-
-                # Update LCOH based on the new discounted demand
-                LCOH = (
-                    (10**3) * sum(instance.OPEX[s].value / len(instance.scenario) for s in instance.scenario) +
-                    (10**3) * instance.CAPEX.value
-                ) / discounted_demand
+                    # LCOH of the expected costs and production of the solution
+                    LCOH = LCOHKernel.from_instance(instance).mean_lcoh()
 
                 # Check for convergence
                 if abs(hydrogen_price - LCOH) < tolerance * hydrogen_price:
                     break_out = True
 
                 # Log the updated values
-                new_row = pd.DataFrame([{
-                    'Hydrogen Price': hydrogen_price,
-                    'LCOH': LCOH,
-                    'Break Out': break_out
-                }])
-                df = pd.concat([df, new_row], ignore_index=True)
-                df.to_csv(cache_dir / f'dinklebach/{key}.csv', index=False)
+                append_row(log_file, LOG_COLUMNS, [hydrogen_price, LCOH, break_out])
+
+        if benders:
+            print(f'[INFO] Dinkelbach over Benders finished for {key}, LCOH{label} = {LCOH}')
+        return LCOH
+
+    @classmethod
+    def fractional(cls, key, original_parameters, initial_guess=5, tolerance=0.05, max_price=10,
+                   update='newton', max_iterations=20, mip_percentage=5, time_lim=None,
+                   filename='CoastalChile_15-20_Wind.csv', filepath=None, solver='gurobi',
+                   persistent=False, mip_start=False):
+        """
+        Minimises the LCOH by root finding on the parametric objective of the
+        NPV model, F(price) = min CAPEX + mean OPEX - price * Y / 1000, whose
+        root is the minimum LCOH (see next_price for the updates). Every solve
+        narrows a bracket on the minimum LCOH: the LCOH of its solution is an
+        upper end, and a price whose F is proven non-negative by the MIP bound
+        is a lower end.
+
+        Iterations stop when:
+        .. the step |price - LCOH| is within tolerance * price, or the bracket
+           is within tolerance * upper;
+        .. the step is within the uncertainty of F left by the MIP gap,
+           1000 * (F - F bound) / Y, so another solve cannot improve on it;
+        .. the price stops moving, or max_iterations or the deadline is reached.
+
+        Each iteration is appended to cache/dinklebach/{key}.fractional.csv with
+        its build and solve times; a run resumes from the last row of the log.
+
+        Args:
+            key (str): Unique identifier for the instance.
+            original_parameters (dict): Original parameters for the optimization model.
+            initial_guess (float): Hydrogen price of the first iteration.
+            tolerance (float): Relative convergence tolerance.
+            max_price (float): Maximum allowable price for hydrogen.
+            update (str): 'newton' (the Dinkelbach step) or 'secant'.
+            max_iterations (int): Maximum number of solves.
+            mip_percentage (float): MIP gap percentage of every solve.
+            time_lim (float or Deadline): Optional wall-clock budget of the run.
+            filename (str): Weather data file used to build the model.
+            filepath (str): Directory of the weather data file.
+            solver (str): The solver to use.
+            persistent (bool): Whether to keep the model loaded in a persistent
+                solver and only update the hydrogen price.
+            mip_start (bool): Whether each rebuilt model starts from the stored
+                solution of the previous iteration.
+
+        Returns:
+            float: The lowest LCOH found (inf if nothing was produced).
+        """
+        if update not in UPDATES:
+            raise ValueError(f"Unknown update '{update}', expected one of {', '.join(UPDATES)}")
+        deadline = Deadline.coerce(time_lim)
+        cache_dir = Path(__file__).resolve().parent.parent.parent / 'cache'
+        log_file = cache_dir / f'dinklebach/{key}.fractional.csv'
+
+        points, lower, upper = [], 0.0, inf
+        price, first = min(initial_guess, max_price), 0
+        if log_file.exists():
+            with open(log_file, 'r', newline='') as file:
+                rows = list(csv.DictReader(file))
+            if rows:
+                last = rows[-1]
+                upper = float(last['Upper'])
+                if last['Break Out'] == 'True':
+                    print(f'[INFO] Dinkelbach log of {key} already converged, LCOH = {upper}')
+                    return upper
+                points = [(float(row['Hydrogen Price']), float(row['F'])) for row in rows]
+                lower, price, first = float(last['Lower']), float(last['Next Price']), len(rows)
+
+        built = False
+        for iteration in range(first, max_iterations):
+            if deadline is not None and deadline.expired():
+                print(f'[INFO] Dinkelbach deadline reached for {key}, LCOH = {upper}')
+                break
+
+            start_time = time.time()
+            if persistent and built:
+                H2Planning.update_hydrogen_price(price)
+            else:
+                parameters = deepcopy(original_parameters)
+                parameters['hydrogen_price'] = price
+                H2Planning(parameters, key, filename, filepath)
+            build_time = time.time() - start_time
+            if deadline is not None and deadline.expired():
+                print(f'[INFO] Dinkelbach deadline reached for {key} while building')
+                break
+
+            model = H2Planning.class_solve(
+                key=key, solver=solver, mip_percentage=mip_percentage, deadline=deadline,
+                reinitialise=not (persistent and built), persistent=persistent,
+                start=key if mip_start and built and not persistent else None
+            )
+            built = True
+            solve_time = time.time() - start_time - build_time
+
+            # F at the solution, and the lower bound on F proven by the solver
+            kernel = LCOHKernel.from_instance(model.instance)
+            production = kernel.expected_production
+            cost = kernel.capex + kernel.opex.mean()
+            f = cost - price * production / 1000
+            bound = model.results.problem.lower_bound
+            bound = f if bound is None or not isfinite(float(bound)) else min(f, float(bound))
+            lcoh = 1000 * cost / production if production > 0 else inf
+
+            upper = min(upper, lcoh)
+            if bound >= 0:
+                lower = max(lower, price)
+            points.append((price, f))
+
+            step = abs(price - lcoh)
+            if not isfinite(upper):
+                # Nothing is produced below the minimum LCOH
+                reason, following = None, max_price if price < max_price else price
+            else:
+                if step <= tolerance * price or upper - lower <= tolerance * upper:
+                    reason = 'converged'
+                elif production > 0 and step <= 1000 * (f - bound) / production:
+                    reason = 'within the MIP gap'
+                else:
+                    reason = None
+                following = min(next_price(points, lower, upper, update), max_price)
+            if reason is None and following == price:
+                reason = 'stalled'
+
+            append_row(log_file, FRACTIONAL_COLUMNS, [
+                iteration, price, lcoh, f, bound, lower, upper, following,
+                build_time, solve_time, reason is not None
+            ])
+            print(f'[INFO] Dinkelbach iteration {iteration}: price {price:.4f}, LCOH {lcoh:.4f}, '
+                  f'bracket [{lower:.4f}, {upper:.4f}] in {solve_time:.2f} seconds')
+            if reason is not None:
+                print(f'[INFO] Dinkelbach stopped for {key} ({reason}), LCOH = {upper}')
+                break
+            price = following
+
+        return upper
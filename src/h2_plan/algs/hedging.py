@@ -0,0 +1,333 @@
+"""
+This module implements progressive hedging over the scenarios of the stochastic
+tree. Each scenario path is built and solved as an independent subproblem in
+worker processes, and agreement on the decisions shared between scenarios is
+restored iteratively through the progressive hedging multipliers.
+"""
+
+import csv
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from pathlib import Path
+from numpy import abs as np_abs, array, bincount, concatenate, full, zeros
+from pyomo.environ import (
+    Constraint, NonNegativeReals, Objective, Param, RangeSet, Var, TerminationCondition,
+    minimize, quicksum, value
+)
+from h2_plan.opt.solvers import available_threads, get_backend
+from .scenarios import (
+    build_scenario, coupled_variables, refresh_subproblem, scenario_objective,
+    scenario_paths, scenario_solver, scenario_tree, solver_options
+)
+
+# Tangent points of the linear proximal term, as fractions of its span. The
+# geometric ladder keeps the approximation tight close to the target.
+TANGENTS = tuple(sign * 2.0 ** -j for sign in (-1, 1) for j in range(10))
+
+# State of a worker process, set up once by _initialise
+_WORKER = {}
+
+
+def _initialise(parameters, filename, filepath, nodes, coupling, proximal, solver, options,
+                relax=False):
+    """
+    Prepares a worker process, which builds the subproblems of its scenarios
+    on first use and keeps them loaded in their solvers.
+    """
+    _WORKER.update(
+        parameters=parameters, filename=filename, filepath=filepath, nodes=nodes,
+        paths=scenario_paths(nodes), coupling=coupling, proximal=proximal, solver=solver,
+        backend=get_backend(solver), options=options, relax=relax, subproblems={}
+    )
+
+
+def _subproblem(s):
+    """
+    Returns the subproblem of scenario s held by the worker, building it on
+    first use. The hedging terms enter through mutable parameters, so the
+    objective and constraints keep their structure between iterations.
+    """
+    state = _WORKER
+    if s in state['subproblems']:
+        return state['subproblems'][s]
+    instance = build_scenario(
+        state['parameters'], state['filename'], state['filepath'], s, state['relax']
+    )
+    coupled, _ = coupled_variables(instance, state['nodes'], state['coupling'])
+    base = scenario_objective(instance, state['nodes'], state['paths'][s], s)
+
+    instance.ph_set = RangeSet(0, len(coupled) - 1)
+    instance.ph_weight = Param(instance.ph_set, mutable=True, initialize=0)
+    expr = base + quicksum(instance.ph_weight[i] * coupled[i] for i in instance.ph_set)
+    constraints = []
+    if state['proximal'] == 'linear':
+        # Outer approximation of the quadratic proximal term by tangent cuts,
+        # whose slopes and offsets are set for every solve
+        instance.ph_tangents = RangeSet(0, len(TANGENTS) - 1)
+        instance.ph_slope = Param(instance.ph_set, instance.ph_tangents, mutable=True, initialize=0)
+        instance.ph_offset = Param(instance.ph_set, instance.ph_tangents, mutable=True, initialize=0)
+        instance.ph_deviation = Var(instance.ph_set, within=NonNegativeReals)
+        instance.ph_tangent = Constraint(
+            instance.ph_set, instance.ph_tangents,
+            rule=lambda m, i, k: m.ph_deviation[i] >= m.ph_slope[i, k] * coupled[i] - m.ph_offset[i, k]
+        )
+        constraints = list(instance.ph_tangent.values())
+        expr = expr + quicksum(instance.ph_deviation[i] for i in instance.ph_set)
+    else:
+        instance.ph_target = Param(instance.ph_set, mutable=True, initialize=0)
+        instance.ph_rho = Param(instance.ph_set, mutable=True, initialize=0)
+        expr = expr + quicksum(
+            instance.ph_rho[i] / 2 * (coupled[i] - instance.ph_target[i]) ** 2
+            for i in instance.ph_set
+        )
+    instance.ph_objective = Objective(expr=expr, sense=minimize)
+
+    solver, persistent = scenario_solver(state['solver'], state['options'], instance)
+    subproblem = state['subproblems'][s] = {
+        'instance': instance, 'coupled': coupled, 'base': base, 'constraints': constraints,
+        'solver': solver, 'persistent': persistent,
+        'names': [v.name for v in coupled],
+        'n_capacity': len(coupled_variables(instance, state['nodes'], 'capacity')[0]),
+    }
+    return subproblem
+
+
+def _scenario_coupling(s):
+    """
+    Returns the names of the coupled variables of scenario s, in the order of
+    its subproblem, and the number of capacity variables leading them.
+    """
+    subproblem = _subproblem(s)
+    return s, subproblem['names'], subproblem['n_capacity']
+
+
+def _solve_scenario(s, weights=None, targets=None, rho=None):
+    """
+    Solves the subproblem of scenario s in a worker process. Without targets
+    the plain scenario objective is minimised; otherwise the multiplier and
+    proximal terms of progressive hedging are added.
+
+    Returns:
+        tuple: The scenario, its objective value without the hedging terms,
+        and the values of its coupled variables.
+    """
+    state = _WORKER
+    subproblem = _subproblem(s)
+    instance = subproblem['instance']
+    if targets is None:
+        weights = targets = rho = zeros(len(subproblem['coupled']))
+
+    for i, (w, target, r) in enumerate(zip(weights, targets, rho)):
+        instance.ph_weight[i] = float(w)
+        if state['proximal'] == 'linear':
+            # The steepest tangents must outweigh the multiplier, or the
+            # subproblem becomes unbounded
+            span = 2 * max(abs(target), abs(w) / r, 1) if r > 0 else 0
+            for k, fraction in enumerate(TANGENTS):
+                slope = r * fraction * span
+                instance.ph_slope[i, k] = slope
+                instance.ph_offset[i, k] = slope * target + slope * fraction * span / 2
+        else:
+            instance.ph_target[i] = float(target)
+            instance.ph_rho[i] = float(r)
+    refresh_subproblem(
+        subproblem['solver'], subproblem['persistent'], state['backend'],
+        subproblem['constraints'], instance.ph_objective
+    )
+
+    results = state['backend'].solve(subproblem['solver'], instance, subproblem['persistent'])
+    condition = results.solver.termination_condition
+    if condition not in (TerminationCondition.optimal, TerminationCondition.maxTimeLimit):
+        raise RuntimeError(f'Scenario {s} subproblem terminated with status {condition}')
+    return s, value(subproblem['base']), array([v.value for v in subproblem['coupled']], dtype=float)
+
+
+class ProgressiveHedging:
+    """
+    Progressive hedging over the scenario paths of a model. Every subproblem
+    is built for its own scenario path only, and each worker process keeps the
+    subproblems of a fixed share of the scenarios, so no process holds the
+    extensive form of the whole tree.
+
+    Attributes:
+    .. key: Key of the run, naming its log.
+    .. nodes: NodeIndex of the whole tree.
+    .. names: Names of the coupled variables, set by solve().
+    .. xbar: Scenario average of each coupled variable after the last iteration.
+    .. history: Convergence metrics of each iteration.
+    """
+
+    def __init__(self, key, parameters, filename, filepath=None, rho=1.0, coupling='capacity',
+                 proximal='quadratic', tolerance=1e-3, max_iterations=100):
+        """
+        Args:
+            key (str): A string used to identify the run.
+            parameters (dict): The formulation parameters, with net_present_value set.
+            filename (str): Weather data file used to build the model.
+            filepath (str): Directory of the weather data file.
+            rho (float or dict): Penalty of the proximal term, either one value
+                or a dictionary by variable name (missing names use 1).
+            coupling (str): 'capacity' or 'tree', see coupled_variables.
+            proximal (str): 'quadratic' (needs an MIQP solver such as gurobi) or
+                'linear', a tangent-cut approximation of the quadratic term that
+                any MILP solver can handle.
+            tolerance (float): Stop once the scaled mean deviation from the
+                scenario average falls below this value.
+            max_iterations (int): Maximum number of hedging iterations.
+        """
+        if proximal not in ('quadratic', 'linear'):
+            raise ValueError(f"Unknown proximal term '{proximal}', expected 'quadratic' or 'linear'")
+        if coupling not in ('capacity', 'tree'):
+            raise ValueError(f"Unknown coupling '{coupling}', expected 'capacity' or 'tree'")
+        if not parameters['booleans']['net_present_value']:
+            raise ValueError(
+                'Progressive hedging decomposes the NPV objective; build the model '
+                'with net_present_value set'
+            )
+        self.key = key
+        self.parameters = parameters
+        self.filename = filename
+        self.filepath = filepath
+        self.rho = rho
+        self.coupling = coupling
+        self.proximal = proximal
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.history = []
+        self.xbar = None
+        self.names = None
+        self.nodes = scenario_tree(parameters, filename, filepath)
+
+    def couple(self, coupling):
+        """
+        Indexes the coupled variables reported by the subproblems: every
+        scenario maps its own coupled variables to their position among the
+        coupled variables of all scenarios.
+
+        Args:
+            coupling (list): The names and number of capacity variables of the
+                coupled variables of every scenario (see _scenario_coupling).
+        """
+        position = {}
+        for names, _ in coupling:
+            for name in names:
+                position.setdefault(name, len(position))
+        self.names = list(position)
+        self.n_capacity = coupling[0][1]
+        self.members = [array([position[name] for name in names], dtype=int) for names, _ in coupling]
+        self.counts = bincount(concatenate(self.members), minlength=len(self.names))
+        if isinstance(self.rho, dict):
+            self.penalty = array(
+                [self.rho.get(name.split('[')[0], 1.0) for name in self.names], dtype=float
+            )
+        else:
+            self.penalty = full(len(self.names), float(self.rho))
+
+    def average(self, x):
+        """
+        Returns the average of each coupled variable over the scenarios that share it.
+        """
+        return bincount(
+            concatenate(self.members), weights=concatenate(x), minlength=len(self.counts)
+        ) / self.counts
+
+    def solve(self, workers=None, total_threads=None, solver='gurobi', mip_percentage=1, relax=False):
+        """
+        Runs progressive hedging, solving the scenario subproblems in worker
+        processes and logging the convergence of every iteration to
+        cache/hedging/{key}.csv. Scenario s is always solved by worker
+        s % workers, which builds its subproblem once and keeps it in a
+        persistent solver where the solver has one.
+
+        Args:
+            workers (int): Number of worker processes (default is one per scenario,
+                capped at the thread budget).
+            total_threads (int): Global solver-thread budget (default is the
+                available CPUs, see available_threads).
+            solver (str): The solver used for the subproblems.
+            mip_percentage (float): MIP gap percentage of the subproblems.
+            relax (bool): Whether to relax the integer variables of the subproblems.
+
+        Returns:
+            ProgressiveHedging: self, with names, xbar and history set.
+        """
+        if self.proximal == 'quadratic' and solver == 'cbc':
+            raise ValueError("cbc cannot solve the quadratic proximal term, use proximal='linear'")
+
+        n_scenarios = len(self.nodes.leaves)
+        total_threads = total_threads or available_threads()
+        workers = max(1, min(workers or n_scenarios, total_threads))
+        threads = max(1, total_threads // workers)
+        options = solver_options(solver, threads, mip_percentage)
+
+        log_dir = Path(__file__).resolve().parent.parent.parent / 'cache' / 'hedging'
+        log_dir.mkdir(parents=True, exist_ok=True)
+
+        start_time = time.time()
+        x = [None] * n_scenarios
+        with open(log_dir / f'{self.key}.csv', mode='w', newline='') as file, ExitStack() as stack:
+            pools = [
+                stack.enter_context(ProcessPoolExecutor(
+                    max_workers=1, initializer=_initialise,
+                    initargs=(
+                        self.parameters, self.filename, self.filepath, self.nodes,
+                        self.coupling, self.proximal, solver, options, relax
+                    )
+                ))
+                for _ in range(workers)
+            ]
+            coupling = [None] * n_scenarios
+            for future in [pools[s % workers].submit(_scenario_coupling, s) for s in range(n_scenarios)]:
+                s, names, n_capacity = future.result()
+                coupling[s] = (names, n_capacity)
+            self.couple(coupling)
+            print(f'[INFO] Progressive hedging over {n_scenarios} scenarios and '
+                  f'{len(self.names)} coupled variables on {workers} workers')
+
+            weights = [zeros(len(m)) for m in self.members]
+            writer = csv.writer(file)
+            writer.writerow(['Iteration', 'Deviation', 'Scaled Deviation', 'Expected Objective', 'Time'])
+            for iteration in range(self.max_iterations + 1):
+                if iteration == 0:
+                    futures = [pools[s % workers].submit(_solve_scenario, s) for s in range(n_scenarios)]
+                else:
+                    futures = [
+                        pools[s % workers].submit(
+                            _solve_scenario, s, weights[s], self.xbar[m], self.penalty[m]
+                        )
+                        for s, m in enumerate(self.members)
+                    ]
+                objective = 0
+                for future in futures:
+                    s, scenario_value, x[s] = future.result()
+                    objective += scenario_value / n_scenarios
+
+                self.xbar = self.average(x)
+                deviation = sum(
+                    np_abs(x[s] - self.xbar[m]).sum() for s, m in enumerate(self.members)
+                ) / n_scenarios
+                scaled = deviation / max(np_abs(self.xbar).sum(), 1e-9)
+                for s, m in enumerate(self.members):
+                    weights[s] += self.penalty[m] * (x[s] - self.xbar[m])
+
+                self.history.append({
+                    'Iteration': iteration, 'Deviation': deviation, 'Scaled Deviation': scaled,
+                    'Expected Objective': objective, 'Time': time.time() - start_time
+                })
+                writer.writerow(self.history[-1].values())
+                file.flush()
+                print(f'[INFO] Iteration {iteration}: deviation {deviation:.4g} '
+                      f'(scaled {scaled:.3e}), expected objective {objective:.6g}')
+                if scaled < self.tolerance:
+                    break
+        return self
+
+    def capacities(self):
+        """
+        Returns the scenario average of the capacity variables.
+        """
+        return {
+            name: float(xbar)
+            for name, xbar in zip(self.names[:self.n_capacity], self.xbar[:self.n_capacity])
+        }
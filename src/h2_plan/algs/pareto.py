@@ -4,13 +4,17 @@ This module contains the ParetoFront class, which is used to build and plot Pare
 
 import os
 import csv
+import json
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import matplotlib.pyplot as plot
 from pathlib import Path
 from os import chdir, getcwd
 from dill import dump, load
 from pyomo.environ import value as pyomo_value
 from h2_plan.opt.core import H2Planning
+from h2_plan.opt.store import SOLUTION_DIR, SolutionStore, scenario_lcoh
+from h2_plan.opt.solvers import available_threads
 from copy import deepcopy
 from numpy import floor
 
@@ -39,6 +43,204 @@ def save_csv(array, title, folder='PreOptimisationDataStore'):
             writer.writerow([key, value])
 
 
+def manifest_value(value):
+    """
+    Returns a value as it reads back from the manifest, e.g. NumPy integers
+    as strings and tuples as lists, so that recorded and swept values compare equal.
+    """
+    return json.loads(json.dumps(value, default=str))
+
+
+def nearest_solution(manifest_file, label, count):
+    """
+    Returns the key of the solved point of a front whose value is closest to
+    that of point count, or None if no point is solved yet (or the values are
+    not numbers).
+
+    Args:
+        manifest_file (str): Manifest of the front, see FrontWriter.
+        label (str): Label of the Pareto front.
+        count (int): Index of the point to start.
+    """
+    try:
+        with open(manifest_file, 'r') as f:
+            manifest = json.load(f)
+        target = float(manifest['values_list'][count])
+        solved = [
+            (abs(float(point['value']) - target), int(other))
+            for other, point in manifest['points'].items()
+            if point['status'] == 'done' and int(other) != count
+            and (SOLUTION_DIR / f'{label}_{other}' / 'meta.json').exists()
+        ]
+    except (OSError, ValueError, TypeError, KeyError, IndexError):
+        return None
+    return f'{label}_{min(solved)[1]}' if solved else None
+
+
+def solve_point(label, count, filename, filepath, solver, threads, solve_kwargs, mip_start=False):
+    """
+    Build, solve and post-process a single sweep point. This runs inside the
+    worker processes of Pareto.sweep.
+
+    Args:
+        label (str): Label of the Pareto front.
+        count (int): Index of the sweep point.
+        filename (str): Weather data file used to build the model.
+        filepath (str): Directory of the weather data file.
+        solver (str): The solver to use.
+        threads (int): Number of solver threads available to this point.
+        solve_kwargs (dict): Further keyword arguments for H2Planning.class_solve.
+        mip_start (bool): Whether to start from the closest point solved so far
+            (see nearest_solution).
+
+    Returns:
+        tuple: LCOH per scenario, and the MIP start and seconds until the first
+        incumbent of the solve.
+    """
+    cache_dir = Path(__file__).resolve().parent.parent.parent / 'cache'
+    key = f'{label}_{count}'
+    with open(cache_dir / f'pre/{key}.pickle', 'rb') as f:
+        parameters = load(f)
+    H2Planning(parameters, key, filename, filepath)
+    start = nearest_solution(cache_dir / f'pareto/{label}.manifest.json', label, count) if mip_start else None
+    model = H2Planning.class_solve(
+        key=key, solver=solver, threads=threads, reinitialise=True, start=start, **solve_kwargs
+    )
+    info = {'start': start, 'first_incumbent': model.first_incumbent}
+    return scenario_lcoh(SolutionStore.load(key)), info
+
+
+class FrontWriter:
+    """
+    Streams the rows of a Pareto front to pareto/{label}.csv as the sweep
+    points complete, and records every point in the manifest
+    pareto/{label}.manifest.json, so that an interrupted front resumes from the
+    points that are missing or failed.
+
+    Attributes:
+    .. csv_file: Path of the front.
+    .. manifest_file: Path of the manifest.
+    .. parameter_name: Name of the varied parameter.
+    .. values_list: Values of the varied parameter.
+    .. points: Dictionary of point index to its value, status ('done' or
+       'failed') and CSV row.
+    """
+
+    def __init__(self, directory, label, parameter_name, values_list):
+        self.csv_file = Path(directory) / f'{label}.csv'
+        self.manifest_file = Path(directory) / f'{label}.manifest.json'
+        self.parameter_name = parameter_name
+        self.values_list = list(values_list)
+        self.points = {}
+        if self.manifest_file.exists():
+            with open(self.manifest_file, 'r') as f:
+                manifest = json.load(f)
+            if manifest.get('parameter_name') == parameter_name:
+                # Points whose value changed since they were recorded are stale
+                self.points = {
+                    int(count): point for count, point in manifest['points'].items()
+                    if int(count) < len(self.values_list)
+                    and point['value'] == manifest_value(self.values_list[int(count)])
+                }
+        # Start from the rows of the recorded points only
+        self.rewrite()
+
+    def pending(self, retry_failed=True):
+        """
+        Returns the (index, value) of the points still to process.
+
+        Args:
+            retry_failed (bool): Whether failed points are processed again.
+        """
+        return [
+            (count, value) for count, value in enumerate(self.values_list)
+            if count not in self.points
+            or (retry_failed and self.points[count]['status'] != 'done')
+        ]
+
+    def record(self, count, values, error=None, **info):
+        """
+        Appends the row of a completed point to the front and marks the point
+        in the manifest.
+
+        Args:
+            count (int): Index of the point.
+            values (list): LCOH per scenario, ignored if the point failed.
+            error (Exception): The error raised by the point, if any.
+            **info: Further entries of the point in the manifest, e.g. its MIP
+                start and seconds until the first incumbent.
+        """
+        value = self.values_list[count]
+        if error is not None:
+            print(f'Failed Solve {self.parameter_name} {value}: {error}')
+            values = ['Failed Solve']
+        row = [str((self.parameter_name, value))] + list(map(str, values))
+        with open(self.csv_file, mode='a', newline='') as file:
+            csv.writer(file).writerow(row)
+            file.flush()
+            os.fsync(file.fileno())
+        self.points[count] = {
+            'value': value,
+            'status': 'failed' if error is not None else 'done',
+            'error': None if error is None else f'{type(error).__name__}: {error}',
+            'row': row,
+            **info,
+        }
+        self.save()
+
+    def save(self):
+        temporary = self.manifest_file.with_suffix('.tmp')
+        with open(temporary, 'w') as f:
+            json.dump({
+                'parameter_name': self.parameter_name,
+                'values_list': self.values_list,
+                'points': {str(count): point for count, point in sorted(self.points.items())},
+            }, f, indent=2, default=str)
+        os.replace(temporary, self.manifest_file)
+
+    def rewrite(self):
+        """
+        Rewrites the front from the manifest in sweep order, dropping the rows
+        of retried points and of points recorded twice after an interruption.
+        """
+        temporary = self.csv_file.with_suffix('.tmp')
+        with open(temporary, mode='w', newline='') as file:
+            writer = csv.writer(file)
+            for count in sorted(self.points):
+                writer.writerow(self.points[count]['row'])
+        os.replace(temporary, self.csv_file)
+
+    def finalise(self):
+        self.rewrite()
+        failed = sum(point['status'] != 'done' for point in self.points.values())
+        print(f'[INFO] Pareto front {self.csv_file.stem}: {len(self.points) - failed} of '
+              f'{len(self.values_list)} points done, {failed} failed')
+        self.report_starts()
+
+    def report_starts(self):
+        """
+        Prints the mean seconds until the first incumbent of the points solved
+        with and without a MIP start.
+        """
+        times = {True: [], False: []}
+        for point in self.points.values():
+            if point.get('first_incumbent') is not None:
+                times[point.get('start') is not None].append(point['first_incumbent'])
+        if times[True]:
+            cold = f'{np.mean(times[False]):.2f}' if times[False] else 'n/a'
+            print(f'[INFO] First incumbent after {np.mean(times[True]):.2f} seconds with a MIP start '
+                  f'({len(times[True])} points), {cold} without ({len(times[False])} points)')
+
+    def clear(self):
+        """
+        Forgets every point, e.g. when the models of the front are rebuilt.
+        """
+        if self.manifest_file.exists():
+            self.manifest_file.unlink()
+        self.points = {}
+        self.rewrite()
+
+
 class Pareto:
     """
     Class to build and plot Pareto fronts for optimization problems.
@@ -90,13 +292,20 @@ class Pareto:
         with open(cache_dir / f'pareto/{self.label}.pickle', 'wb') as f:
             dump(self, f)
 
+        # Points processed for the previous models of this label are stale
+        FrontWriter(cache_dir / 'pareto', self.label, self.parameter_name, self.values_list).clear()
+
     @classmethod
-    def build_fronts(cls, key):
+    def build_fronts(cls, key, retry_failed=True):
         """
-        Build Pareto fronts by solving models for each parameter value.
+        Build Pareto fronts by solving models for each parameter value. Each
+        row is appended to the CSV as soon as its point is processed and the
+        point is recorded in the manifest (see FrontWriter), so a re-run only
+        processes the points that are missing or failed.
 
         Args:
             key (str): Key to identify the Pareto front.
+            retry_failed (bool): Whether points that failed before are processed again.
         """
 
         # Get the current working directory
@@ -110,45 +319,70 @@ class Pareto:
             with open(cache_dir / f'pareto/{cls.label}.pickle', 'rb') as f:
                 cls = load(f)
 
-        obj_dict = {}
-        for count, value in enumerate(cls.values_list):
+        writer = FrontWriter(cache_dir / 'pareto', cls.label, cls.parameter_name, cls.values_list)
+        pending = writer.pending(retry_failed)
+        print(f'[INFO] Processing {len(pending)} of {len(cls.values_list)} Pareto points')
+        for count, value in pending:
             try:
                 key = f'{cls.label}_{count}'
-
-                solve = H2Planning.get_solve(key=key, reinitialise=True)
-
-                cumulative_demand = {(0, 0, 1): 0}
-                for s, t, d, s_0, t_0, d_0, s_v, t_v, d_v, s_v0, t_v0, d_v0 in solve.instance.vector_continuity_set:
-                    cumulative_demand[(s, t, d)] = cumulative_demand[(s_0, t_0, d_0)] + (
-                        8760 / solve.instance.end_time_index
-                        * solve.instance.amortisation_plant
-                        * sum(
-                            solve.instance.energy_vector_production_flux[(s_v, t_v, d_v), q].value * d / 120
-                            for q in solve.instance.vectors
-                        )
-                    )
-
-                production_vector = []
-                for s in solve.instance.scenario:
-                    if cumulative_demand[s, solve.instance.end_time_index.value, 1] != 0:
-                        production_vector.append(
-                            1000 * (solve.instance.CAPEX.value + solve.instance.OPEX[s].value)
-                            / cumulative_demand[s, solve.instance.end_time_index.value, 1]
-                        )
-                    else:
-                        production_vector.append('No Production')
-                    obj_dict[(cls.parameter_name, value)] = production_vector
+                writer.record(count, scenario_lcoh(SolutionStore.load(key)))
             except Exception as e:
-                print(f'Failed Solve {cls.parameter_name} {value}: {e}')
-                obj_dict[(cls.parameter_name, value)] = ['Failed Solve']
-                continue
-        with open(cache_dir / f'pareto/{cls.label}.csv', mode='w', newline='') as file:
-            writer = csv.writer(file)
-            for key, values in obj_dict.items():
-                if isinstance(values, list):
-                    writer.writerow([key] + list(map(str, values)))
-                else:
-                    writer.writerow([key, str(values)])
+                writer.record(count, None, error=e)
+        writer.finalise()
+
+    @classmethod
+    def sweep(cls, key, workers=None, total_threads=None, solver='gurobi',
+              filename='CoastalChile_15-20_Wind.csv', filepath=None, retry_failed=True,
+              mip_start=False, **solve_kwargs):
+        """
+        Build, solve and post-process every sweep point concurrently in a
+        process pool. Each point is solved with total_threads // workers solver
+        threads, so the pool never oversubscribes the machine, and each row is
+        written to the CSV as soon as its point finishes. Points already done
+        in the manifest of the front are not solved again.
+
+        Args:
+            key (str): Key to identify the Pareto front.
+            workers (int): Number of worker processes (default is one per point,
+                capped at the thread budget).
+            total_threads (int): Global solver-thread budget (default is the
+                available CPUs, see available_threads).
+            solver (str): The solver to use.
+            filename (str): Weather data file used to build the models.
+            filepath (str): Directory of the weather data file.
+            retry_failed (bool): Whether points that failed before are solved again.
+            mip_start (bool): Whether each point starts from the stored solution
+                of the closest point solved before it (see nearest_solution); the
+                seconds until the first incumbent are recorded in the manifest.
+            **solve_kwargs: Further keyword arguments for H2Planning.class_solve.
+        """
+        current_dir = Path(__file__).resolve().parent
+        cache_dir = current_dir.parent.parent / 'cache'
+
+        with open(cache_dir / f'pareto/{key}.pickle', 'rb') as f:
+            front = load(f)
+
+        total_threads = total_threads or available_threads()
+        workers = max(1, min(workers or len(front.values_list), total_threads))
+        threads = max(1, total_threads // workers)
+        print(f'[INFO] Sweeping {len(front.values_list)} points on {workers} workers '
+              f'with {threads} solver threads each')
+
+        writer = FrontWriter(cache_dir / 'pareto', front.label, front.parameter_name, front.values_list)
+        pending = writer.pending(retry_failed)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(solve_point, front.label, count, filename, filepath,
+                            solver, threads, solve_kwargs, mip_start): count
+                for count, _ in pending
+            }
+            for future in as_completed(futures):
+                try:
+                    values, info = future.result()
+                    writer.record(futures[future], values, **info)
+                except Exception as e:
+                    writer.record(futures[future], None, error=e)
+        writer.finalise()
 
     @classmethod
     def plot_pareto_front(cls, filename, axis_labels=('Varied Parameter', 'Objective Value'),
@@ -204,6 +438,11 @@ class Pareto:
                 tuple_elements = tuple_str.split(',')
             x_values.append(float(tuple_elements[1].strip()) / normaliser[0])
 
+        # Rows may be written in completion order by Pareto.sweep
+        order = np.argsort(x_values)
+        x_values = [x_values[count] for count in order]
+        arrays = [arrays[count] for count in order]
+
         if times_time:
             arrays = [np.array(arrays[count]) * x_values[count] / normaliser[1] for count in range(len(arrays))]
         else:
@@ -0,0 +1,191 @@
+"""
+This module holds the pieces shared by the scenario decompositions: building
+the subproblem of one scenario path, the variables shared between scenarios,
+the scenario objective and the solvers of the subproblems.
+
+A subproblem is built straight from the parameters, restricted to the nodes
+on its scenario path (see generate_parameters), so the extensive form of the
+whole tree is never built. Variables keep the names they have in the full
+model, which identifies the variables shared between subproblems.
+"""
+
+from pyomo.core.expr.visitor import identify_variables
+from pyomo.environ import AbstractModel, TransformationFactory, Var, quicksum
+from numpy import array, int64
+from h2_plan.opt.funcs.ineq import clear_cumulative_cache, generate_inequalities
+from h2_plan.opt.solvers import get_backend
+from h2_plan.opt.vars.param import generate_parameters
+from h2_plan.opt.vars.vars import generate_variables
+
+NODE_SETS = ('full_set', 'vector_param_set', 'shipping_param_set')
+OBJECTIVE_COMPONENTS = ('Obj', 'NPV', 'obj_constraint', 'obj_constraint_2', 'obj_bound')
+
+
+def scenario_tree(parameters, filename, filepath=None):
+    """
+    Returns the NodeIndex of the whole tree, sampling the grid (or reading it
+    from the grid cache) without building the model.
+    """
+    model = AbstractModel()
+    model.random_seed = int(parameters['random_seed'])
+    model.node_id_mode = True
+    model.weather_cache = True
+    generate_parameters(model, parameters, filename, filepath)
+    return model.node_index
+
+
+def build_scenario(parameters, filename, filepath, scenario, relax=False):
+    """
+    Builds the instance of a single scenario path, with the objective
+    components of the full model deactivated.
+
+    Args:
+        parameters (dict): The formulation parameters of the model.
+        filename (str): Weather data file used to build the model.
+        filepath (str): Directory of the weather data file.
+        scenario (int): The scenario whose path is built.
+        relax (bool): Whether to relax the integer variables.
+    """
+    model = AbstractModel()
+    model.random_seed = int(parameters['random_seed'])
+    model.scenario_path = scenario
+    model.weather_cache = True
+    generate_parameters(model, parameters, filename, filepath)
+    generate_variables(model)
+    generate_inequalities(model)
+    instance = model.create_instance()
+    clear_cumulative_cache(instance)
+    for name in OBJECTIVE_COMPONENTS:
+        if instance.component(name) is not None:
+            instance.component(name).deactivate()
+    if relax:
+        TransformationFactory('core.relax_integer_vars').apply_to(instance)
+    return instance
+
+
+def node_owner(nodes, name, node):
+    """
+    Returns the id of the node of the whole tree owning an entry of one of
+    NODE_SETS. A vector or shipping block is owned by the earliest node using
+    it (see NodeIndex.block_owners), as its tuple need not be a node of full_set.
+
+    Args:
+        nodes (NodeIndex): Node index of the whole tree.
+        name (str): Name of the set, e.g. 'vector_param_set'.
+        node (tuple): The (s, t, d) entry of the set.
+    """
+    if name == 'vector_param_set':
+        return nodes.vector_owner[nodes.vector_position[node]]
+    if name == 'shipping_param_set':
+        return nodes.shipping_owner[nodes.shipping_position[node]]
+    return nodes.position[node]
+
+
+def coupled_variables(instance, nodes, coupling='tree'):
+    """
+    Returns the variables of a scenario instance shared with other scenarios
+    and the node of the whole tree each belongs to.
+
+    Args:
+        instance: The instance of a scenario path (see build_scenario).
+        nodes (NodeIndex): Node index of the whole tree (see scenario_tree).
+        coupling (str): 'capacity' couples only the variables priced in CAPEX
+            (a two-stage approximation); 'tree' also couples every variable at
+            a node, or of a vector or shipping block, shared by more than one
+            scenario.
+
+    Returns:
+        tuple: List of variable data, and array of the owning node ids (the
+        root for capacity variables).
+    """
+    if coupling not in ('capacity', 'tree'):
+        raise ValueError(f"Unknown coupling '{coupling}', expected 'capacity' or 'tree'")
+    data = [v for v in identify_variables(instance.total_capital_expenditure.body)
+            if v is not instance.CAPEX]
+    owners = [nodes.root] * len(data)
+    if coupling == 'tree':
+        for var in instance.component_objects(Var, descend_into=False):
+            if not var.is_indexed():
+                continue
+            first = next(var.index_set().subsets()).local_name
+            if first not in NODE_SETS:
+                continue
+            for index, v in var.items():
+                node = node_owner(nodes, first, index[0:3])
+                if nodes.leaf_weight[node] > 1:
+                    data.append(v)
+                    owners.append(node)
+    return data, array(owners, dtype=int64)
+
+
+def scenario_production(instance, nodes, path):
+    """
+    Returns the discounted production along a scenario path, in the units of Y.
+    """
+    return quicksum(
+        instance.energy_vector_production_flux[nodes.vector_nodes[nodes.vector[n]], q]
+        * int(nodes.duration[n])
+        for n in path for q in instance.vectors
+    ) * (8760 / instance.end_time_index) * instance.amortisation_plant / 120
+
+
+def scenario_objective(instance, nodes, path, s):
+    """
+    Returns the NPV objective of a single scenario: CAPEX plus the scenario
+    OPEX, less the revenue of the hydrogen produced along its path. The
+    expectation of these objectives is the objective of the full model.
+    """
+    production = scenario_production(instance, nodes, path)
+    return instance.CAPEX + instance.OPEX[s] - production * instance.hydrogen_price / 1000
+
+
+def scenario_paths(nodes):
+    """
+    Returns the node ids on the path of each scenario.
+    """
+    paths = nodes.ancestors(nodes.leaves).tocsr()
+    return [paths[s].indices for s in range(paths.shape[0])]
+
+
+def solver_options(solver, threads, mip_percentage):
+    """
+    Returns the options used for the scenario subproblems.
+    """
+    backend = get_backend(solver)
+    return backend.options(
+        verbose=False, mip_gap=mip_percentage / 100,
+        threads=threads if backend.threads else None
+    )
+
+
+def scenario_solver(solver, options, instance):
+    """
+    Returns a solver for the subproblem of a scenario. Solvers with a
+    persistent interface hold the instance, so that later solves only push the
+    parameters changed between iterations (see refresh_subproblem); other
+    solvers are given the whole instance on every solve.
+
+    Returns:
+        tuple: The solver, and whether it is persistent.
+    """
+    backend = get_backend(solver)
+    persistent = backend.persistent is not None
+    subproblem_solver = backend.create(persistent)
+    for option, setting in options.items():
+        subproblem_solver.options[option] = setting
+    if persistent and backend.persistent != 'native':
+        subproblem_solver.set_instance(instance)
+    return subproblem_solver, persistent
+
+
+def refresh_subproblem(solver, persistent, backend, constraints=(), objective=None):
+    """
+    Pushes the constraints and objective whose mutable parameters changed to a
+    persistent subproblem solver.
+    """
+    if not persistent:
+        return
+    for constraint in constraints:
+        backend.refresh(solver, constraint)
+    if objective is not None:
+        backend.refresh_objective(solver, objective)
@@ -5,7 +5,7 @@ import csv
 from os import chdir, getcwd, makedirs
 from copy import deepcopy
 from pathlib import Path
-from h2_plan.opt import H2Planning
+from h2_plan.opt.store import SolutionStore, scenario_lcoh
 
 
 def get_weather_sensitivity(label, n_solve):
@@ -33,41 +33,8 @@ def get_weather_sensitivity(label, n_solve):
         try:
             key = f'{label}{count}'
 
-            # Retrieve the solve instance
-            solve = H2Planning.get_solve(key=key, reinitialise=True)
-
-            # Initialize cumulative demand dictionary
-            cumulative_demand = {(0, 0): 0}
-
-            # Calculate cumulative demand
-            for s, t, s_0, t_0, s_v, t_v, s_v0, t_v0 in solve.instance.vector_continuity_set:
-                cumulative_demand[(s, t)] = (
-                    cumulative_demand[(s_0, t_0)]
-                    + (
-                        8760
-                        / solve.instance.end_time_index
-                        * solve.instance.amortisation_plant
-                        * sum(
-                            solve.instance.energy_vector_production_flux[(s_v, t_v), q].value / 120
-                            for q in solve.instance.vectors
-                        )
-                    )
-                )
-
-            # Calculate production vector
-            production_vector = []
-            for s in solve.instance.scenario:
-                if cumulative_demand[s, solve.instance.end_time_index.value] != 0:
-                    production_vector.append(
-                        1000
-                        * (solve.instance.CAPEX.value + solve.instance.OPEX[s].value)
-                        / cumulative_demand[s, solve.instance.end_time_index.value]
-                    )
-                else:
-                    production_vector.append('No Production')
-
-                # Store results in the dictionary
-                obj_dict[count] = production_vector
+            # Calculate the LCOH of each scenario from the stored solution
+            obj_dict[count] = scenario_lcoh(SolutionStore.load(key))
 
         except Exception as e:
             print(f'Failed Solve {count}: {e}')
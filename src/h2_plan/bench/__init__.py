@@ -0,0 +1,3 @@
+from .suite import StageRecorder, cases, compare, run_case, run_fractional, run_suite
+
+__all__ = ['StageRecorder', 'cases', 'compare', 'run_case', 'run_fractional', 'run_suite']
@@ -0,0 +1,48 @@
+"""
+Runs the benchmark suite from the command line, e.g.
+
+    python -m h2_plan.bench --n-stages 1 2 --n-stochastics 2 3 --solver appsi_highs
+    python -m h2_plan.bench --compare baseline.json current.json
+    python -m h2_plan.bench --fractional --tolerance 0.01
+"""
+
+import json
+import argparse
+from .suite import cases, compare, run_suite
+
+parser = argparse.ArgumentParser(prog='python -m h2_plan.bench')
+parser.add_argument('--n-stages', type=int, nargs='+', default=[1, 2])
+parser.add_argument('--n-stochastics', type=int, nargs='+', default=[2, 3])
+parser.add_argument('--stage-duration', type=int, nargs='+', default=[24])
+parser.add_argument('--vectors', nargs='+', default=['LH2'], choices=['LH2', 'NH3'])
+parser.add_argument('--renewables', nargs='+', default=['Wind'], choices=['Wind', 'Solar', 'Both'])
+parser.add_argument('--filename', default='CoastalChile_15-20_Wind.csv')
+parser.add_argument('--filepath', default=None)
+parser.add_argument('--solver', default='appsi_highs', choices=['appsi_highs', 'cbc'])
+parser.add_argument('--time-limit', type=float, default=600)
+parser.add_argument('--mip-percentage', type=float, default=5)
+parser.add_argument('--fractional', action='store_true',
+                    help='Time the minimum LCOH through Dinkelbach against the Charnes-Cooper solve')
+parser.add_argument('--tolerance', type=float, default=0.05)
+parser.add_argument('--max-price', type=float, default=10)
+parser.add_argument('--output', default=None)
+parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'))
+parser.add_argument('--metric', default='wall_time', choices=['wall_time', 'peak_rss_mb'])
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.compare:
+        print(json.dumps(compare(*args.compare, metric=args.metric), indent=2))
+    elif args.fractional:
+        run_suite(
+            cases(args.n_stages, args.n_stochastics, args.stage_duration, args.vectors, args.renewables),
+            output=args.output, fractional=True, filename=args.filename, filepath=args.filepath,
+            solver=args.solver, time_limit=args.time_limit, tolerance=args.tolerance,
+            max_price=args.max_price
+        )
+    else:
+        run_suite(
+            cases(args.n_stages, args.n_stochastics, args.stage_duration, args.vectors, args.renewables),
+            output=args.output, filename=args.filename, filepath=args.filepath,
+            solver=args.solver, time_limit=args.time_limit, mip_percentage=args.mip_percentage
+        )
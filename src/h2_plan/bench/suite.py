@@ -0,0 +1,347 @@
+"""
+This module implements the benchmark suite. Every case runs in a fresh process
+and records the wall time and peak resident memory of each stage: parameter
+generation, constraint generation, create_instance, LP writing, solving and
+result extraction. The fractional suite instead times the minimum LCOH through
+the Dinkelbach iterations against the single Charnes-Cooper solve.
+"""
+
+import json
+import time
+import shutil
+import platform
+import threading
+import subprocess
+from itertools import product
+from tempfile import TemporaryDirectory
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from uuid import uuid4
+from pyomo.environ import AbstractModel, Objective, SolverFactory, minimize, value
+from h2_plan.algs.dinklebach import Dinkelbach
+from h2_plan.data.default import DefaultParams
+from h2_plan.opt import H2Planning
+from h2_plan.opt.cache import package_version
+from h2_plan.opt.profile import rss
+from h2_plan.opt.funcs.ineq import generate_inequalities, objective_function, clear_cumulative_cache
+from h2_plan.opt.store import SOLUTION_DIR, SolutionStore, scenario_lcoh
+from h2_plan.opt.vars.param import generate_parameters
+from h2_plan.opt.vars.vars import generate_variables
+
+STAGES = (
+    'generate_parameters', 'generate_inequalities', 'create_instance',
+    'write_lp', 'solve', 'extract'
+)
+FRACTIONAL_STAGES = ('dinkelbach', 'charnes_cooper')
+RESULTS_DIR = Path(__file__).resolve().parent.parent / 'tmp' / 'bench'
+
+
+class StageRecorder:
+    """
+    Records the wall time and peak RSS of named stages. The peak is found by
+    sampling the RSS from a background thread while a stage runs.
+
+    Attributes:
+    .. stages: Dictionary of stage name to its measurements.
+    .. interval: Sampling interval of the RSS in seconds.
+    """
+
+    def __init__(self, interval=0.01):
+        self.stages = {}
+        self.interval = interval
+
+    @contextmanager
+    def stage(self, name):
+        peak = [rss()]
+        done = threading.Event()
+
+        def sample():
+            while not done.wait(self.interval):
+                peak[0] = max(peak[0], rss())
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - start_time
+            done.set()
+            sampler.join()
+            end = rss()
+            self.stages[name] = {
+                'wall_time': wall_time,
+                'peak_rss_mb': max(peak[0], end) / 2**20,
+                'rss_mb': end / 2**20,
+            }
+
+
+def cases(n_stages=(1, 2), n_stochastics=(2, 3), stage_duration=(24,),
+          vectors=('LH2',), renewables=('Wind',)):
+    """
+    Returns the benchmark cases as the product of the given settings.
+
+    Args:
+        n_stages (tuple): Numbers of stages.
+        n_stochastics (tuple): Numbers of branches per stage.
+        stage_duration (tuple): Stage durations in hours.
+        vectors (tuple): Energy vectors, 'LH2' or 'NH3'.
+        renewables (tuple): 'Wind', 'Solar' or 'Both'.
+    """
+    keys = ('n_stages', 'n_stochastics', 'stage_duration', 'vector', 'renewables')
+    return [
+        dict(zip(keys, values))
+        for values in product(n_stages, n_stochastics, stage_duration, vectors, renewables)
+    ]
+
+
+def case_parameters(case, random_seed=42):
+    """
+    Returns the formulation parameters of a benchmark case, in the layout of
+    the scripts in tests/models.
+    """
+    parameters = DefaultParams().formulation_parameters
+    parameters.update({
+        'booleans': {
+            'vector_choice': {
+                'LH2': case['vector'] == 'LH2',
+                'NH3': case['vector'] == 'NH3'
+            },
+            'electrolysers': {
+                'alkaline': True,
+                'PEM': True,
+                'SOFC': True
+            },
+            'grid_connection': False,
+            'wind': case['renewables'] in ['Wind', 'Both'],
+            'solar': case['renewables'] in ['Solar', 'Both'],
+            'net_present_value': True,
+            'grid_wheel': False,
+            'geographical_storage': False,
+        },
+        'wheel_period': 24,
+        'stage_duration': case['stage_duration'],
+        'n_stages': case['n_stages'],
+        'n_stochastics': case['n_stochastics'],
+        'hydrogen_price': 5,  # $/kg
+        'random_seed': random_seed,
+        'relaxed_ramping': True,
+        'vector_operating_duration': 1,
+        'shipping_decision': 168
+    })
+    return parameters
+
+
+def run_case(case, filename='CoastalChile_15-20_Wind.csv', filepath=None,
+             solver='appsi_highs', time_limit=600, mip_percentage=5):
+    """
+    Runs every stage of one case in the current process.
+
+    Args:
+        case (dict): A case returned by cases.
+        filename (str): Weather data file used to build the model.
+        filepath (str): Directory of the weather data file.
+        solver (str): An open-source solver, 'appsi_highs' or 'cbc'.
+        time_limit (float): Time limit of the solve in seconds.
+        mip_percentage (float): MIP gap percentage of the solve.
+
+    Returns:
+        dict: The case, the measurements of each completed stage, the model size
+        and solve outcome, and the error that stopped the case if any.
+    """
+    recorder = StageRecorder()
+    record = {'case': case, 'stages': recorder.stages, 'error': None}
+    parameters = case_parameters(case)
+    try:
+        with TemporaryDirectory() as scratch:
+            model = AbstractModel()
+            model.random_seed = int(parameters['random_seed'])
+            # Resample the grid every run, so the stage timings do not depend on the cache
+            model.weather_cache = False
+            with recorder.stage('generate_parameters'):
+                generate_parameters(model, parameters, filename, filepath)
+            with recorder.stage('generate_inequalities'):
+                generate_variables(model)
+                generate_inequalities(model)
+                model.Obj = Objective(rule=objective_function, sense=minimize)
+            with recorder.stage('create_instance'):
+                instance = model.create_instance()
+                clear_cumulative_cache(instance)
+            record['rows'] = instance.nconstraints()
+            record['columns'] = instance.nvariables()
+
+            with recorder.stage('write_lp'):
+                instance.write(str(Path(scratch) / 'model.lp'), io_options={'symbolic_solver_labels': False})
+            record['lp_size_mb'] = (Path(scratch) / 'model.lp').stat().st_size / 2**20
+
+            with recorder.stage('solve'):
+                results = solve(instance, solver, time_limit, mip_percentage)
+            record['termination'] = str(results.solver.termination_condition)
+            record['objective'] = value(instance.Obj)
+
+            with recorder.stage('extract'):
+                SolutionStore.write(instance, 'bench', scratch)
+                record['lcoh'] = [
+                    float(x) if not isinstance(x, str) else x
+                    for x in scenario_lcoh(SolutionStore.load('bench', scratch))
+                ]
+    except Exception as e:
+        record['error'] = f'{type(e).__name__}: {e}'
+    return record
+
+
+def run_fractional(case, tolerance=0.05, max_price=10, filename='CoastalChile_15-20_Wind.csv',
+                   filepath=None, solver='appsi_highs', time_limit=600):
+    """
+    Minimises the LCOH of one case twice in the current process, timing the
+    build and solves of each: through the Dinkelbach iterations on the Pyomo
+    model (Dinkelbach.fractional), and through the single Charnes-Cooper solve
+    of the matrix model (MatrixModel.fractional). Both run at the same
+    tolerance, the MIP gap of every solve and the convergence tolerance of
+    the iterations. Both builds use the NPV objective of case_parameters, which
+    the matrix model requires; its hydrogen_price only seeds the Dinkelbach
+    iterations, as the Charnes-Cooper solve drops the NPV row.
+
+    Args:
+        case (dict): A case returned by cases.
+        tolerance (float): Relative tolerance on the LCOH.
+        max_price (float): Maximum hydrogen price of the Dinkelbach iterations.
+        filename (str): Weather data file used to build the model.
+        filepath (str): Directory of the weather data file.
+        solver (str): Solver of the Dinkelbach iterations; the matrix model is
+            solved with HiGHS through scipy.
+        time_limit (float): Wall-clock budget of each method in seconds.
+
+    Returns:
+        dict: The case, the measurements of the 'dinkelbach' and 'charnes_cooper'
+        stages, the LCOH of each, the number of Dinkelbach iterations and the
+        error that stopped the case if any.
+    """
+    recorder = StageRecorder()
+    record = {'case': case, 'stages': recorder.stages, 'error': None}
+    parameters = case_parameters(case)
+    key = f'bench_fractional_{uuid4().hex[:8]}'
+    log_file = Path(__file__).resolve().parent.parent.parent / 'cache' / 'dinklebach' / f'{key}.fractional.csv'
+    try:
+        with recorder.stage('dinkelbach'):
+            record['dinkelbach_lcoh'] = Dinkelbach.fractional(
+                key, parameters, initial_guess=parameters['hydrogen_price'], tolerance=tolerance,
+                max_price=max_price, mip_percentage=100 * tolerance, time_lim=time_limit,
+                filename=filename, filepath=filepath, solver=solver
+            )
+        with open(log_file, 'r') as f:
+            record['dinkelbach_iterations'] = sum(1 for _ in f) - 1
+
+        with recorder.stage('charnes_cooper'):
+            matrix = H2Planning(parameters, key, filename, filepath, mode='matrix').matrix
+            matrix.fractional(mip_percentage=100 * tolerance, time_limit=time_limit, verbose=False)
+        record['charnes_cooper_lcoh'] = matrix.objective
+        record['charnes_cooper_status'] = str(matrix.status)
+    except Exception as e:
+        record['error'] = f'{type(e).__name__}: {e}'
+    finally:
+        log_file.unlink(missing_ok=True)
+        shutil.rmtree(SOLUTION_DIR / key, ignore_errors=True)
+    return record
+
+
+def solve(instance, solver, time_limit, mip_percentage):
+    """
+    Solves an instance with HiGHS (through appsi) or CBC.
+    """
+    if solver == 'appsi_highs':
+        opt = SolverFactory('appsi_highs')
+        opt.config.time_limit = time_limit
+        opt.config.mip_gap = mip_percentage / 100
+        return opt.solve(instance)
+    if solver == 'cbc':
+        opt = SolverFactory('cbc')
+        opt.options['seconds'] = time_limit
+        opt.options['ratioGap'] = mip_percentage / 100
+        return opt.solve(instance)
+    raise ValueError(f"Unsupported benchmark solver '{solver}', expected 'appsi_highs' or 'cbc'")
+
+
+def commit():
+    """
+    Returns the git commit of the working tree, or None outside a repository.
+    """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=Path(__file__).resolve().parent,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(suite=None, output=None, fractional=False, **case_kwargs):
+    """
+    Runs each case in its own process, so that the peak RSS of a case is not
+    inflated by the ones before it, and writes the results to JSON.
+
+    Args:
+        suite (list): Cases to run (default is cases()).
+        output (str): JSON file to write (default is tmp/bench/{commit}.json).
+        fractional (bool): Whether to run the cases with run_fractional
+            instead of run_case.
+        **case_kwargs: Further keyword arguments for run_case (or run_fractional).
+
+    Returns:
+        dict: The results written to the JSON file.
+    """
+    suite = cases() if suite is None else suite
+    revision = commit()
+    results = {
+        'commit': revision,
+        'version': package_version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'settings': {'fractional': fractional, **case_kwargs},
+        'cases': [],
+    }
+    for case in suite:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+            record = pool.submit(run_fractional if fractional else run_case, case, **case_kwargs).result()
+        results['cases'].append(record)
+        summary = ', '.join(
+            f"{name} {stage['wall_time']:.2f}s/{stage['peak_rss_mb']:.0f}MB"
+            for name, stage in record['stages'].items()
+        )
+        print(f'[INFO] {case}: {summary}' + (f" [{record['error']}]" if record['error'] else ''))
+
+    if output is None:
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        output = RESULTS_DIR / f"{revision or results['timestamp']}.json"
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'[INFO] Benchmark results written to {output}')
+    return results
+
+
+def compare(baseline, current, metric='wall_time'):
+    """
+    Returns the ratio current / baseline of a stage metric for every case and
+    stage present in both result files.
+
+    Args:
+        baseline (str): JSON file of the reference run.
+        current (str): JSON file of the run to compare.
+        metric (str): 'wall_time' or 'peak_rss_mb'.
+    """
+    with open(baseline, 'r') as f:
+        before = {json.dumps(r['case'], sort_keys=True): r for r in json.load(f)['cases']}
+    with open(current, 'r') as f:
+        after = {json.dumps(r['case'], sort_keys=True): r for r in json.load(f)['cases']}
+    ratios = {}
+    for case in before.keys() & after.keys():
+        ratios[case] = {
+            name: after[case]['stages'][name][metric] / before[case]['stages'][name][metric]
+            for name in STAGES + FRACTIONAL_STAGES
+            if name in before[case]['stages'] and name in after[case]['stages']
+            and before[case]['stages'][name][metric] > 0
+        }
+    return ratios
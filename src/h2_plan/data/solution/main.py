@@ -9,8 +9,15 @@ from collections import defaultdict
 from typing import Optional
 from pyomo.environ import value
 from pathlib import Path
+from numpy import savez_compressed
 import yaml
 
+# Variables exported by PlanningResults.time_series by default
+SERIES = (
+    'energy_electrolysers', 'gh2_storage', 'energy_vector_production_flux',
+    'vector_storage_origin', 'energy_curtailed'
+)
+
 
 class PlanningResults:
     """
@@ -67,6 +74,21 @@ class PlanningResults:
 
         return self._res
 
+    def time_series(self, names=SERIES, targ: Optional[str] = None):
+        """
+        Extracts variables as arrays of shape (scenario, hour[, vector]) (see
+        H2Planning.extract) and saves them to {targ}/{filename}.npz.
+
+        Args:
+            names (tuple): Names of the variables or node parameters to extract.
+            targ (str): Target directory (default is tmp/series).
+        """
+        series = {name: H2Planning.extract(self.model, name) for name in names}
+        targ = Path(__file__).parent.parent.parent / "tmp/series" if targ is None else Path(targ)
+        targ.mkdir(parents=True, exist_ok=True)
+        savez_compressed(targ / (self.model.filename + '.npz'), **series)
+        return series
+
     def capex(self):
         results = {}
         model = self.model.instance
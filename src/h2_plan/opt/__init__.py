@@ -1 +1,2 @@
 from .core import H2Planning
+from .matrix import MatrixModel
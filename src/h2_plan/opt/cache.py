@@ -0,0 +1,177 @@
+"""
+This module implements a content-addressed cache of built model instances.
+Builds are keyed by a stable hash of everything that determines the instance,
+so an identical configuration can skip model construction entirely.
+"""
+
+import os
+import json
+import hashlib
+from pathlib import Path
+from shutil import copyfile
+from importlib.util import find_spec
+from importlib.metadata import version, PackageNotFoundError
+
+SOLAR_FILENAME = 'CoastalChile_Solar.csv'
+
+
+def package_version():
+    """
+    Returns the installed version of h2_plan, or 'unknown' when running from source.
+    """
+    try:
+        return version('h2_plan')
+    except PackageNotFoundError:
+        return 'unknown'
+
+
+def data_folders():
+    """
+    Returns the folders searched for a weather file given without a filepath,
+    in the order StochasticGrid.add_dataset searches them: the data folder
+    shipped with PyStochOpt, then the weathermodel data folder of h2_plan.
+    """
+    folders = []
+    spec = find_spec('PyStochOpt')
+    if spec is not None and spec.origin is not None:
+        folders.append(Path(spec.origin).resolve().parent / 'data')
+    folders.append(Path(__file__).resolve().parent.parent / 'weathermodel' / 'data')
+    return folders
+
+
+def weather_file(filename, filepath=None):
+    """
+    Resolves the path of a weather data file as StochasticGrid.add_dataset
+    does: in filepath if given, otherwise relative to the working directory
+    and then in the data_folders.
+
+    Raises:
+        FileNotFoundError: If the file is found nowhere, since a build keyed
+        on the name alone would outlive changes to the data.
+    """
+    if filepath is not None:
+        candidates = [Path(filepath) / filename]
+    else:
+        candidates = [Path(filename)] + [folder / filename for folder in data_folders()]
+    for path in candidates:
+        if path.is_file():
+            return path.resolve()
+    raise FileNotFoundError(
+        f"Weather file '{filename}' not found in {', '.join(str(path.parent) for path in candidates)}"
+    )
+
+
+def file_digest(path):
+    """
+    Returns the sha256 digest of a file's contents.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_hash(parameters, filename, filepath=None, mode='pyomo'):
+    """
+    Returns a stable hash of a model configuration: the parameter dictionary,
+    the contents of the weather files, the random seed, the build mode and the
+    package version.
+
+    Args:
+        parameters (dict): The formulation parameters.
+        filename (str): Weather data file used to build the model.
+        filepath (str): Directory of the weather data file.
+        mode (str): Build mode of the model, see H2Planning.
+
+    Raises:
+        FileNotFoundError: If a weather file cannot be found (see weather_file).
+    """
+    weather = [file_digest(weather_file(filename, filepath))]
+    if parameters.get('booleans', {}).get('solar'):
+        weather.append(file_digest(weather_file(SOLAR_FILENAME)))
+    payload = json.dumps(
+        {
+            'parameters': parameters,
+            'weather': weather,
+            'random_seed': parameters.get('random_seed'),
+            'mode': mode,
+            'version': package_version(),
+        },
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def recourse_hash(parameters, filename, filepath=None):
+    """
+    Returns a stable hash of everything that determines the operation of the
+    plant for given capacities. The hydrogen price only enters the objective,
+    and capital costs only enter CAPEX unless the grid connection prices
+    energy at the LCAP, so configurations differing only in these share a hash.
+    """
+    recourse = {key: item for key, item in parameters.items() if key != 'hydrogen_price'}
+    if not parameters.get('booleans', {}).get('grid_connection'):
+        recourse.pop('capital_costs', None)
+    return build_hash(recourse, filename, filepath)
+
+
+class BuildCache:
+    """
+    Stores dilled instances under their build hash, evicting the least
+    recently used entries once the cache holds more than max_entries builds.
+
+    Attributes:
+    .. directory: Folder holding the cached builds.
+    .. max_entries: Maximum number of builds kept in the cache.
+    """
+
+    def __init__(self, directory=None, max_entries=16):
+        if directory is None:
+            directory = Path(__file__).resolve().parent.parent / 'tmp' / 'cache' / 'build'
+        self.directory = Path(directory)
+        self.max_entries = max_entries
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path(self, digest):
+        return self.directory / f'{digest}.pickle'
+
+    def fetch(self, digest, target):
+        """
+        Copies a cached build to target and marks it as recently used.
+
+        Returns:
+            bool: Whether the build was found in the cache.
+        """
+        path = self.path(digest)
+        try:
+            copyfile(path, target)
+        except FileNotFoundError:
+            # Missing, or evicted by the prune of another process
+            return False
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return True
+
+    def store(self, digest, source):
+        """
+        Adds the build at source to the cache and evicts the oldest entries.
+        """
+        temporary = self.directory / f'{digest}.{os.getpid()}.tmp'
+        copyfile(source, temporary)
+        os.replace(temporary, self.path(digest))
+        self.prune()
+
+    def prune(self):
+        entries = []
+        for path in self.directory.glob('*.pickle'):
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                # Removed by another process since the listing
+                continue
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            path.unlink(missing_ok=True)
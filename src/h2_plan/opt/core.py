@@ -7,22 +7,33 @@ from sys import exit
 from dill import dump, load
 from pathlib import Path
 from matplotlib import rcParams
-from pyomo.environ import (
-    AbstractModel, Objective, minimize, SolverFactory, TerminationCondition,
-    TransformationFactory, Var, value
-)
+from pyomo.environ import AbstractModel, Objective, minimize, TerminationCondition
 from .vars.param import generate_parameters
-from .funcs.ineq import generate_inequalities, objective_function
+from .funcs.ineq import (
+    generate_inequalities, objective_function, clear_cumulative_cache
+)
 from .vars.vars import generate_variables
+from .matrix import MatrixModel
+from .cache import BuildCache, build_hash
+from .store import SolutionStore
+from .render import render_figures
+from .solvers import Deadline, available_threads, get_backend
+from .profile import format_report, profile_instance, write_report
 from .utils import (
     wind_energy, vector_production, hydrogen_production,
     hydrogen_storage_tank_level, origin_storage_tank_levels, grid_energy,
-    curtailed_energy, objective_cdf, active_trains, LCOH_contributions
+    curtailed_energy, objective_cdf, active_trains, LCOH_contributions, hourly_array
 )
 
 
 class H2Planning:
     instance = None
+    solution = None
+    key = None
+    persistent_solver = None
+    backend = None
+    timed_out = False
+    first_incumbent = None
     """
     This class is used to create and solve an optimisation model using Pyomo.
     It includes methods for setting up the model, generating the objective function,
@@ -34,6 +45,7 @@ class H2Planning:
     .. parameters 
         instance: The Pyomo model instance.
         key: A string used to identify the model.
+        solution: The SolutionStore loaded by get_solve.
         solver: The solver used to solve the model.
         results: The results of the optimisation.
         model: The Pyomo model.
@@ -41,8 +53,19 @@ class H2Planning:
         custom_cmap: A list of colors for plots.
         linewidth: The line width for plots.
     .. methods
-        __init__(self, parameters, key, probabilities=False):
-            Initializes the model with the given parameters and key.
+        __init__(self, parameters, key, filename, filepath=None, mode='pyomo', cache=True,
+                 profile=False):
+            Initializes the model with the given parameters and key. With
+            mode='matrix' the model is assembled as sparse matrices (see
+            MatrixModel) instead of through create_instance. With mode='nodes'
+            the model is built through create_instance in node-id mode, where
+            the tuple sets of the grid are replaced by a NodeIndex and the
+            constraints over them are indexed by node id. With cache=True an
+            identical configuration reuses a previous build (see BuildCache),
+            and any build sharing its weather and tree reuses the sampled grid
+            (see GridCache).
+            With profile=True the instance is built component by component and a
+            per-component report is written (see profile_model).
         setup_model(self, parameters, probabilities):
             Sets up the model with the given parameters.
         generate_objective_function(self):
@@ -50,40 +73,74 @@ class H2Planning:
 
         build_model(self):
             Builds the model and saves it to a file.
+        profile_model(self):
+            Builds the instance while profiling the construction of each component.
+        build_matrix_model(self):
+            Assembles the sparse matrix form of the model.
         get_param_dict(file_name):
             Loads the parameters from a file and returns an OptimisationModel instance.
         get_parameters(file_name):
             Loads the parameters from a file and returns them as a dictionary.
         class_solve(cls, unbounded=False, feasibility=1e-2, optimality=1e-8,
             mip_percentage=5, random_seed=42, solver='gurobi', key=None,
-            parallel=False, time=None, reinitialise=False):
-            Solves the model using the specified solver and parameters.
-        get_solve(cls, key, reinitialise=False):
-            Loads the model from a file and returns an OptimisationModel instance.
+            parallel=False, reinitialise=False, persistent=False,
+            threads=None, time_limit=None, options=None, deadline=None, start=None):
+            Solves the model using the specified solver and parameters, through
+            the solver backend of the solver (see opt/solvers.py).
+        update_hydrogen_price(cls, hydrogen_price):
+            Updates the hydrogen price of the loaded instance in place.
+        get_solve(cls, key, reinitialise=False, instance=False):
+            Loads the stored solution (and, on request, the pickled instance) of a key.
+        get_solution(key):
+            Loads the compact solution store written by class_solve.
        
+        extract(self, name):
+            Extracts a variable as an array of shape (scenario, hour[, vector]).
          generate_plots(self, all=True, demand=False, storage_tanks=False,
             conversion_process=False, electrolyser_production=False,
-            curtailed=False, grid=False, quality=150):
-            Generates plots of the results.
+            curtailed=False, grid=False, quality=150, directory=None, workers=None,
+            decimate=None, max_points=2000):
+            Generates plots of the results, headlessly into directory if given.
         
     """
 
-    def __init__(self, parameters, key, filename, filepath = None):
+    def __init__(self, parameters, key, filename, filepath = None, mode='pyomo', cache=True, profile=False):
         self.key = key
         self.filename = filename
         self.filepath = filepath
+        self.mode = mode
+        self.profile = profile
+        self.weather_cache = cache
+        self.cache = BuildCache() if cache and mode in ('pyomo', 'nodes') and not profile else None
+        self.build_hash = None
+        if self.cache is not None:
+            try:
+                self.build_hash = build_hash(parameters, filename, filepath, mode)
+            except FileNotFoundError as e:
+                print(f'[INFO] Build cache skipped: {e}')
+                self.cache = None
         start_time = time.time()
+        if self.cache is not None and self.load_cached_build():
+            print(f'[INFO] Reused cached build {self.build_hash[:12]} in {time.time() - start_time:.2f} seconds')
+            return
         self.setup_model(parameters)
         self.generate_objective_function()
         print(f'[INFO] Setup Model completed in {time.time() - start_time:.2f} seconds')
 
         start_time = time.time()
-        self.build_model()
+        if mode == 'matrix':
+            self.build_matrix_model()
+        elif mode in ('pyomo', 'nodes'):
+            self.build_model()
+        else:
+            raise ValueError(f"Unknown build mode '{mode}', expected 'pyomo', 'nodes' or 'matrix'")
         print(f'[INFO] Model Built in {time.time() - start_time:.2f} seconds')
 
     def setup_model(self, parameters):
         self.model = AbstractModel()
         self.model.random_seed = int(parameters['random_seed'])
+        self.model.node_id_mode = self.mode == 'nodes'
+        self.model.weather_cache = self.weather_cache
         generate_parameters(self.model, parameters, self.filename, self.filepath)
         generate_variables(self.model)
         generate_inequalities(self.model)
@@ -92,7 +149,11 @@ class H2Planning:
         self.model.Obj = Objective(rule=objective_function, sense=minimize)
 
     def build_model(self):
-        self.instance = self.model.create_instance()
+        if self.profile:
+            self.profile_model()
+        else:
+            self.instance = self.model.create_instance()
+        clear_cumulative_cache(self.instance)
         current_dir = Path(__file__).resolve().parent
         presolve_dir = current_dir.parent / "tmp" / 'pre'
         # Check if the directory exists, if not create it
@@ -101,6 +162,47 @@ class H2Planning:
         open(presolve_dir/f"{self.key}.pickle", 'a').close()
         with open(presolve_dir/f"{self.key}.pickle", 'wb') as f:
             dump(self.instance, f)
+        if self.cache is not None:
+            self.cache.store(self.build_hash, presolve_dir/f"{self.key}.pickle")
+
+    def profile_model(self):
+        """
+        Creates the instance component by component (see profile_instance),
+        prints the slowest components and writes the full per-component
+        report to tmp/profile/{key}.json.
+        """
+        self.instance, self.build_report = profile_instance(self.model)
+        profile_dir = Path(__file__).resolve().parent.parent / "tmp" / 'profile'
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        write_report(self.build_report, profile_dir / f"{self.key}.json")
+        print(format_report(self.build_report, top=15))
+
+    def load_cached_build(self):
+        """
+        Looks up the build hash in the build cache. On a hit the cached build is
+        copied to tmp/pre/{key}.pickle, overwriting whatever was stored under this
+        key before, and loaded as self.instance.
+
+        Returns:
+            bool: Whether a cached build was found.
+        """
+        presolve_dir = Path(__file__).resolve().parent.parent / "tmp" / 'pre'
+        presolve_dir.mkdir(parents=True, exist_ok=True)
+        if not self.cache.fetch(self.build_hash, presolve_dir/f"{self.key}.pickle"):
+            return False
+        with open(presolve_dir/f"{self.key}.pickle", 'rb') as f:
+            self.instance = load(f)
+        self.model = None
+        return True
+
+    def build_matrix_model(self):
+        """
+        Assembles the model directly as sparse coefficient matrices, skipping
+        create_instance. The result is stored as self.matrix and can be solved
+        with self.matrix.solve(), or for the minimum LCOH in a single solve
+        with self.matrix.fractional().
+        """
+        self.matrix = MatrixModel(self.model)
 
     @staticmethod
     def get_param_dict(file_name):
@@ -133,7 +235,9 @@ class H2Planning:
     def class_solve(
         cls, feasibility=1e-2, optimality=1e-8, mip_percentage=5,
         random_seed=42, solver='gurobi', key=None, parallel=False, timer=None,
-        reinitialise=False, verbose = True
+        reinitialise=False, verbose = True, persistent=False, threads=None,
+        pickle_instance=False, time_limit=None, options=None, deadline=None,
+        start=None
     ):
         """
         This method solves the optimisation model using the specified solver
@@ -144,11 +248,32 @@ class H2Planning:
         .. optimality (float): Optimality tolerance for the solver.
         .. mip_percentage (float): MIP gap percentage for the solver.
         .. random_seed (int): Random seed for the solver.
-        .. solver (str): The solver to use (default is 'gurobi').
+        .. solver (str): The solver to use (default is 'gurobi'); 'gurobi', 'highs'
+           (or 'appsi_highs'), 'cbc' and 'scip' have a registered backend, other
+           Pyomo solvers are used without options (see get_backend).
         .. key (str): A string used to identify the model.
-        .. parallel (bool): Whether to use parallel processing (default is False).
-        .. time (int): Time limit for the solver (default is None).
+        .. parallel (bool): Whether to use one solver thread per available CPU,
+           as limited by the affinity and cgroup quota of the process (default
+           is False, the solver default).
+        .. timer (float): Former name of time_limit, still accepted.
         .. reinitialise (bool): Whether to reinitialise the model (default is False).
+        .. persistent (bool): Whether to keep the instance loaded in a persistent
+           solver ('{solver}_persistent') between calls, so that later solves only
+           push the changes and warm start from the previous solution.
+        .. threads (int): Number of solver threads; overrides the parallel default.
+        .. time_limit (float): Time limit of the solve in seconds (default is None).
+        .. options (dict): Further solver-specific options, set last.
+        .. deadline (Deadline or float): Wall-clock budget shared with the rest of
+           the run (a number is seconds from now). The solve gets the remaining
+           time, or time_limit if shorter; when it runs out the best incumbent is
+           loaded and stored like any other solution, and cls.timed_out is set.
+        .. start (str): Key of a stored solution of the same grid to use as a MIP
+           start, e.g. a neighbouring sweep point (see SolutionStore.load_start).
+           The seconds until the first incumbent, as read from the solver log,
+           are kept in cls.first_incumbent.
+        .. pickle_instance (bool): Whether to also dill the whole solved instance to
+           tmp/post/{key}.pickle. The solution is always written to the compact
+           SolutionStore in tmp/post/{key}/.
 
         """
         # Get the current working directory
@@ -170,77 +295,135 @@ class H2Planning:
                     print('[INFO] Loaded recognised as instance')
                     cls.instance = loaded
                 cls.key = key
+                cls.persistent_solver = None
 
         # Setting up the solver
-        solve_kwargs = {}
-        cls.solver = SolverFactory(solver)
-        
-        if solver == "cbc":
-            cls.solver.options['ratioGap'] = mip_percentage / 100
-            cls.solver.options['logLevel'] = 1
-            cls.solver.options['randomCbcSeed'] = random_seed
-            if parallel:
-                cls.solver.options['threads'] = 8
-            solve_kwargs['tee'] = True
-            solve_kwargs['logfile'] = str(cache_dir / f"log/{cls.key}.log")
-        elif solver == "gurobi":
-            cls.solver.options['FeasibilityTol'] = feasibility
-            cls.solver.options['OptimalityTol'] = optimality
-            cls.solver.options['MIPGap'] = mip_percentage / 100
-            cls.solver.options['LogToConsole'] = 1
-            cls.solver.options['LogFile'] = str(cache_dir / f"log/{cls.key}.log")
-            solve_kwargs['tee'] = True
-            if parallel:
-                cls.solver.options['Threads'] = 8
-                cls.solver.options['DistributedMIPJobs'] = 2
-                
-        if verbose is False:
-            cls.solver.options['LogToConsole'] = 0
-            cls.solver.options.pop('LogFile', None)
-            cls.solver.options['OutputFlag'] = 0
-            solve_kwargs['tee'] = False
+        deadline = Deadline.coerce(deadline)
+        time_limit = time_limit if time_limit is not None else timer
+        if deadline is not None:
+            if deadline.expired():
+                raise RuntimeError(f"Deadline passed before solving '{key}'")
+            time_limit = deadline.limit(time_limit)
+        backend = get_backend(solver)
+        if threads is None and parallel:
+            threads = available_threads()
+        warm = persistent and cls.persistent_solver is not None and cls.backend is backend
+        if warm:
+            cls.solver = cls.persistent_solver
+        else:
+            cls.solver = backend.create(persistent)
+            cls.persistent_solver = None
+        cls.backend = backend
 
+        log_file = cache_dir / f"log/{cls.key}.log"
+        if verbose:
+            log_file.parent.mkdir(parents=True, exist_ok=True)
+        solve_kwargs = backend.configure(
+            cls.solver, verbose=verbose, log_file=str(log_file),
+            mip_gap=mip_percentage / 100, feasibility=feasibility, optimality=optimality,
+            seed=random_seed, threads=threads if backend.threads else None,
+            time_limit=time_limit
+        )
+        for option, option_value in (options or {}).items():
+            cls.solver.options[option] = option_value
+        if start is not None:
+            if backend.mip_start:
+                count = SolutionStore.load(start, cache_dir / "post").load_start(cls.instance)
+                print(f'[INFO] MIP start from {start}: {count} values')
+                solve_kwargs['warmstart'] = count > 0
+            else:
+                print(f'[INFO] {backend.name} takes no MIP start, ignoring {start}')
+        print(f'[INFO] Solving with {backend.name} ({backend.factory}), '
+              f'threads = {threads if backend.threads and threads else "default"}')
 
         # Solving the model
-        cls.results = cls.solver.solve(cls.instance, **solve_kwargs)
+        log_offset = backend.log_offset(log_file)
+        if persistent:
+            if warm:
+                solve_kwargs['warmstart'] = backend.mip_start
+            else:
+                cls.solver.set_instance(cls.instance)
+                cls.persistent_solver = cls.solver
+        cls.results = backend.solve(cls.solver, cls.instance, persistent, **solve_kwargs)
         
         print(f'[INFO] Solved in {time.time() - start_time:.2f} seconds. Status = {cls.results.solver.termination_condition}')
+        cls.first_incumbent = backend.first_incumbent(log_file, log_offset) if verbose else None
+        if cls.first_incumbent is not None:
+            print(f'[INFO] First incumbent after {cls.first_incumbent:.2f} seconds')
+        cls.timed_out = cls.results.solver.termination_condition == TerminationCondition.maxTimeLimit
+        if cls.timed_out:
+            print(f'[INFO] Time limit of {time_limit:.2f} seconds reached, keeping the best incumbent')
 
         # Saving the results
         if verbose:
             cls.results.write()
         
-        # Check if the directory exists, if not create it
-        if not (cache_dir / "post").exists():
-            (cache_dir / "post").mkdir(parents=True, exist_ok=True)
-
-
-        open(cache_dir / f"post/{cls.key}.pickle", 'a').close()
-
-        with open(cache_dir / f"post/{cls.key}.pickle", 'wb') as f:
-            dump(cls.instance, f)
+        # Saving the solution
+        SolutionStore.write(cls.instance, cls.key, cache_dir / "post")
+        if pickle_instance:
+            with open(cache_dir / f"post/{cls.key}.pickle", 'wb') as f:
+                dump(cls.instance, f)
+        else:
+            # A pickle left by an earlier solve of this key no longer matches the store
+            (cache_dir / f"post/{cls.key}.pickle").unlink(missing_ok=True)
         return cls
 
     @classmethod
-    def get_solve(cls, key, reinitialise=False):
+    def update_hydrogen_price(cls, hydrogen_price):
         """
-        This method loads the model from a file and returns an OptimisationModel instance.
+        Updates the hydrogen price of the loaded instance in place. If the
+        instance is held by a persistent solver, only the NPV constraint is
+        pushed to the solver again, so the next class_solve is a warm re-solve
+        rather than a rebuild.
         """
-        # Get the current working directory
-        current_dir = Path(__file__).resolve().parent
+        cls.instance.hydrogen_price = hydrogen_price
+        if cls.persistent_solver is not None and cls.instance.component('NPV') is not None:
+            cls.backend.refresh(cls.persistent_solver, cls.instance.NPV)
 
-        # Target directory for presolved model
-        cache_dir = current_dir.parent.parent / "cache"  
-        
-        if cls.instance is None or reinitialise:
-            with open(cache_dir / f"post/{key}.pickle", 'rb') as f:
+    @classmethod
+    def get_solve(cls, key, reinitialise=False, instance=False):
+        """
+        This method loads a solved model written by class_solve. The solution
+        is read from the compact SolutionStore in tmp/post/{key}/ into
+        cls.solution. With instance=True the solved instance is also unpickled
+        from tmp/post/{key}.pickle, which class_solve only writes with
+        pickle_instance=True; otherwise cls.instance is cleared, so that it
+        never holds the instance of another key.
+        """
+        cache_dir = Path(__file__).resolve().parent.parent / "tmp" / "post"
+
+        if cls.solution is None or cls.key != key or reinitialise:
+            cls.solution = SolutionStore.load(key, cache_dir)
+            cls.key = key
+            cls.instance = None
+            cls.persistent_solver = None
+        if instance and cls.instance is None:
+            with open(cache_dir / f"{key}.pickle", 'rb') as f:
                 cls.instance = load(f)
-                cls.key = key
         return cls
 
+    @staticmethod
+    def get_solution(key):
+        """
+        This method loads the solution of a solved model from the compact
+        solution store, memory-mapping the arrays rather than unpickling the instance.
+        """
+        return SolutionStore.load(key)
+
+    def extract(self, name):
+        """
+        This method extracts an indexed variable or node parameter of the solved
+        instance as a NumPy array of shape (scenario, hour), or (scenario, hour,
+        vector) for components also indexed by vectors or electrolysers. Every
+        scenario follows its path through the tree and the node durations are
+        expanded with numpy.repeat, so a variable is read in a single pass.
+        """
+        return hourly_array(self, name)
+
     def generate_plots(
         self, all=True, demand=False, storage_tanks=False, conversion_process=False,
-        electrolyser_production=False, curtailed=False, grid=False, quality=150
+        electrolyser_production=False, curtailed=False, grid=False, quality=150,
+        directory=None, workers=None, decimate=None, max_points=2000
     ):
         """
         This method generates plots of the results using matplotlib.
@@ -253,7 +436,32 @@ class H2Planning:
         .. curtailed (bool): If True, generates curtailed energy plots.
         .. grid (bool): If True, generates grid energy plots.
         .. quality (int): Quality of the plots (default is 150).
+        .. directory (str): If given, the figures are rendered headlessly from the
+           stored solution of the key into this directory, in a process pool
+           (see render_figures), instead of being shown.
+        .. workers (int): Number of rendering processes when directory is given.
+        .. decimate (str): None to plot every hour, 'minmax' to keep the minimum and
+           maximum of every bucket of hours, or 'bands' to plot quantile bands
+           across the scenarios (see plot_paths).
+        .. max_points (int): Maximum number of points per line when decimating.
         """
+        if directory is not None:
+            figures = [
+                name for name, selected in (
+                    ('wind_energy', demand), ('grid_energy', grid),
+                    ('curtailed_energy', curtailed),
+                    ('hydrogen_storage_tank_level', storage_tanks),
+                    ('origin_storage_tank_levels', storage_tanks),
+                    ('vector_production', conversion_process),
+                    ('active_trains', conversion_process),
+                    ('hydrogen_production', electrolyser_production),
+                ) if selected or all
+            ] + ['objective_cdf']
+            return render_figures(
+                self.key, directory, figures, workers=workers, quality=quality,
+                decimate=decimate, max_points=max_points
+            )
+
         # Set the font properties for the plots
         rcParams['font.family'] = 'serif'
         rcParams['font.serif'] = ['CMU Serif'] + rcParams['font.serif']
@@ -271,6 +479,8 @@ class H2Planning:
         self.alpha = 0.75
         self.custom_cmap = colors
         self.linewidth = 1.25
+        self.decimate = decimate
+        self.max_points = max_points
 
         # Generate the plots based on the specified parameters
         if demand or all:
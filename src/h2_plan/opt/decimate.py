@@ -0,0 +1,135 @@
+"""
+This module draws the hourly paths of the scenarios, as returned by
+H2Planning.extract, with an optional decimation so that the number of plotted
+points does not grow with the horizon:
+.. 'minmax': every path is split into buckets and the minimum and maximum of
+   each bucket are kept in time order, so peaks stay visible.
+.. 'bands': the paths are replaced by quantile bands across the scenarios and
+   their median, bucketed the same way (lower quantiles keep the bucket
+   minimum, upper quantiles the bucket maximum).
+"""
+
+from math import ceil
+from numpy import (
+    arange, argmax, argmin, asarray, concatenate, full, inf, isnan, maximum, minimum,
+    nan, nanmax, nanmean, nanmin, quantile, stack, where, int64
+)
+
+MODES = (None, 'minmax', 'bands')
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def buckets(values, max_buckets):
+    """
+    Splits the last axis of an array into at most max_buckets buckets of equal
+    length, padding the last bucket with NaN.
+
+    Returns:
+        tuple: The array of shape (..., buckets, length) and the bucket length.
+    """
+    values = asarray(values, dtype=float)
+    n = values.shape[-1]
+    length = ceil(n / max_buckets)
+    n_buckets = ceil(n / length)
+    padding = full(values.shape[:-1] + (n_buckets * length - n,), nan)
+    padded = concatenate([values, padding], axis=-1)
+    return padded.reshape(values.shape[:-1] + (n_buckets, length)), length
+
+
+def minmax_downsample(y, max_points=2000):
+    """
+    Returns the hours and values of a path reduced to at most max_points
+    points, keeping the minimum and maximum of every bucket in time order.
+
+    Args:
+        y (array): Hourly values of one path.
+        max_points (int): Maximum number of points returned.
+    """
+    y = asarray(y, dtype=float)
+    if len(y) <= max_points:
+        return arange(len(y)), y
+    grouped, length = buckets(y, max(1, max_points // 2))
+    offset = arange(grouped.shape[0], dtype=int64) * length
+    # Buckets with no value at all (e.g. variables left unset by the solver) are dropped
+    missing = isnan(grouped)
+    kept = ~missing.all(axis=1)
+    low = offset + argmin(where(missing, inf, grouped), axis=1)
+    high = offset + argmax(where(missing, -inf, grouped), axis=1)
+    hours = stack([minimum(low, high), maximum(low, high)], axis=1)[kept].ravel()
+    return hours, y[hours]
+
+
+def quantile_bands(values, max_points=2000, quantiles=QUANTILES):
+    """
+    Returns the quantiles across scenarios of hourly paths, reduced to at
+    most max_points buckets.
+
+    Args:
+        values (array): Paths of shape (scenario, hour).
+        max_points (int): Maximum number of points of each band.
+        quantiles (tuple): Quantiles to compute, in increasing order.
+
+    Returns:
+        tuple: The first hour of every bucket and the quantiles, of shape
+        (quantile, bucket).
+    """
+    bands = quantile(asarray(values, dtype=float), quantiles, axis=0)
+    if bands.shape[1] <= max_points:
+        return arange(bands.shape[1]), bands
+    grouped, length = buckets(bands, max_points)
+    reduced = nanmean(grouped, axis=2)
+    for count, q in enumerate(quantiles):
+        if q < 0.5:
+            reduced[count] = nanmin(grouped[count], axis=1)
+        elif q > 0.5:
+            reduced[count] = nanmax(grouped[count], axis=1)
+    return arange(grouped.shape[1]) * length, reduced
+
+
+def plot_paths(ax, values, colors, linewidth, labels=None, mode=None, max_points=2000):
+    """
+    Plots hourly paths of shape (scenario, hour), or (scenario, hour, inner)
+    with one line per inner index (vectors or electrolysers).
+
+    Args:
+        ax: The axes to draw on.
+        values (array): The hourly paths, see H2Planning.extract.
+        colors (list): Colours cycled over the scenarios (or inner indices in
+            'bands' mode).
+        linewidth (float): Width of the lines.
+        labels (list): Legend label of every inner index.
+        mode (str): None to plot every hour, 'minmax' or 'bands'.
+        max_points (int): Maximum number of points per line when decimating.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown decimation mode '{mode}', expected None, 'minmax' or 'bands'")
+    values = asarray(values, dtype=float)
+    inner = values[:, :, None] if values.ndim == 2 else values
+
+    if mode == 'bands':
+        pairs = len(QUANTILES) // 2
+        for count in range(inner.shape[2]):
+            color = colors[count % len(colors)]
+            hours, bands = quantile_bands(inner[:, :, count], max_points)
+            for level in range(pairs):
+                ax.fill_between(
+                    hours, bands[level], bands[-1 - level], step='post',
+                    color=color, alpha=0.15 * (level + 1), linewidth=0
+                )
+            ax.plot(
+                hours, bands[pairs], drawstyle='steps-post', color=color, linewidth=linewidth,
+                label=labels[count] if labels is not None else None
+            )
+        return
+
+    for s, path in enumerate(inner):
+        color = colors[s % len(colors)]
+        for count in range(path.shape[1]):
+            if mode == 'minmax':
+                hours, y = minmax_downsample(path[:, count], max_points)
+            else:
+                hours, y = arange(len(path)), path[:, count]
+            ax.plot(
+                hours, y, color=color, linewidth=linewidth,
+                label=labels[count] if labels is not None and s == 0 else None
+            )
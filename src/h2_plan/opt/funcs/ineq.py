@@ -4,6 +4,7 @@ This code defines the inequalities used in the optimization model.
 
 from pyomo.environ import Constraint
 from math import floor
+from ..vars.nodes import grid_set
 
 
 def obj_bound(self):
@@ -23,7 +24,7 @@ def obj_constraint_2(self):
                 self.leaf_nodes[s, t, d]
                 * self.energy_vector_production_flux[(s_v, t_v, d_v), q]
                 * d
-                for s, t, d, s_v, t_v, d_v in self.vector_set_time
+                for s, t, d, s_v, t_v, d_v in grid_set(self, 'vector_set_time')
             )
             / 120
             for q in self.vectors
@@ -83,16 +84,36 @@ def energy_balance(self, s, t, d, s_v, t_v, d_v):
     return bal == 0
 
 
+def cumulative_expression(self, component):
+    """
+    Returns the running total of component[s, t, d] * d along every scenario
+    path, keyed by node. The totals are built in a single pass over the
+    continuity set and cached on the instance, so that every rule needing a
+    running total shares the same expressions.
+    """
+    cache = getattr(self, '_cumulative_cache', None)
+    if cache is None:
+        cache = self._cumulative_cache = {}
+    name = component.local_name
+    if name not in cache:
+        expr = {(0, 0, 1): 0}
+        for s, t, d, s_0, t_0, d_0 in grid_set(self, 'continuity_set'):
+            expr[(s, t, d)] = expr[(s_0, t_0, d_0)] + component[s, t, d] * d
+        cache[name] = expr
+    return cache[name]
+
+
+def clear_cumulative_cache(self):
+    """
+    Drops the running totals built by cumulative_expression once the
+    instance has been constructed.
+    """
+    self.__dict__.pop('_cumulative_cache', None)
+
+
 def grid_wheel_lim(self, s, t, d, s0, t0, d0):
     if t % self.wheel_period.value <= t0 % self.wheel_period.value or t == self.end_time_index.value:
-        expr = {(0, 0, 1): 0}
-        for s_o, t_o, d_o, s0_o, t0_o, d0_o in self.continuity_set:
-            if t_o <= t:
-                expr[(s_o, t_o, d_o)] = (
-                    expr[(s0_o, t0_o, d0_o)]
-                    + self.energy_wheeled[s_o, t_o, d_o] * d_o
-                )
-        return expr[s, t, d] == 0
+        return cumulative_expression(self, self.energy_wheeled)[s, t, d] == 0
     else:
         return Constraint.Skip
 
@@ -125,12 +146,10 @@ def electrolyser_capacity(self, s, t, d, k):
 
 
 def grid_use_balance(self, s):
-    expr = {(0, 0, 1): 0}
-    for s_o, t_o, d_o, s0_o, t0_o, d0_o in self.continuity_set:
-        expr[(s_o, t_o, d_o)] = (
-            expr[(s0_o, t0_o, d0_o)] + self.energy_grid[s_o, t_o, d_o] * d_o
-        )
-    return expr[s, t_o, d_o] == self.net_grid[s]
+    return (
+        cumulative_expression(self, self.energy_grid)[s, self.end_time_index.value, 1]
+        == self.net_grid[s]
+    )
 
 
 def grid_use_limit(self, s):
@@ -470,9 +489,38 @@ def total_operating_expenditure(self, s):
     ) * self.amortisation_plant
     return expr - self.OPEX[s] <= 0
 
+class NodeRule:
+    """
+    Wraps the rule of a constraint over a tuple set of the grid so that, in
+    node-id mode, it can be indexed by node id: the id is expanded into the
+    entry of the set (see NodeIndex.expand) before calling the rule.
+
+    Attributes:
+    .. rule: The constraint rule taking the entry of the set.
+    .. name: Name of the tuple set, e.g. 'continuity_set'.
+    """
+
+    def __init__(self, rule, name):
+        self.rule = rule
+        self.name = name
+
+    def __call__(self, model, node, *index):
+        return self.rule(model, *model.node_index.expand(node, self.name), *index)
+
+
+def grid_constraint(model, name, rule, *sets):
+    """
+    Returns a constraint over the tuple set of the grid called name and any
+    further sets. In node-id mode the constraint is indexed by model.nodes.
+    """
+    if getattr(model, 'node_index', None) is None:
+        return Constraint(getattr(model, name), *sets, rule=rule)
+    return Constraint(model.nodes, *sets, rule=NodeRule(rule, name))
+
+
 def generate_inequalities(model):
     # Energy balance for the energy production of the system
-    model.energy_balance = Constraint(model.vector_set_time, rule=energy_balance)
+    model.energy_balance = grid_constraint(model, 'vector_set_time', energy_balance)
     model.grid_use_balance = Constraint(model.scenario, rule=grid_use_balance)
     model.grid_use_limit = Constraint(model.scenario, rule=grid_use_limit)
 
@@ -485,8 +533,8 @@ def generate_inequalities(model):
     )
 
     # Gaseous hydrogen storage equations
-    model.hydrogen_storage_balance = Constraint(
-        model.continuity_set, rule=hydrogen_storage_balance
+    model.hydrogen_storage_balance = grid_constraint(
+        model, 'continuity_set', hydrogen_storage_balance
     )
     model.hydrogen_storage_balance_contiguity = Constraint(
         model.scenario, rule=hydrogen_storage_balance_contiguity
@@ -500,8 +548,8 @@ def generate_inequalities(model):
     model.influent_hydrogen_balance = Constraint(
         model.full_set, rule=influent_hydrogen_balance
     )
-    model.effluent_hydrogen_balance = Constraint(
-        model.vector_set_time, model.vectors, rule=effluent_hydrogen_balance
+    model.effluent_hydrogen_balance = grid_constraint(
+        model, 'vector_set_time', effluent_hydrogen_balance, model.vectors
     )
 
     # Compression equations
@@ -513,28 +561,28 @@ def generate_inequalities(model):
     )
 
     # Vector production equations
-    model.vector_production_energy_balance = Constraint(
-        model.vector_set_time, model.vectors, rule=vector_production_energy_balance
+    model.vector_production_energy_balance = grid_constraint(
+        model, 'vector_set_time', vector_production_energy_balance, model.vectors
     )
-    model.vector_upper_production_limit = Constraint(
-        model.vector_set_time, model.vectors, rule=vector_upper_production_limit
+    model.vector_upper_production_limit = grid_constraint(
+        model, 'vector_set_time', vector_upper_production_limit, model.vectors
     )
-    model.vector_lower_production_limit = Constraint(
-        model.vector_set_time, model.vectors, rule=vector_lower_production_limit
+    model.vector_lower_production_limit = grid_constraint(
+        model, 'vector_set_time', vector_lower_production_limit, model.vectors
     )
-    model.active_train_limit = Constraint(
-        model.vector_set_time, model.vectors, rule=active_train_limit
+    model.active_train_limit = grid_constraint(
+        model, 'vector_set_time', active_train_limit, model.vectors
     )
-    model.lower_ramping_limit = Constraint(
-        model.vector_continuity_set, model.vectors, rule=lower_ramping_limit
+    model.lower_ramping_limit = grid_constraint(
+        model, 'vector_continuity_set', lower_ramping_limit, model.vectors
     )
-    model.upper_ramping_limit = Constraint(
-        model.vector_continuity_set, model.vectors, rule=upper_ramping_limit
+    model.upper_ramping_limit = grid_constraint(
+        model, 'vector_continuity_set', upper_ramping_limit, model.vectors
     )
 
     # Vector storage equations
-    model.origin_vector_storage_balance = Constraint(
-        model.vector_continuity_set, model.vectors, rule=origin_vector_storage_balance
+    model.origin_vector_storage_balance = grid_constraint(
+        model, 'vector_continuity_set', origin_vector_storage_balance, model.vectors
     )
     model.origin_vector_storage_balance_contiguity = Constraint(
         model.scenario, model.vectors, rule=origin_vector_storage_balance_contiguity
@@ -545,8 +593,8 @@ def generate_inequalities(model):
     model.origin_vector_storage_lower_limit = Constraint(
         model.full_set, model.vectors, rule=origin_storage_min
     )
-    model.shipping_balance_charging = Constraint(
-        model.shipping_continuity_set, model.vectors, rule=shipping_balance_charging
+    model.shipping_balance_charging = grid_constraint(
+        model, 'shipping_continuity_set', shipping_balance_charging, model.vectors
     )
     model.shipping_balance_charging_t_0 = Constraint(
         model.vectors, rule=shipping_balance_charging_t_0
@@ -575,6 +623,6 @@ def generate_inequalities(model):
         model.obj_constraint = Constraint(rule=obj_constraint)
 
     if model.grid_wheel:
-        model.grid_wheel_lim = Constraint(
-            model.continuity_set, rule=grid_wheel_lim
+        model.grid_wheel_lim = grid_constraint(
+            model, 'continuity_set', grid_wheel_lim
         )
\ No newline at end of file
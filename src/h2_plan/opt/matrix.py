@@ -0,0 +1,836 @@
+"""
+This module assembles the H2Planning LP/MILP directly as sparse coefficient
+matrices, without evaluating the Pyomo constraint rules one index at a time.
+Every constraint block of funcs/ineq.py is reproduced here as a set of array
+operations over the dense node ids of NodeIndex. MatrixModel.fractional
+minimises the LCOH ratio itself through a Charnes-Cooper transformation of the
+same matrices, as an alternative to the Dinkelbach iterations.
+"""
+
+import time
+from numpy import (
+    arange, array, asarray, broadcast_to, concatenate, diff, flatnonzero, floor, full,
+    inf, isfinite, minimum, ones, repeat, rint, tile, where, zeros, int64
+)
+from scipy.optimize import Bounds, LinearConstraint, milp
+from scipy.sparse import coo_matrix, eye, vstack
+from pyomo.environ import Param, Var, value
+from .vars.nodes import NodeIndex
+from .vars.series import node_values
+
+
+class _Columns:
+    """
+    Column layout of the variables. Each Var occupies a contiguous block of
+    columns of shape (outer, inner), where outer runs over the first index set
+    (nodes, vector nodes, shipping nodes or scenarios) and inner over vectors
+    or electrolysers.
+    """
+
+    def __init__(self, model, sizes):
+        self.offset, self.shape = {}, {}
+        lower, upper, integrality = [], [], []
+        count = 0
+        for var in model.component_objects(Var, descend_into=False):
+            if var.is_indexed():
+                subsets = [sizes[s.local_name] for s in var.index_set().subsets()]
+                shape = (subsets[0], subsets[1] if len(subsets) > 1 else 1)
+            else:
+                shape = (1, 1)
+            domain = var._rule_domain(model, None, var)
+            lb, ub = domain.bounds()
+            size = shape[0] * shape[1]
+            lower.append(full(size, -inf if lb is None else lb))
+            upper.append(full(size, inf if ub is None else ub))
+            integrality.append(full(size, 1 if domain.isdiscrete() else 0))
+            self.offset[var.local_name] = count
+            self.shape[var.local_name] = shape
+            count += size
+        self.size = count
+        self.lower = concatenate(lower)
+        self.upper = concatenate(upper)
+        self.integrality = concatenate(integrality)
+
+    def __call__(self, name, outer=0, inner=0):
+        """
+        Returns the column ids of a variable for the given outer/inner positions.
+        """
+        return self.offset[name] + asarray(outer) * self.shape[name][1] + asarray(inner)
+
+    def __contains__(self, name):
+        return name in self.offset
+
+
+class _Rows:
+    """
+    Accumulates constraint rows in coordinate form, block by block.
+    """
+
+    def __init__(self):
+        self.rows, self.cols, self.vals = [], [], []
+        self.lower, self.upper = [], []
+        self.blocks = {}
+        self.count = 0
+
+    def add(self, name, size, terms, lower=-inf, upper=0.0, mask=None, paths=None):
+        """
+        Adds a block of rows.
+
+        Args:
+            name (str): Name of the constraint block.
+            size (int): Number of candidate rows in the block.
+            terms (list): (columns, coefficients) pairs, broadcast to one entry per row.
+            lower, upper: Row bounds, scalars or arrays of length size.
+            mask (array): Boolean array selecting the rows to keep (Constraint.Skip).
+            paths (list): (incidence, columns, coefficients) triples, where the
+                sparse incidence matrix selects the columns summed in each row.
+        """
+        keep = arange(size) if mask is None else arange(size)[asarray(mask, dtype=bool)]
+        row_ids = self.count + arange(len(keep))
+        local = full(size, -1, dtype=int64)
+        local[keep] = arange(len(keep))
+
+        for columns, coefficients in terms:
+            self.rows.append(row_ids)
+            self.cols.append(broadcast_to(columns, (size,))[keep])
+            self.vals.append(broadcast_to(asarray(coefficients, dtype=float), (size,))[keep])
+        for incidence, columns, coefficients in paths or []:
+            incidence = incidence.tocoo()
+            selected = local[incidence.row] >= 0
+            self.rows.append(self.count + local[incidence.row[selected]])
+            self.cols.append(asarray(columns)[incidence.col[selected]])
+            self.vals.append(
+                incidence.data[selected]
+                * broadcast_to(asarray(coefficients, dtype=float),
+                               (incidence.shape[1],))[incidence.col[selected]]
+            )
+
+        self.lower.append(broadcast_to(asarray(lower, dtype=float), (size,))[keep])
+        self.upper.append(broadcast_to(asarray(upper, dtype=float), (size,))[keep])
+        self.blocks[name] = (self.count, self.count + len(keep))
+        self.count += len(keep)
+
+
+class MatrixModel:
+    """
+    Sparse matrix form of the H2Planning model:
+
+        minimise c @ x  subject to  row_lower <= A @ x <= row_upper,
+                                    col_lower <= x <= col_upper,
+                                    x[integrality == 1] integer.
+
+    Attributes:
+    .. A, c, row_lower, row_upper, col_lower, col_upper, integrality: The problem data.
+    .. columns: Column layout of the variables, see _Columns.
+    .. blocks: Row ranges of each constraint block.
+    .. nodes: The NodeIndex of the stochastic grid.
+    .. x, objective, status: Populated by solve() or fractional(), the objective
+       of fractional() being the LCOH.
+    """
+
+    def __init__(self, model):
+        """
+        Assembles the matrices from an AbstractModel on which generate_parameters,
+        generate_variables and generate_inequalities have been called.
+
+        Args:
+            model: The abstract H2Planning model.
+        """
+        start_time = time.time()
+        for param in model.component_objects(Param, descend_into=False):
+            if not param.is_constructed():
+                param.construct()
+        if not value(model.net_present_value):
+            raise ValueError(
+                "The matrix build mode requires the linear NPV objective "
+                "(booleans['net_present_value'] = True)."
+            )
+
+        self.nodes = nodes = NodeIndex(model)
+        self.vectors = list(model.vectors)
+        self.electrolysers = list(model.electrolysers)
+        sizes = {
+            'full_set': len(nodes),
+            'vector_param_set': len(nodes.vector_nodes),
+            'shipping_param_set': len(nodes.shipping_nodes),
+            'scenario': len(model.scenario),
+            'vectors': len(self.vectors),
+            'electrolysers': len(self.electrolysers),
+        }
+        self.columns = col = _Columns(model, sizes)
+        rows = _Rows()
+        self._assemble(model, nodes, col, rows)
+
+        self.A = coo_matrix(
+            (concatenate(rows.vals), (concatenate(rows.rows), concatenate(rows.cols))),
+            shape=(rows.count, col.size)
+        ).tocsr()
+        self.A.eliminate_zeros()
+        self.row_lower = concatenate(rows.lower)
+        self.row_upper = concatenate(rows.upper)
+        self.col_lower = col.lower
+        self.col_upper = col.upper
+        self.integrality = col.integrality
+        self.c = zeros(col.size)
+        self.c[col('Z')] = 1.0
+        self.blocks = rows.blocks
+        self.x = None
+        self.objective = None
+        self.status = None
+        print(f'[INFO] Matrix assembled in {time.time() - start_time:.2f} seconds '
+              f'({self.A.shape[0]} rows, {self.A.shape[1]} columns, {self.A.nnz} nonzeros)')
+
+    def _assemble(self, m, nodes, col, rows):
+        N = len(nodes)
+        n = arange(N)
+        d = nodes.duration.astype(float)
+        p = nodes.parent
+        v = nodes.vector
+        vp = nodes.vector_parent
+        scenarios = arange(len(m.scenario))
+        Q = self.vectors
+        K = self.electrolysers
+        lhv = value(m.hydrogen_LHV)
+        end_time = nodes.end_time
+
+        # Energy balance
+        terms = []
+        if value(m.wind):
+            terms.append((col('capacity_number_turbines'),
+                          node_values(m, 'turbine_power', nodes.nodes)
+                          * value(m.turbine_efficiency)))
+        if value(m.solar):
+            terms.append((col('capacity_solar'),
+                          node_values(m, 'solar_power', nodes.nodes) * 0.0036))
+        if value(m.grid_wheel):
+            terms.append((col('energy_wheeled', n), 1.0))
+        terms.append((col('energy_curtailed', n), -1.0))
+        terms += [(col('energy_electrolysers', n, k), -1.0) for k in range(len(K))]
+        terms += [(col('energy_penalty_vector_production', v, q), -1.0) for q in range(len(Q))]
+        terms.append((col('energy_compression', n), -1.0))
+        terms += [
+            (col('vector_storage_origin', n, q),
+             -value(m.bol_rate[Q[q]]) * value(m.bol_energy_penalty[Q[q]]) * 1000)
+            for q in range(len(Q))
+        ]
+        terms.append((col('energy_grid', n), 1.0))
+        terms.append((col('energy_HFC', n), 1.0))
+        rows.add('energy_balance', N, terms, lower=0.0)
+
+        # Grid use along each scenario path
+        rows.add(
+            'grid_use_balance', len(scenarios),
+            [(col('net_grid', scenarios), -1.0)], lower=0.0,
+            paths=[(nodes.ancestors(nodes.leaves), col('energy_grid', n), d)]
+        )
+        if not value(m.grid_connection):
+            rows.add('grid_use_limit', len(scenarios), [(col('net_grid', scenarios), 1.0)])
+
+        # Electrolysis equations
+        rows.add('electrolyser_production', N, [
+            (col('energy_electrolysers', n, k), value(m.electrolyser_efficiency[K[k]]))
+            for k in range(len(K))
+        ] + [(col('energy_gH2_flux', n), -1.0)], lower=0.0)
+        for k in range(len(K)):
+            rows.add(f'electrolyser_capacity[{K[k]}]', N, [
+                (col('energy_electrolysers', n, k), 1.0),
+                (col('capacity_electrolysers', k), -1.0),
+            ])
+
+        # Gaseous hydrogen storage equations
+        rows.add('hydrogen_storage_balance', N, [
+            (col('gh2_storage', n), 1.0),
+            (col('gh2_storage', p), -1.0),
+            (col('energy_HFC_flux', n), d),
+            (col('energy_gh2_in_store', n), -d),
+        ] + [(col('energy_gh2_rem', n, q), d) for q in range(len(Q))], lower=0.0)
+        rows.add('hydrogen_storage_balance_contiguity', len(scenarios), [
+            (col('gh2_storage', nodes.root), 1.0),
+            (col('gh2_storage', nodes.leaves), -1.0),
+        ], lower=0.0)
+        rows.add('hydrogen_storage_limit', N, [
+            (col('gh2_storage', n), 1.0), (col('capacity_gH2_storage'), -1.0)
+        ])
+        rows.add('hydrogen_storage_lower_limit', N, [
+            (col('capacity_gH2_storage'), 0.2), (col('gh2_storage', n), -1.0)
+        ])
+        rows.add('influent_hydrogen_balance', N, [
+            (col('energy_gH2_flux', n), value(m.compressor_effiency)),
+            (col('energy_gh2_in_store', n), -1.0),
+        ] + [(col('energy_gh2_use', n, q), -1.0) for q in range(len(Q))], lower=0.0)
+        for q in range(len(Q)):
+            rows.add(f'effluent_hydrogen_balance[{Q[q]}]', N, [
+                (col('energy_vector_production_flux', v, q),
+                 1 / value(m.vector_synthetic_efficiency[Q[q]])),
+                (col('energy_gh2_rem', n, q), -1.0),
+                (col('energy_gh2_use', n, q), -1.0),
+            ], lower=0.0)
+
+        # Compression equations
+        rows.add('compression_limit', N, [
+            (col('energy_compression', n), 1.0), (col('compression_capacity'), -1.0)
+        ])
+        rows.add('compression_balance', N, [(col('energy_compression', n), 1.0)] + [
+            (col('energy_electrolysers', n, k),
+             -value(m.electrolyser_compression_energy[K[k]])
+             * value(m.electrolyser_efficiency[K[k]]) / lhv)
+            for k in range(len(K))
+        ] + [
+            (col('energy_gh2_use', n, q), -value(m.vector_compression_penalty[Q[q]]) / lhv)
+            for q in range(len(Q))
+        ] + [
+            (col('energy_gh2_in_store', n), -value(m.storage_compression_penalty) / lhv)
+        ], lower=0.0)
+
+        # Vector production equations
+        vod = value(m.vector_operating_duration)
+        vector_duration = array([node[2] for node in nodes.vector_nodes], dtype=float)[v]
+        ramp_mask = nodes.time // vod != 0
+        for q in range(len(Q)):
+            name = Q[q]
+            cv = value(m.vector_calorific_value[name])
+            stl = value(m.single_train_throughput_limit[name])
+            vvep = value(m.vector_variable_energy_penalty[name])
+            vfep = value(m.vector_fixed_energy_penalty[name])
+            capacity = value(m.capacity_vector_production[name])
+            rows.add(f'vector_production_energy_balance[{name}]', N, [
+                (col('energy_vector_production_flux', v, q), (vvep / cv) * (1 - vfep)),
+                (col('number_active_trains', v, q), vfep * vvep * stl),
+                (col('energy_penalty_vector_production', v, q), -1.0),
+            ], lower=0.0)
+            upper_terms = [
+                (col('energy_vector_production_flux', v, q), 1 / cv),
+                (col('number_active_trains', v, q), -stl),
+            ]
+            if name == 'LH2':
+                upper_terms.append((
+                    col('vector_storage_origin', n, q),
+                    value(m.bol_rate[name]) * value(m.bol_energy_penalty[name]) * 1000
+                ))
+            rows.add(f'vector_upper_production_limit[{name}]', N, upper_terms)
+            rows.add(f'vector_lower_production_limit[{name}]', N, [
+                (col('number_active_trains', v, q),
+                 stl * value(m.minimum_process_throughput[name])),
+                (col('energy_vector_production_flux', v, q), -1 / cv),
+            ])
+            rows.add(f'active_train_limit[{name}]', N,
+                     [(col('number_active_trains', v, q), 1.0)], upper=capacity)
+
+            # Ramping limits between consecutive vector operating blocks
+            for block, limit, sign in (
+                ('lower_ramping_limit', value(m.ramp_down_limit[name]), -1.0),
+                ('upper_ramping_limit', value(m.ramp_up_limit[name]), 1.0),
+            ):
+                if value(m.relaxed_ramping):
+                    mask = ramp_mask & (limit * vod * vector_duration < 1)
+                    scale = stl * limit * vod * d
+                else:
+                    mask = ramp_mask
+                    scale = stl * limit * d
+                if sign < 0:
+                    rows.add(f'{block}[{name}]', N, [
+                        (col('energy_vector_production_flux', vp, q), 1 / cv),
+                        (col('energy_vector_production_flux', v, q), -1 / cv),
+                        (col('number_active_trains', v, q), -scale),
+                    ], mask=mask)
+                else:
+                    rows.add(f'{block}[{name}]', N, [
+                        (col('energy_vector_production_flux', v, q), 1 / cv),
+                        (col('energy_vector_production_flux', vp, q), -1 / cv),
+                        (col('number_active_trains', v, q), scale),
+                    ], upper=(capacity + 1) * scale, mask=mask)
+
+        # Vector storage and shipping equations
+        loading_time = value(m.loading_time)
+        shipping_time = NodeIndex.node_times(nodes.shipping_nodes)
+        starts = nodes.time == shipping_time[nodes.shipping]
+        finishes = ~starts & (nodes.time - loading_time == shipping_time[nodes.shipping_due])
+        ship_root = nodes.shipping[nodes.root]
+        for q in range(len(Q)):
+            name = Q[q]
+            cv = value(m.vector_calorific_value[name])
+            rows.add(f'origin_vector_storage_balance[{name}]', N, [
+                (col('vector_storage_origin', n, q), 1000.0),
+                (col('vector_storage_origin', p, q), -1000.0),
+                (col('energy_vector_production_flux', v, q),
+                 -value(m.vector_fugitive_efficiency[name]) / cv * d),
+                (col('number_ships_charging', n, q),
+                 value(m.ship_storage_capacity[name]) / loading_time * d),
+            ], lower=0.0)
+            rows.add(f'origin_vector_storage_balance_contiguity[{name}]', len(scenarios), [
+                (col('vector_storage_origin', nodes.root, q), 1.0),
+                (col('vector_storage_origin', nodes.leaves, q), -1.0),
+            ])
+            rows.add(f'origin_vector_storage_limit[{name}]', N, [
+                (col('vector_storage_origin', n, q), 1.0),
+                (col('capacity_vector_storage_origin', q), -1.0),
+            ])
+            rows.add(f'origin_vector_storage_lower_limit[{name}]', N, [
+                (col('vector_storage_origin', n, q), -1.0),
+            ])
+            rows.add(f'shipping_balance_charging[{name}]', N, [
+                (col('number_ships_charging', n, q), 1.0),
+                (col('number_ships_charging', p, q), -1.0),
+                (col('number_ships_start_charging', nodes.shipping, q), -d * starts),
+                (col('number_ships_start_charging', nodes.shipping_due, q), d * finishes),
+            ], lower=0.0)
+            rows.add(f'shipping_balance_charging_t_0[{name}]', 1, [
+                (col('number_ships_charging', nodes.root, q), 1.0),
+                (col('number_ships_start_charging', ship_root, q), -1.0),
+            ], lower=0.0)
+
+        # Fuel cell equations
+        rows.add('fuel_cell_production_curve', N, [
+            (col('energy_HFC_flux', n), value(m.fuel_cell_efficiency)),
+            (col('energy_HFC', n), -1.0),
+        ], lower=0.0)
+        rows.add('fuel_cell_capacity', N, [
+            (col('energy_HFC', n), 1.0), (col('capacity_HFC'), -1.0)
+        ])
+
+        # Cost equations
+        terms = []
+        if value(m.wind):
+            terms.append((col('capacity_number_turbines'),
+                          value(m.turbine_unit_capital_cost) * value(m.amortisation_turbine)))
+        if value(m.solar):
+            terms.append((col('capacity_solar'),
+                          value(m.solar_unit_capital_cost) * value(m.amortisation_solar)))
+        terms.append((col('capacity_HFC'),
+                      value(m.fuel_cell_unit_capital_cost) * value(m.amortisation_fuel_cell)))
+        terms += [
+            (col('capacity_electrolysers', k),
+             value(m.electrolyser_unit_capital_cost[K[k]])
+             * value(m.amortisation_electrolysers[K[k]]))
+            for k in range(len(K))
+        ]
+        terms.append((col('compression_capacity'),
+                      value(m.compressor_unit_capital_cost)
+                      * value(m.amortisation_compressor) / lhv))
+        terms.append((col('capacity_gH2_storage'),
+                      value(m.hydrogen_storage_unit_capital_cost) / lhv
+                      * value(m.amortisation_hydrogen_storage)
+                      * value(m.hydrogen_storage_cost_sf)))
+        terms += [
+            (col('capacity_vector_storage_origin', q),
+             value(m.vector_storage_unit_capital_cost[Q[q]])
+             * value(m.amortisation_vector_storage[Q[q]]))
+            for q in range(len(Q))
+        ]
+        terms.append((col('CAPEX'), -1.0))
+        fixed_capex = sum(
+            value(m.vector_production_unit_capital_cost[q])
+            * value(m.capacity_vector_production[q])
+            * value(m.amortisation_vector_production[q])
+            for q in Q
+        )
+        rows.add('total_capital_expenditure', 1, terms, upper=-fixed_capex)
+
+        plant = value(m.amortisation_plant)
+        terms = []
+        if value(m.wind):
+            terms.append((col('capacity_number_turbines'),
+                          value(m.turbine_unit_operating_cost) * plant))
+        if value(m.solar):
+            terms.append((col('capacity_solar'), value(m.solar_unit_operating_cost) * plant))
+        terms.append((col('capacity_HFC'), value(m.fuel_cell_unit_operating_cost) * plant))
+        if value(m.grid_connection):
+            terms.append((col('net_grid', scenarios),
+                          value(m.grid_energy_factor) * value(m.LCAP) * plant
+                          * (8760 / end_time)))
+        terms += [
+            (col('capacity_electrolysers', k),
+             value(m.electrolyser_unit_operating_cost[K[k]]) * plant)
+            for k in range(len(K))
+        ]
+        terms.append((col('compression_capacity'),
+                      value(m.compressor_unit_operating_cost) * plant / lhv))
+        terms.append((col('capacity_gH2_storage'),
+                      value(m.hydrogen_storage_unit_operating_cost) / lhv * plant
+                      * value(m.hydrogen_storage_cost_sf)))
+        terms += [
+            (col('capacity_vector_storage_origin', q),
+             value(m.vector_storage_unit_operating_cost[Q[q]]) * plant)
+            for q in range(len(Q))
+        ]
+        terms.append((col('OPEX', scenarios), -1.0))
+        fixed_opex = sum(
+            value(m.vector_production_unit_operating_cost[q])
+            * value(m.capacity_vector_production[q]) * plant
+            for q in Q
+        )
+        rows.add('total_operating_expenditure', len(scenarios), terms, upper=-fixed_opex)
+
+        # Discounted production and the NPV objective
+        production = (8760 / end_time) * plant * nodes.leaf_weight * d / 120 / len(scenarios)
+        rows.add('obj_constraint_2', 1, [(col('Y'), 1.0)], lower=0.0, paths=[
+            (coo_matrix((production, (zeros(N, dtype=int64), v)),
+                        shape=(1, len(nodes.vector_nodes))),
+             col('energy_vector_production_flux', arange(len(nodes.vector_nodes)), q), -1.0)
+            for q in range(len(Q))
+        ])
+        rows.add('NPV', 1, [
+            (col('Z'), 1.0),
+            (col('CAPEX'), -1.0),
+            (col('Y'), value(m.hydrogen_price) / 1000),
+        ] + [
+            (col('OPEX', s), -1 / len(scenarios)) for s in scenarios
+        ], lower=0.0)
+
+        # Energy wheeled must net to zero at the end of every wheeling period
+        if value(m.grid_wheel):
+            period = value(m.wheel_period)
+            mask = (nodes.time % period <= nodes.time[p] % period) | (nodes.time == end_time)
+            starts = n[mask]
+            rows.add(
+                'grid_wheel_lim', len(starts), [], lower=0.0,
+                paths=[(nodes.ancestors(starts), col('energy_wheeled', n), d)]
+            )
+
+    def values(self, name):
+        """
+        Returns the solved values of a variable as an array of shape (outer, inner).
+        """
+        offset = self.columns.offset[name]
+        shape = self.columns.shape[name]
+        return self.x[offset:offset + shape[0] * shape[1]].reshape(shape)
+
+    def solve(self, mip_percentage=5, time_limit=None, verbose=True, relax=False):
+        """
+        Solves the matrix model with HiGHS through scipy.optimize.milp.
+
+        Parameters:
+        .. mip_percentage (float): MIP gap percentage for the solver.
+        .. time_limit (float): Time limit for the solver in seconds (default is None).
+        .. verbose (bool): Whether to print the solver log.
+        .. relax (bool): Whether to solve the LP relaxation.
+        """
+        start_time = time.time()
+        options = {'disp': verbose, 'mip_rel_gap': mip_percentage / 100}
+        if time_limit is not None:
+            options['time_limit'] = time_limit
+        result = milp(
+            self.c,
+            constraints=LinearConstraint(self.A, self.row_lower, self.row_upper),
+            integrality=zeros(len(self.c)) if relax else self.integrality,
+            bounds=Bounds(self.col_lower, self.col_upper),
+            options=options,
+        )
+        self.x = result.x
+        self.objective = result.fun
+        self.status = result.message
+        print(f'[INFO] Solved in {time.time() - start_time:.2f} seconds. Status = {result.message}')
+        return self
+
+    def cost(self):
+        """
+        Returns the coefficients of the numerator of the LCOH,
+        1000 * (CAPEX + mean OPEX), whose ratio to Y is the LCOH.
+        """
+        col = self.columns
+        scenarios = col.shape['OPEX'][0]
+        cost = zeros(len(self.c))
+        cost[col('CAPEX')] = 1000.0
+        cost[col('OPEX', arange(scenarios))] = 1000.0 / scenarios
+        return cost
+
+    @staticmethod
+    def _linear(c, A, row_lower, row_upper, col_lower, col_upper):
+        """
+        Solves a linear program, returning the scipy result or None if it is
+        unbounded or infeasible.
+        """
+        result = milp(
+            c, constraints=LinearConstraint(A, row_lower, row_upper),
+            bounds=Bounds(col_lower, col_upper)
+        )
+        return result if result.success else None
+
+    def integer_bounds(self):
+        """
+        Returns finite upper bounds of the integer columns: their own bound or
+        the tightest row on the column alone (e.g. active_train_limit), and
+        otherwise the maximum of the column over the LP relaxation.
+        """
+        upper = self.col_upper.copy()
+        single = flatnonzero(diff(self.A.indptr) == 1)
+        columns = self.A.indices[self.A.indptr[single]]
+        coefficients = self.A.data[self.A.indptr[single]]
+        limit = where(coefficients > 0, self.row_upper[single], self.row_lower[single]) / coefficients
+        limited = isfinite(limit)
+        minimum.at(upper, columns[limited], limit[limited])
+
+        integer = flatnonzero(self.integrality == 1)
+        for column in integer[~isfinite(upper[integer])]:
+            objective = zeros(len(self.c))
+            objective[column] = -1.0
+            result = self._linear(
+                objective, self.A, self.row_lower, self.row_upper, self.col_lower, self.col_upper
+            )
+            if result is None:
+                raise ValueError(
+                    f'Integer column {column} is unbounded in the LP relaxation, '
+                    'so it cannot be expanded into binaries.'
+                )
+            upper[column] = -result.fun
+        return floor(upper[integer] + 1e-6)
+
+    def _homogenise(self, scale, col_lower, col_upper):
+        """
+        Returns the rows of the Charnes-Cooper transformation over the columns
+        z and t (see charnes_cooper) for the given bounds of x.
+
+        Returns:
+            tuple: A, row_lower, row_upper, z_lower and z_upper.
+        """
+        col = self.columns
+        n = len(self.c)
+        keep = ones(self.A.shape[0], dtype=bool)
+        keep[slice(*self.blocks['NPV'])] = False
+        A, lower, upper = self.A[keep], self.row_lower[keep], self.row_upper[keep]
+        col_lower, col_upper = col_lower.copy(), col_upper.copy()
+        col_lower[col('Z')], col_upper[col('Z')] = -inf, inf
+
+        # Zero and infinite bounds stay bounds of z, the others become rows against t
+        equal = isfinite(lower) & (lower == upper)
+        below = isfinite(lower) & ~equal
+        above = isfinite(upper) & ~equal
+        bounded_below = isfinite(col_lower) & (col_lower != 0)
+        bounded_above = isfinite(col_upper) & (col_upper != 0)
+        identity = eye(n, format='csr')
+        rows, row_lower, row_upper = [], [], []
+        for block, t_column, low, high in (
+            (A[equal], -lower[equal], 0.0, 0.0),
+            (A[below], -lower[below], 0.0, inf),
+            (A[above], -upper[above], -inf, 0.0),
+            (identity[bounded_below], -col_lower[bounded_below], 0.0, inf),
+            (identity[bounded_above], -col_upper[bounded_above], -inf, 0.0),
+        ):
+            block = block.tocoo()
+            size = block.shape[0]
+            rows.append(coo_matrix(
+                (concatenate([block.data, t_column]),
+                 (concatenate([block.row, arange(size)]), concatenate([block.col, full(size, n)]))),
+                shape=(size, n + 1)
+            ))
+            row_lower.append(full(size, low))
+            row_upper.append(full(size, high))
+
+        z_lower = where(col_lower == 0, 0.0, -inf)
+        z_upper = where(col_upper == 0, 0.0, inf)
+        z_lower[col('Z')] = z_upper[col('Z')] = 0.0
+        z_lower[col('Y')] = z_upper[col('Y')] = scale
+        A = vstack(rows).tocsr()
+        A.eliminate_zeros()
+        return A, concatenate(row_lower), concatenate(row_upper), z_lower, z_upper
+
+    def _relaxed_lcoh(self, scale=1.0, col_lower=None, col_upper=None):
+        """
+        Minimises the LCOH of the LP relaxation for the given bounds of x.
+
+        Returns:
+            tuple: x and the LCOH, or None if no plan with Y > 0 exists.
+        """
+        n = len(self.c)
+        A, lower, upper, z_lower, z_upper = self._homogenise(
+            scale,
+            self.col_lower if col_lower is None else col_lower,
+            self.col_upper if col_upper is None else col_upper
+        )
+        result = self._linear(
+            concatenate([self.cost() / scale, [0.0]]), A, lower, upper,
+            concatenate([z_lower, [0.0]]), concatenate([z_upper, [inf]])
+        )
+        if result is None or result.x[n] <= 0:
+            return None
+        return self._unscale(result.x, result.fun), result.fun
+
+    def _unscale(self, solution, lcoh):
+        """
+        Maps a solution of the transformation back to x = z / t, with Z set to the LCOH.
+        """
+        n = len(self.c)
+        x = solution[:n] / solution[n]
+        x[self.columns('Z')] = lcoh
+        return x
+
+    def charnes_cooper(self, max_lcoh, scale=1.0, relax=False):
+        """
+        Returns the Charnes-Cooper transformation of the LCOH ratio: with the
+        scale t = scale / Y and z = t * x, minimising 1000 * (CAPEX + mean OPEX) / Y
+        becomes the linear problem
+
+            minimise cost @ z / scale  subject to  row_lower * t <= A @ z <= row_upper * t,
+                                                   col_lower * t <= z <= col_upper * t,
+                                                   z[Y] = scale, t >= 0,
+
+        where the NPV row, the only one with the hydrogen price, is dropped.
+        Integer columns do not survive the scaling, so each one is expanded
+        into binaries b with x = sum(2**k * b[k]), and the products w[k] = t * b[k]
+        are linearised exactly with bounds t_lower <= t <= t_upper:
+
+            t_lower * b <= w <= t_upper * b,
+            t - t_upper * (1 - b) <= w <= t - t_lower * (1 - b),
+            z = sum(2**k * w[k]).
+
+        Each expanded column also keeps an integer copy y = sum(2**k * b[k]),
+        so the solver can branch on the integer rather than on its bits.
+
+        The bounds on t are its extremes over the plans of the LP relaxation
+        with an LCOH up to max_lcoh, so the result is exact when the minimum
+        LCOH is at most max_lcoh.
+
+        Args:
+            max_lcoh (float): Upper bound on the minimum LCOH, e.g. the LCOH of a known plan.
+            scale (float): Production Y at which t = 1, close to the optimal Y
+                to keep the problem well scaled.
+            relax (bool): Whether to drop the integrality instead of expanding it.
+
+        Returns:
+            tuple: c, A, row_lower, row_upper, col_lower, col_upper and
+            integrality over the columns z, t, w, b and y, in this order.
+        """
+        n = len(self.c)
+        cost = concatenate([self.cost() / scale, [0.0]])
+        integer = zeros(0, dtype=int64) if relax else flatnonzero(self.integrality == 1)
+        col_upper = self.col_upper.copy()
+        if len(integer):
+            col_upper[integer] = self.integer_bounds()
+        A, lower, upper, z_lower, z_upper = self._homogenise(scale, self.col_lower, col_upper)
+        x_lower, x_upper = concatenate([z_lower, [0.0]]), concatenate([z_upper, [inf]])
+
+        t_lower, t_upper = 0.0, inf
+        if len(integer):
+            bounded = vstack([A, coo_matrix(cost[None, :])]).tocsr()
+            bounded_lower, bounded_upper = concatenate([lower, [-inf]]), concatenate([upper, [max_lcoh]])
+            objective = zeros(n + 1)
+            objective[n] = 1.0
+            smallest = self._linear(objective, bounded, bounded_lower, bounded_upper, x_lower, x_upper)
+            largest = self._linear(-objective, bounded, bounded_lower, bounded_upper, x_lower, x_upper)
+            if smallest is None or largest is None:
+                raise ValueError(f'The LP relaxation has no plan with an LCOH up to {max_lcoh}.')
+            t_lower, t_upper = smallest.fun, -largest.fun
+
+        # Binary expansion of the integer columns
+        expanded = integer[col_upper[integer] >= 1]
+        bits = array([int(col_upper[i]).bit_length() for i in expanded], dtype=int64)
+        B = int(bits.sum())
+        width = n + 1 + 2 * B + len(expanded)
+        A = A.tocoo()
+        rows = [coo_matrix((A.data, (A.row, A.col)), shape=(A.shape[0], width))]
+        row_lower, row_upper = [lower], [upper]
+        if B:
+            w, b, t = n + 1 + arange(B), n + 1 + B + arange(B), full(B, n)
+            power = 2.0 ** (arange(B) - repeat(bits.cumsum() - bits, bits))
+            owner = repeat(arange(len(expanded)), bits)
+            # z = sum(2**k * w[k])
+            rows.append(coo_matrix(
+                (concatenate([ones(len(expanded)), -power]),
+                 (concatenate([arange(len(expanded)), owner]), concatenate([expanded, w]))),
+                shape=(len(expanded), width)
+            ))
+            row_lower.append(zeros(len(expanded)))
+            row_upper.append(zeros(len(expanded)))
+            y = n + 1 + 2 * B + arange(len(expanded))
+            rows.append(coo_matrix(
+                (concatenate([ones(len(expanded)), -power]),
+                 (concatenate([arange(len(expanded)), owner]), concatenate([y, b]))),
+                shape=(len(expanded), width)
+            ))
+            row_lower.append(zeros(len(expanded)))
+            row_upper.append(zeros(len(expanded)))
+            unit = ones(B)
+            for columns, values, low, high in (
+                ((w, b), (unit, -t_upper * unit), -inf, 0.0),
+                ((w, b), (unit, -t_lower * unit), 0.0, inf),
+                ((w, t, b), (unit, -unit, -t_upper * unit), -t_upper, inf),
+                ((w, t, b), (unit, -unit, -t_lower * unit), -inf, -t_lower),
+            ):
+                rows.append(coo_matrix(
+                    (concatenate(values), (tile(arange(B), len(columns)), concatenate(columns))),
+                    shape=(B, width)
+                ))
+                row_lower.append(full(B, low))
+                row_upper.append(full(B, high))
+
+        A = vstack(rows).tocsr()
+        A.eliminate_zeros()
+        return (
+            concatenate([cost, zeros(2 * B + len(expanded))]), A,
+            concatenate(row_lower), concatenate(row_upper),
+            concatenate([x_lower, zeros(2 * B + len(expanded))]),
+            concatenate([x_upper[:n], [t_upper], full(B, inf), ones(B), col_upper[expanded]]),
+            concatenate([zeros(n + 1 + B), ones(B + len(expanded))]),
+        )
+
+    def fractional(self, max_lcoh=None, mip_percentage=5, time_limit=None, verbose=True, relax=False):
+        """
+        Minimises the LCOH in a single solve of its Charnes-Cooper transformation
+        (see charnes_cooper), independent of the hydrogen price of the model.
+        The MIP gap applies to the LCOH itself. The solution is mapped back to
+        x = z / t, with Z set to the LCOH, so values() reads as after solve().
+
+        The LP relaxation is solved first: its production scales the
+        transformation and its LCOH bounds the minimum from below. Without
+        max_lcoh, the plan with the integer columns of the relaxation rounded
+        and fixed gives max_lcoh; it is returned without the MILP if it is
+        within the MIP gap of the relaxation, and kept if the MILP finds nothing better.
+
+        The model must be built with booleans['net_present_value'] = True, as the
+        constructor only assembles the linear NPV objective. The NPV row, the only
+        one with the hydrogen price, is dropped from the transformation, so any
+        placeholder hydrogen_price gives the same result.
+
+        Parameters:
+        .. max_lcoh (float): Upper bound on the minimum LCOH (default is the
+           LCOH of the rounded LP relaxation).
+        .. mip_percentage (float): MIP gap percentage for the solver.
+        .. time_limit (float): Time limit for the solver in seconds (default is None).
+        .. verbose (bool): Whether to print the solver log.
+        .. relax (bool): Whether to minimise the LCOH of the LP relaxation.
+        """
+        start_time = time.time()
+        relaxed = self._relaxed_lcoh()
+        if relaxed is None:
+            raise ValueError('The LP relaxation has no plan with a positive production.')
+        x, lcoh = relaxed
+        scale = x[self.columns('Y')]
+
+        incumbent = None
+        integer = self.integrality == 1
+        if not relax and max_lcoh is None:
+            col_lower, col_upper = self.col_lower.copy(), self.col_upper.copy()
+            col_lower[integer] = col_upper[integer] = rint(x[integer])
+            incumbent = self._relaxed_lcoh(scale, col_lower, col_upper)
+            if incumbent is None:
+                raise ValueError('The rounded LP relaxation is infeasible, pass max_lcoh.')
+            max_lcoh = incumbent[1]
+
+        if relax:
+            self.x, self.objective, self.status = x, lcoh, 'LP relaxation'
+        elif incumbent is not None and max_lcoh - lcoh <= mip_percentage / 100 * max_lcoh:
+            self.x, self.objective = incumbent
+            self.status = 'Rounded LP relaxation within the MIP gap'
+        else:
+            c, A, lower, upper, x_lower, x_upper, integrality = self.charnes_cooper(max_lcoh, scale)
+            options = {'disp': verbose, 'mip_rel_gap': mip_percentage / 100}
+            if time_limit is not None:
+                options['time_limit'] = max(0.0, time_limit - (time.time() - start_time))
+            result = milp(
+                c,
+                constraints=LinearConstraint(A, lower, upper),
+                integrality=integrality,
+                bounds=Bounds(x_lower, x_upper),
+                options=options,
+            )
+            self.status = result.message
+            if result.x is not None and (incumbent is None or result.fun <= incumbent[1]):
+                self.x, self.objective = self._unscale(result.x, result.fun), result.fun
+                self.x[integer] = rint(self.x[integer])
+            elif incumbent is not None:
+                self.x, self.objective = incumbent
+            else:
+                self.x = self.objective = None
+        print(f'[INFO] Charnes-Cooper solved in {time.time() - start_time:.2f} seconds. '
+              f'Status = {self.status}, LCOH = {self.objective} (LP relaxation {lcoh})')
+        return self
@@ -0,0 +1,195 @@
+"""
+This module renders the result figures headlessly. Every figure is drawn on an
+explicit Figure with the Agg canvas from the arrays of a SolutionStore, so
+rendering needs neither the Pyomo instance nor the global pyplot state, and
+the figures of one or many solutions can be rendered in a process pool.
+"""
+
+import os
+from itertools import product
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from matplotlib import rcParams, rc_context
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.ticker import MaxNLocator
+from numpy import zeros
+from .store import LCOHKernel, SolutionStore, hourly_values
+from .decimate import plot_paths
+
+COLORS = [
+    "#232333", "#000080", "#0000CD", "#008080", "#232333", "#C71585",
+    "#DC143C", "#006400", "#40E0D0", "#EE82EE", "#7B68EE", "#FF0000",
+    "#FF8C00", "#00FF7F", "#F5F5F5", "#00BFFF", "#F0E68C", "#AFEEEE",
+    "#FFB6C1", "#E6E6FA", "#FA8072", "#FFA500", "#98FB98"
+]
+LINEWIDTH = 1.25
+
+# Time series figures: the variables plotted, whether the inner index
+# (vectors or electrolysers) is stacked, the y label, the title and whether
+# the y axis starts at zero
+SERIES_FIGURES = {
+    'grid_energy': (
+        ('energy_grid',), False, 'Energy [GJ/h]', 'Grid Energy against Time', True
+    ),
+    'curtailed_energy': (
+        ('energy_curtailed', 'energy_wheeled'), False, 'Energy [GJ/h]',
+        'Curtailed Energy against Time', False
+    ),
+    'hydrogen_storage_tank_level': (
+        ('gh2_storage',), False, 'Hydrogen Storage at Origin [GJ]',
+        'Hydrogen Storage Against Time', True
+    ),
+    'origin_storage_tank_levels': (
+        ('vector_storage_origin',), False, 'Vector Storage at Origin [TJ]',
+        'Origin Vector Storage Against Time', True
+    ),
+    'hydrogen_production': (
+        ('energy_electrolysers',), True, 'Hydrogen Production [GJ/h]',
+        'Hydrogen Production Against Time', True
+    ),
+    'vector_production': (
+        ('energy_vector_production_flux',), True, 'Vector Production [GJ/h]',
+        'Vector Production Against Time', False
+    ),
+    'active_trains': (
+        ('number_active_trains',), True, 'Number Active Trains',
+        'Number Active Trains Against Time', True
+    ),
+}
+FIGURES = ('wind_energy', *SERIES_FIGURES, 'objective_cdf')
+
+
+def style_axes(ax):
+    """
+    Applies the tick settings shared by every figure.
+    """
+    ax.yaxis.set_major_locator(MaxNLocator(integer=True))
+    ax.minorticks_on()
+    ax.tick_params(which='minor', length=2, width=1, direction='out', labelsize=0)
+
+
+def draw_wind_energy(ax, store, decimate=None, max_points=2000):
+    n_scenarios, n_hours = store.nodes.hour_nodes.shape
+    power = zeros((n_scenarios, n_hours))
+    if store['wind']:
+        power += hourly_values(store, 'turbine_power') * int(store['capacity_number_turbines'])
+    if store['solar']:
+        power += 0.0036 * hourly_values(store, 'solar_power') * int(store['capacity_solar'])
+    plot_paths(ax, power, COLORS, LINEWIDTH, mode=decimate, max_points=max_points)
+    ax.set(xlabel='Time [h]', ylabel='Energy [GJ/h]', title='Renewable Energy against Time')
+    ax.set_ylim(bottom=0)
+
+
+def draw_series(ax, store, name, decimate=None, max_points=2000):
+    names, stacked, ylabel, title, from_zero = SERIES_FIGURES[name]
+    names = [
+        variable for variable in names
+        if variable in store and (variable != 'energy_wheeled' or store['grid_wheel'])
+    ]
+    values = sum(hourly_values(store, variable) for variable in names)
+    labels = None
+    if values.ndim == 3:
+        # The inner index set, vectors or electrolysers, labels the lines
+        labels = getattr(store, store.meta['variables'][names[0]][1])
+        if stacked:
+            values = values.cumsum(axis=2)
+    plot_paths(ax, values, COLORS, LINEWIDTH, labels, decimate, max_points)
+    if labels is not None:
+        ax.legend()
+    ax.set(xlabel='Time [h]', ylabel=ylabel, title=title)
+    if from_zero:
+        ax.set_ylim(bottom=0)
+
+
+def draw_objective_cdf(ax, store):
+    ax.hist(LCOHKernel.from_store(store).cdf()[0], bins=7, alpha=0.7, color=COLORS[0], edgecolor='black')
+    ax.set(
+        xlabel='Average Hydrogen (equivalent) Production [kg/h]',
+        ylabel='Probability Density',
+        title='Probability Conditioned Objective Values'
+    )
+
+
+def render_figure(key, name, directory, solution_dir=None, quality=150, fmt='png',
+                  decimate=None, max_points=2000):
+    """
+    Renders one figure of a stored solution to {directory}/{key}/{name}.{fmt}.
+    This runs inside the worker processes of render_figures.
+
+    Args:
+        key (str): Key of the stored solution.
+        name (str): One of FIGURES.
+        directory (str): Output directory.
+        solution_dir (str): Parent directory of the stored solutions (default is tmp/post).
+        quality (int): Resolution of the figure in dots per inch.
+        fmt (str): Image format passed to savefig.
+        decimate (str): None to plot every hour, 'minmax' or 'bands' (see plot_paths).
+        max_points (int): Maximum number of points per line when decimating.
+
+    Returns:
+        Path: The file written.
+    """
+    if name not in FIGURES:
+        raise ValueError(f"Unknown figure '{name}', expected one of {', '.join(FIGURES)}")
+    store = SolutionStore.load(key, solution_dir)
+    target = Path(directory) / key / f'{name}.{fmt}'
+    target.parent.mkdir(parents=True, exist_ok=True)
+
+    style = {'font.family': 'serif', 'font.serif': ['CMU Serif'] + list(rcParams['font.serif'])}
+    with rc_context(style):
+        figure = Figure(dpi=quality)
+        FigureCanvasAgg(figure)
+        ax = figure.add_subplot()
+        if name == 'wind_energy':
+            draw_wind_energy(ax, store, decimate, max_points)
+        elif name == 'objective_cdf':
+            draw_objective_cdf(ax, store)
+        else:
+            draw_series(ax, store, name, decimate, max_points)
+        style_axes(ax)
+        figure.savefig(target)
+    return target
+
+
+def render_figures(keys, directory, figures=FIGURES, workers=None, solution_dir=None,
+                   quality=150, fmt='png', decimate=None, max_points=2000):
+    """
+    Renders figures of one or many stored solutions concurrently in a process
+    pool, one task per solution and figure.
+
+    Args:
+        keys (str or list): Key(s) of the stored solutions, e.g. the points of a sweep.
+        directory (str): Output directory; each solution gets a subfolder.
+        figures (tuple): Names of the figures to render (default is every figure).
+        workers (int): Number of worker processes (default is one per task,
+            capped at os.cpu_count()).
+        solution_dir (str): Parent directory of the stored solutions (default is tmp/post).
+        quality (int): Resolution of the figures in dots per inch.
+        fmt (str): Image format passed to savefig.
+        decimate (str): None to plot every hour, 'minmax' or 'bands' (see plot_paths).
+        max_points (int): Maximum number of points per line when decimating.
+
+    Returns:
+        dict: Path of every rendered figure keyed by (key, figure).
+    """
+    keys = [keys] if isinstance(keys, str) else list(keys)
+    tasks = list(product(keys, figures))
+    workers = max(1, workers or min(len(tasks), os.cpu_count() or 1))
+    rendered = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(
+                render_figure, key, name, directory, solution_dir, quality, fmt,
+                decimate, max_points
+            ): (key, name)
+            for key, name in tasks
+        }
+        for future in as_completed(futures):
+            key, name = futures[future]
+            try:
+                rendered[key, name] = future.result()
+            except Exception as e:
+                print(f'Failed Render {key} {name}: {e}')
+    print(f'[INFO] Rendered {len(rendered)} of {len(tasks)} figures to {directory} on {workers} workers')
+    return rendered
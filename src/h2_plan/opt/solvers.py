@@ -0,0 +1,375 @@
+"""
+This module holds the solver backends used by H2Planning.class_solve and the
+scenario decompositions. A backend translates the generic solve settings (MIP
+gap, tolerances, seed, threads, time limit, log file) into the options of one
+solver and records what the solver can do, so the same call solves with
+Gurobi, HiGHS, SCIP or CBC.
+
+Capabilities of the registered backends:
+.. mip_start: The solver accepts a MIP start from the variable values (warmstart=True).
+.. persistent: The instance can be kept loaded in the solver between solves.
+.. threads: The number of solver threads can be set.
+
+    backend   factory       mip_start  persistent          threads
+    gurobi    gurobi        yes        gurobi_persistent   yes
+    highs     appsi_highs   yes        native              yes
+    cbc       cbc           yes        no                  yes
+    scip      scip          no         no                  no
+"""
+
+import os
+import re
+import time
+from math import ceil, isfinite
+from pathlib import Path
+from pyomo.environ import SolverFactory
+
+# Generic settings understood by SolverBackend.options
+SETTINGS = ('mip_gap', 'feasibility', 'optimality', 'seed', 'threads', 'time_limit', 'log_file')
+
+
+def cgroup_cpus(root='/sys/fs/cgroup'):
+    """
+    Returns the CPU quota of the cgroup of the process as a number of CPUs
+    (cgroup v2 cpu.max, or v1 cpu.cfs_quota_us), or None without a limit.
+    """
+    root = Path(root)
+    try:
+        quota, period = (root / 'cpu.max').read_text().split()[:2]
+        if quota != 'max':
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        quota = int((root / 'cpu' / 'cpu.cfs_quota_us').read_text())
+        period = int((root / 'cpu' / 'cpu.cfs_period_us').read_text())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def available_threads():
+    """
+    Returns the number of CPUs this process may use: the CPUs it is pinned to,
+    further limited by the CPU quota of its cgroup (e.g. a batch job or
+    container limit).
+    """
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+    quota = cgroup_cpus()
+    if quota is not None:
+        count = min(count, ceil(quota))
+    return max(1, count)
+
+
+class Deadline:
+    """
+    A wall-clock budget shared by the build, the solves and the iterations of
+    a run: every solve is given the time that remains.
+
+    Attributes:
+    .. end: Time (as returned by time.time) at which the budget runs out.
+    """
+
+    def __init__(self, seconds, start=None):
+        self.end = (time.time() if start is None else start) + seconds
+
+    @classmethod
+    def coerce(cls, budget):
+        """
+        Returns a Deadline from a Deadline, a number of seconds from now, or None.
+        """
+        if budget is None or isinstance(budget, cls):
+            return budget
+        return cls(budget)
+
+    def remaining(self):
+        return max(0.0, self.end - time.time())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def limit(self, time_limit=None):
+        """
+        Returns the time limit of the next solve: the remaining time, or
+        time_limit if it is shorter.
+        """
+        remaining = self.remaining()
+        return remaining if time_limit is None else min(time_limit, remaining)
+
+
+class SolverBackend:
+    """
+    Translates the generic solve settings into the options of one solver.
+    Unregistered solvers get a plain SolverBackend, which passes no options.
+
+    Attributes:
+    .. name: Name of the backend, as given to class_solve.
+    .. factory: Name of the solver passed to SolverFactory.
+    .. persistent: Name of the persistent solver, 'native' if the factory
+       solver is persistent itself, or None.
+    .. mip_start: Whether the solver accepts a MIP start.
+    .. threads: Whether the number of threads can be set.
+    .. option_names: Generic setting to the name of the solver option; settings
+       missing here are not passed to the solver (the log file is then passed
+       as the logfile keyword of solve).
+    .. verbose_options: Options set when the solver log is shown.
+    .. quiet_options: Options set when the solver log is hidden.
+    """
+    name = None
+    factory = None
+    persistent = None
+    mip_start = False
+    threads = False
+    option_names = {}
+    verbose_options = {}
+    quiet_options = {}
+
+    def __init__(self, name=None):
+        if name is not None:
+            self.name = self.factory = name
+            self.persistent = f'{name}_persistent'
+
+    def available(self):
+        """
+        Returns whether the solver is installed.
+        """
+        try:
+            return bool(SolverFactory(self.factory).available(exception_flag=False))
+        except Exception:
+            return False
+
+    def create(self, persistent=False):
+        """
+        Returns a new solver, persistent if requested.
+        """
+        if not persistent or self.persistent == 'native':
+            return SolverFactory(self.factory)
+        if self.persistent is None:
+            raise ValueError(f"Solver '{self.name}' has no persistent interface")
+        return SolverFactory(self.persistent)
+
+    def options(self, verbose=True, **settings):
+        """
+        Returns the solver options of the generic settings (see SETTINGS);
+        settings that are None or not supported by the solver are left out.
+        """
+        unknown = set(settings) - set(SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown solver settings {sorted(unknown)}, expected {', '.join(SETTINGS)}")
+        if not verbose:
+            settings.pop('log_file', None)
+        options = dict(self.verbose_options if verbose else self.quiet_options)
+        for setting, setting_value in settings.items():
+            if setting_value is not None and setting in self.option_names:
+                options[self.option_names[setting]] = setting_value
+        return options
+
+    def configure(self, solver, verbose=True, log_file=None, **settings):
+        """
+        Sets the options of a solver from the generic settings.
+
+        Returns:
+            dict: Keyword arguments for the solve call.
+        """
+        for option, option_value in self.options(verbose, log_file=log_file, **settings).items():
+            solver.options[option] = option_value
+        solve_kwargs = {'tee': verbose}
+        if verbose and log_file is not None and 'log_file' not in self.option_names:
+            solve_kwargs['logfile'] = log_file
+        return solve_kwargs
+
+    def solve(self, solver, instance, persistent=False, **solve_kwargs):
+        """
+        Solves an instance; a persistent solver solves the instance it holds.
+        """
+        if persistent and self.persistent != 'native':
+            return solver.solve(**solve_kwargs)
+        return solver.solve(instance, **solve_kwargs)
+
+    def refresh(self, solver, constraint):
+        """
+        Pushes a constraint whose coefficients changed to a persistent solver.
+        """
+        solver.remove_constraint(constraint)
+        solver.add_constraint(constraint)
+
+    def refresh_objective(self, solver, objective):
+        """
+        Pushes an objective whose coefficients changed to a persistent solver.
+        """
+        solver.set_objective(objective)
+
+    def log_offset(self, log_file):
+        """
+        Returns where the log of the next solve will start in log_file: solvers
+        writing their own log append to it, while the logfile of solve is
+        rewritten.
+        """
+        path = Path(log_file)
+        return path.stat().st_size if 'log_file' in self.option_names and path.exists() else 0
+
+    def first_incumbent(self, log_file, offset=0):
+        """
+        Returns the seconds until the first incumbent of a solve, as reported in
+        its log from offset on, or None if the log does not report one.
+        """
+        try:
+            with open(log_file, 'r', errors='replace') as f:
+                f.seek(offset)
+                log = f.read()
+        except OSError:
+            return None
+        return self.incumbent_time(log)
+
+    def incumbent_time(self, log):
+        return None
+
+
+class GurobiBackend(SolverBackend):
+    name = 'gurobi'
+    factory = 'gurobi'
+    persistent = 'gurobi_persistent'
+    mip_start = True
+    threads = True
+    option_names = {
+        'mip_gap': 'MIPGap', 'feasibility': 'FeasibilityTol', 'optimality': 'OptimalityTol',
+        'seed': 'Seed', 'threads': 'Threads', 'time_limit': 'TimeLimit', 'log_file': 'LogFile',
+    }
+    verbose_options = {'LogToConsole': 1}
+    quiet_options = {'LogToConsole': 0, 'OutputFlag': 0}
+
+    def incumbent_time(self, log):
+        # A MIP start or heuristic solution found before the branch and bound
+        # is counted at 0 seconds; later ones are the H and * rows of the tree
+        for line in log.splitlines():
+            if line.startswith(('Loaded user MIP start', 'Found heuristic solution')):
+                return 0.0
+            match = re.match(r'^\s*[H*]\s.*\s(\d+)s$', line)
+            if match:
+                return float(match.group(1))
+        return None
+
+
+class HighsBackend(SolverBackend):
+    """
+    HiGHS through appsi, which keeps the instance loaded and only pushes the
+    changes on every solve.
+    """
+    name = 'highs'
+    factory = 'appsi_highs'
+    persistent = 'native'
+    mip_start = True
+    threads = True
+    option_names = {
+        'mip_gap': 'mip_rel_gap', 'feasibility': 'primal_feasibility_tolerance',
+        'optimality': 'dual_feasibility_tolerance', 'seed': 'random_seed',
+        'threads': 'threads', 'time_limit': 'time_limit', 'log_file': 'log_file',
+    }
+
+    def refresh(self, solver, constraint):
+        # appsi updates the changed parameters itself before every solve
+        pass
+
+    def refresh_objective(self, solver, objective):
+        pass
+
+    def incumbent_time(self, log):
+        # First row of the branch and bound table with a finite BestSol
+        table = False
+        for line in log.splitlines():
+            tokens = line.split()
+            if 'BestSol' in tokens:
+                table = True
+            if not table or len(tokens) < 12 or not tokens[-1].endswith('s'):
+                continue
+            try:
+                best, seconds = float(tokens[-7]), float(tokens[-1][:-1])
+            except ValueError:
+                continue
+            if isfinite(best):
+                return seconds
+        return None
+
+
+class CbcBackend(SolverBackend):
+    name = 'cbc'
+    factory = 'cbc'
+    mip_start = True
+    threads = True
+    option_names = {
+        'mip_gap': 'ratioGap', 'feasibility': 'primalTolerance', 'optimality': 'dualTolerance',
+        'seed': 'randomCbcSeed', 'threads': 'threads', 'time_limit': 'seconds',
+    }
+    verbose_options = {'logLevel': 1}
+
+    def incumbent_time(self, log):
+        match = re.search(r'Integer solution of .*\(([\d.]+) seconds\)', log)
+        return float(match.group(1)) if match else None
+
+
+class ScipBackend(SolverBackend):
+    """
+    SCIP through its AMPL interface. The standard SCIP build solves on a
+    single thread, so the threads setting is not passed.
+    """
+    name = 'scip'
+    factory = 'scip'
+    option_names = {
+        'mip_gap': 'limits/gap', 'feasibility': 'numerics/feastol',
+        'optimality': 'numerics/dualfeastol', 'seed': 'randomization/randomseedshift',
+        'time_limit': 'limits/time',
+    }
+
+
+BACKENDS = {}
+
+
+def register_backend(backend, *aliases):
+    """
+    Registers a backend under its name and any aliases, replacing a previous
+    backend of the same name.
+    """
+    for name in (backend.name, *aliases):
+        BACKENDS[name] = backend
+    return backend
+
+
+def get_backend(solver):
+    """
+    Returns the backend of a solver name, or a plain SolverBackend for solvers
+    that are not registered.
+    """
+    return BACKENDS.get(solver) or SolverBackend(solver)
+
+
+def capability_matrix():
+    """
+    Returns the capabilities of every registered backend.
+
+    Returns:
+        dict: Backend name to its factory, mip_start, persistent, threads and
+        available entries.
+    """
+    backends = {id(backend): backend for backend in BACKENDS.values()}.values()
+    return {
+        backend.name: {
+            'factory': backend.factory,
+            'mip_start': backend.mip_start,
+            'persistent': backend.persistent,
+            'threads': backend.threads,
+            'available': backend.available(),
+        }
+        for backend in backends
+    }
+
+
+register_backend(GurobiBackend())
+register_backend(HighsBackend(), 'appsi_highs')
+register_backend(CbcBackend())
+register_backend(ScipBackend())
@@ -0,0 +1,369 @@
+"""
+This module implements a compact, columnar store for solved instances. Each
+indexed variable is written as one .npy array, the grid index is written once
+as integer arrays, and everything can be loaded memory-mapped, so that
+post-processing does not need to rebuild the Pyomo model.
+"""
+
+import json
+from functools import cached_property
+from pathlib import Path
+from numpy import (
+    arange, array, array_equal, asarray, errstate, isfinite, load, nan, save, sort, where
+)
+from pyomo.environ import Param, Var, value
+from .vars.nodes import NodeIndex
+
+SOLUTION_DIR = Path(__file__).resolve().parent.parent / 'tmp' / 'post'
+
+# NodeIndex array mapping every node to its entry of each node-like index set
+NODE_SETS = {'full_set': None, 'vector_param_set': 'vector', 'shipping_param_set': 'shipping'}
+
+
+class SolutionStore:
+    """
+    Read access to a solution written by SolutionStore.write.
+
+    Layout of {directory}:
+    .. meta.json: Scalar variable and parameter values, parameters indexed by
+       vectors or electrolysers, and the index sets of each stored array.
+    .. nodes/{name}.npy: The NodeIndex arrays of the stochastic grid.
+    .. vars/{name}.npy: Variable values with shape (outer, inner), where outer
+       runs over the first index set and inner over vectors or electrolysers.
+    .. params/{name}.npy: Parameters indexed by full_set, in node order.
+
+    Attributes:
+    .. meta: The contents of meta.json.
+    .. nodes: The NodeIndex of the stochastic grid.
+    .. vectors, electrolysers, scenario: The small index sets of the model.
+    """
+
+    def __init__(self, directory, mmap_mode='r'):
+        """
+        Args:
+            directory (str): Directory of the stored solution.
+            mmap_mode (str): Memory-map mode passed to numpy.load (None to read into memory).
+        """
+        self.directory = Path(directory)
+        self.mmap_mode = mmap_mode
+        with open(self.directory / 'meta.json', 'r') as f:
+            self.meta = json.load(f)
+        self.nodes = NodeIndex.from_arrays({
+            path.stem: load(path, mmap_mode=mmap_mode)
+            for path in (self.directory / 'nodes').glob('*.npy')
+        })
+        self.vectors = self.meta['sets']['vectors']
+        self.electrolysers = self.meta['sets']['electrolysers']
+        self.scenario = self.meta['sets']['scenario']
+
+    def __getitem__(self, name):
+        """
+        Returns a scalar variable or parameter, or a parameter indexed by
+        vectors or electrolysers as a dictionary.
+        """
+        return self.meta['values'][name]
+
+    def __contains__(self, name):
+        return (
+            name in self.meta['values']
+            or name in self.meta['variables']
+            or name in self.meta['series']
+        )
+
+    def values(self, name):
+        """
+        Returns the values of an indexed variable as an array of shape (outer, inner).
+        """
+        return load(self.directory / 'vars' / f'{name}.npy', mmap_mode=self.mmap_mode)
+
+    def series(self, name):
+        """
+        Returns a parameter indexed by full_set as an array in node order.
+        """
+        return load(self.directory / 'params' / f'{name}.npy', mmap_mode=self.mmap_mode)
+
+    def same_grid(self, nodes):
+        """
+        Returns whether the solution was stored for the same stochastic grid as
+        a NodeIndex, so that its arrays line up with the variables of the model.
+        """
+        ours, theirs = self.nodes.to_arrays(), nodes.to_arrays()
+        return ours.keys() == theirs.keys() and all(
+            array_equal(ours[name], theirs[name]) for name in ours
+        )
+
+    def load_start(self, instance, names=None):
+        """
+        Sets the variables of an instance to the stored solution, as a MIP start
+        for a model with the same grid (e.g. a neighbouring sweep point).
+        Integer variables are rounded; missing values are left unset.
+
+        Args:
+            instance: The Pyomo model instance to start.
+            names (list): Variables to set (default is every stored variable).
+
+        Returns:
+            int: The number of values set, 0 if the grids differ.
+        """
+        if not self.same_grid(NodeIndex(instance)):
+            return 0
+        count = 0
+        for var in instance.component_objects(Var, descend_into=False):
+            name = var.local_name
+            if names is not None and name not in names:
+                continue
+            if not var.is_indexed():
+                data = [self.meta['values'].get(name)]
+            elif name in self.meta['variables']:
+                data = self.values(name).ravel()
+            else:
+                continue
+            if len(data) != len(var):
+                continue
+            for var_data, x in zip(var.values(), data):
+                if x is None or not isfinite(x) or var_data.fixed:
+                    continue
+                var_data.set_value(round(x) if var_data.is_integer() else float(x), skip_validation=True)
+                count += 1
+        return count
+
+    @classmethod
+    def load(cls, key, directory=None, mmap_mode='r'):
+        """
+        Loads the solution stored under a key.
+
+        Args:
+            key (str): A string used to identify the model.
+            directory (str): Parent directory of the stored solutions (default is tmp/post).
+            mmap_mode (str): Memory-map mode passed to numpy.load.
+        """
+        return cls(Path(directory or SOLUTION_DIR) / key, mmap_mode=mmap_mode)
+
+    @staticmethod
+    def write(instance, key, directory=None):
+        """
+        Writes a solved instance to {directory}/{key}.
+
+        Args:
+            instance: The solved Pyomo model instance.
+            key (str): A string used to identify the model.
+            directory (str): Parent directory of the stored solutions (default is tmp/post).
+
+        Returns:
+            Path: The directory the solution was written to.
+        """
+        target = Path(directory or SOLUTION_DIR) / key
+        for folder in ('nodes', 'vars', 'params'):
+            (target / folder).mkdir(parents=True, exist_ok=True)
+
+        nodes = NodeIndex(instance)
+        for name, data in nodes.to_arrays().items():
+            save(target / 'nodes' / f'{name}.npy', data)
+
+        small_sets = ('vectors', 'electrolysers', 'scenario')
+        meta = {
+            'sets': {name: list(getattr(instance, name)) for name in small_sets},
+            'values': {},
+            'variables': {},
+            'series': [],
+        }
+
+        for var in instance.component_objects(Var, descend_into=False):
+            if not var.is_indexed():
+                meta['values'][var.local_name] = var.value
+                continue
+            subsets = [s.local_name for s in var.index_set().subsets()]
+            data = array([nan if v.value is None else v.value for v in var.values()], dtype=float)
+            inner = len(getattr(instance, subsets[1])) if len(subsets) > 1 else 1
+            save(target / 'vars' / f'{var.local_name}.npy', data.reshape(-1, inner))
+            meta['variables'][var.local_name] = subsets
+
+        for param in instance.component_objects(Param, descend_into=False):
+            if not param.is_indexed():
+                meta['values'][param.local_name] = value(param)
+            elif param.index_set() is instance.full_set:
+                save(target / 'params' / f'{param.local_name}.npy',
+                     array([value(param[node]) for node in nodes.nodes], dtype=float))
+                meta['series'].append(param.local_name)
+            elif param.index_set().local_name in small_sets:
+                meta['values'][param.local_name] = {
+                    str(index): value(param[index]) for index in param.index_set()
+                }
+
+        with open(target / 'meta.json', 'w') as f:
+            json.dump(meta, f)
+        return target
+
+
+class LCOHKernel:
+    """
+    Vectorised production and LCOH of a solution. The production flux, the
+    node durations and the leaf weights are read into arrays once, so the
+    production of every node, scenario and the expectation are array
+    operations over the grid.
+
+    Attributes:
+    .. nodes: The NodeIndex of the stochastic grid.
+    .. hourly: Discounted hydrogen production of every node, in the units of
+       the objective (8760 / end_time_index * amortisation_plant / 120 per
+       unit of flux and hour).
+    .. capex: The CAPEX of the solution.
+    .. opex: The OPEX of every scenario.
+    """
+
+    def __init__(self, nodes, flux, end_time_index, amortisation_plant, capex, opex):
+        """
+        Args:
+            nodes (NodeIndex): The index of the stochastic grid.
+            flux (array): energy_vector_production_flux with shape
+                (vector nodes, vectors).
+            end_time_index (int): The last time step.
+            amortisation_plant (float): The plant amortisation factor.
+            capex (float): The CAPEX of the solution.
+            opex (array): The OPEX of every scenario.
+        """
+        self.nodes = nodes
+        self.hourly = (
+            8760 / end_time_index * amortisation_plant
+            * asarray(flux, dtype=float).sum(axis=1)[nodes.vector] * nodes.duration / 120
+        )
+        self.capex = float(capex)
+        self.opex = asarray(opex, dtype=float)
+
+    @classmethod
+    def from_store(cls, store):
+        """
+        Reads the arrays of a stored solution (see SolutionStore).
+        """
+        return cls(
+            store.nodes, store.values('energy_vector_production_flux'),
+            store['end_time_index'], store['amortisation_plant'],
+            store['CAPEX'], store.values('OPEX')[:, 0]
+        )
+
+    @classmethod
+    def from_instance(cls, instance):
+        """
+        Reads the arrays of a solved instance, visiting every flux variable once.
+        """
+        nodes = NodeIndex(instance)
+        flux = instance.energy_vector_production_flux
+        vectors = list(instance.vectors)
+        return cls(
+            nodes,
+            array([
+                [flux[node, q].value or 0 for q in vectors] for node in nodes.vector_nodes
+            ], dtype=float).reshape(-1, len(vectors)),
+            value(instance.end_time_index), value(instance.amortisation_plant),
+            instance.CAPEX.value,
+            [instance.OPEX[s].value for s in instance.scenario]
+        )
+
+    @classmethod
+    def load(cls, source):
+        """
+        Returns the kernel of a SolutionStore or a solved instance.
+        """
+        if isinstance(source, cls):
+            return source
+        if isinstance(source, SolutionStore):
+            return cls.from_store(source)
+        return cls.from_instance(source)
+
+    @cached_property
+    def scenario_production(self):
+        """
+        Discounted production along the path of every scenario.
+        """
+        return self.nodes.ancestors(self.nodes.leaves) @ self.hourly
+
+    @cached_property
+    def expected_production(self):
+        """
+        Expected discounted production over the scenarios.
+        """
+        return float(self.nodes.leaf_weight @ self.hourly) / len(self.nodes.leaves)
+
+    def scenario_lcoh(self):
+        """
+        Returns the LCOH of every scenario, NaN where nothing is produced.
+        """
+        production = self.scenario_production
+        with errstate(divide='ignore', invalid='ignore'):
+            return where(production != 0, 1000 * (self.capex + self.opex) / production, nan)
+
+    def mean_lcoh(self):
+        """
+        Returns the LCOH of the expected costs and production, as used by the
+        Dinkelbach iterations.
+        """
+        return 1000 * (self.capex + self.opex.mean()) / self.expected_production
+
+    def cdf(self):
+        """
+        Returns the sorted LCOH of the scenarios that produce and their
+        cumulative probability.
+        """
+        lcoh = sort(self.scenario_lcoh())
+        lcoh = lcoh[isfinite(lcoh)]
+        return lcoh, arange(1, len(lcoh) + 1) / len(self.nodes.leaves)
+
+
+def scenario_lcoh(store):
+    """
+    Calculates the LCOH of each scenario from a stored solution.
+
+    Args:
+        store: The stored solution (SolutionStore), a solved instance or an
+            LCOHKernel.
+
+    Returns:
+        list: LCOH per scenario, or 'No Production' where nothing is produced.
+    """
+    return [
+        float(lcoh) if isfinite(lcoh) else 'No Production'
+        for lcoh in LCOHKernel.load(store).scenario_lcoh()
+    ]
+
+
+def hourly_values(source, name, nodes=None):
+    """
+    Extracts an indexed variable or node parameter as an array of shape
+    (scenario, hour), or (scenario, hour, inner) when it is also indexed by
+    vectors or electrolysers. Every scenario follows its path through the tree
+    and every node is repeated over its duration.
+
+    Args:
+        source: A solved instance or a SolutionStore.
+        name (str): A component whose first index set is full_set,
+            vector_param_set or shipping_param_set.
+        nodes (NodeIndex): The index of the grid, built from source if None.
+    """
+    if isinstance(source, SolutionStore):
+        nodes = source.nodes if nodes is None else nodes
+        if name in source.meta['variables']:
+            subsets, data = source.meta['variables'][name], source.values(name)
+        elif name in source.meta['series']:
+            subsets, data = ['full_set'], source.series(name).reshape(-1, 1)
+        else:
+            raise ValueError(f"'{name}' is not an indexed variable or node parameter of the solution")
+    else:
+        nodes = NodeIndex(source) if nodes is None else nodes
+        component = source.component(name)
+        if component is None or not component.is_indexed():
+            raise ValueError(f"'{name}' is not an indexed component of the instance")
+        subsets = [s.local_name for s in component.index_set().subsets()]
+        if isinstance(component, Var):
+            data = array([nan if v.value is None else v.value for v in component.values()], dtype=float)
+        else:
+            data = array([value(component[index]) for index in component.index_set()], dtype=float)
+        data = data.reshape(-1, len(source.component(subsets[1])) if len(subsets) > 1 else 1)
+
+    if subsets[0] not in NODE_SETS:
+        raise ValueError(
+            f"'{name}' is indexed by {subsets[0]}, expected one of {', '.join(NODE_SETS)}"
+        )
+    if NODE_SETS[subsets[0]] is not None:
+        data = data[getattr(nodes, NODE_SETS[subsets[0]])]
+    hourly = nodes.hourly(data)
+    return hourly if len(subsets) > 1 else hourly[:, :, 0]
@@ -5,7 +5,36 @@ from matplotlib.pyplot import (
     subplots, show, legend, gca, bar, xticks, fill_between, minorticks_on, tick_params
 )
 from matplotlib.ticker import MaxNLocator
-from numpy import array, zeros, size, floor, max
+from numpy import zeros
+from .vars.nodes import NodeIndex
+from .store import LCOHKernel, hourly_values
+from .decimate import plot_paths
+
+
+def hourly_array(self, name):
+    """
+    Returns an indexed variable or node parameter of the solved instance as an
+    array of shape (scenario, hour), or (scenario, hour, inner), see
+    hourly_values. The index of the grid is built once per instance.
+
+    Args:
+        name (str): Name of the variable or parameter.
+    """
+    cached = getattr(self, 'extract_index', None)
+    if cached is None or cached[0] is not self.instance:
+        self.extract_index = cached = (self.instance, NodeIndex(self.instance))
+    return hourly_values(self.instance, name, cached[1])
+
+
+def draw_paths(self, ax, values, labels=None):
+    """
+    Plots hourly paths with the colours and line width of the plots, decimated
+    as set by generate_plots (see plot_paths).
+    """
+    plot_paths(
+        ax, values, self.custom_cmap, self.linewidth, labels,
+        getattr(self, 'decimate', None), getattr(self, 'max_points', 2000)
+    )
 
 
 def wind_energy(self):
@@ -14,59 +43,23 @@ def wind_energy(self):
     """
     # Initialize the subplots environment and employ the custom color scheme.
     fig, ax = subplots()
-    cmap = self.custom_cmap
-
-    # Initialize a line counter to update the legend entry and color.
-    line_counter = 0
 
     # Initialize capacity factor dictionary for wind and solar.
     self.cap_factor = {'wind': [], 'solar': []}
 
-    # Loop through each scenario to plot energy data.
-    for s in self.instance.scenario:
-        power_wind = array(len(self.instance.time))
-        power_solar = array(len(self.instance.time))
-
-        # Calculate wind energy if wind turbines are present.
-        if self.instance.wind:
-            power_wind = array([
-                self.instance.turbine_power[(st)] for st in self.instance.full_set
-                for _ in range(st[2]) if st[0] == s
-            ]) * int(self.instance.capacity_number_turbines.value)
-            time = array([
-                (st[1], st[2]) for st in self.instance.full_set
-                for _ in range(st[2]) if st[0] == s
-            ])
-            self.cap_factor['wind'].append(
-                sum(power_wind) / (max(power_wind) * len(power_wind))
-            )
-
-        # Calculate solar energy if solar panels are present.
-        if self.instance.solar:
-            power_solar = array([
-                0.0036 * self.instance.solar_power[(st)] for st in self.instance.full_set
-                for _ in range(st[2]) if st[0] == s
-            ]) * int(self.instance.capacity_solar.value)
-            time = array([
-                (st[1], st[2]) for st in self.instance.full_set
-                for _ in range(st[2]) if st[0] == s
-            ])
-            self.cap_factor['solar'].append(
-                sum(power_solar) / (max(power_solar) * len(power_solar))
-            )
-
-        # Plot the combined wind and solar energy.
-        ax.plot(
-            range(time[0][0], time[-1][0] + time[-1][1]),
-            power_wind + power_solar,
-            color=cmap[line_counter],
-            linewidth=self.linewidth
-        )
+    # Renewable power along every scenario path.
+    n_hours = len(self.instance.time)
+    power_wind = zeros((len(self.instance.scenario), n_hours))
+    power_solar = zeros((len(self.instance.scenario), n_hours))
+    if self.instance.wind:
+        power_wind = hourly_array(self, 'turbine_power') * int(self.instance.capacity_number_turbines.value)
+        self.cap_factor['wind'] = list(power_wind.sum(axis=1) / (power_wind.max(axis=1) * n_hours))
+    if self.instance.solar:
+        power_solar = 0.0036 * hourly_array(self, 'solar_power') * int(self.instance.capacity_solar.value)
+        self.cap_factor['solar'] = list(power_solar.sum(axis=1) / (power_solar.max(axis=1) * n_hours))
 
-        # Update the line counter.
-        line_counter += 1
-        if line_counter >= len(cmap):
-            line_counter = 0
+    # Plot the combined wind and solar energy of each scenario.
+    draw_paths(self, ax, power_wind + power_solar)
 
     # Update the axes labels and title.
     ax.set(
@@ -99,28 +92,9 @@ def grid_energy(self):
     """
     # Initialize the subplots environment and employ the custom color scheme.
     fig, ax = subplots()
-    cmap = self.custom_cmap
 
-    # Initialize a line counter to update the legend entry and color.
-    line_counter = 0
-
-    # Loop through each scenario to plot grid energy data.
-    for s in self.instance.scenario:
-        time = [
-            (st[1], st[2]) for st in self.instance.full_set
-            for _ in range(st[2]) if st[0] == s
-        ]
-        ax.plot(
-            range(time[0][0], time[-1][0] + time[-1][1]),
-            array([self.instance.energy_grid[(s, t)].value for t in time]),
-            color=cmap[line_counter],
-            linewidth=self.linewidth
-        )
-
-        # Update the line counter.
-        line_counter += 1
-        if line_counter >= len(cmap):
-            line_counter = 0
+    # Plot the grid energy of each scenario.
+    draw_paths(self, ax, hourly_array(self, 'energy_grid'))
 
     # Update the axes labels and title.
     ax.set(
@@ -153,37 +127,12 @@ def curtailed_energy(self):
     """
     # Initialize the subplots environment and employ the custom color scheme.
     fig, ax = subplots()
-    cmap = self.custom_cmap
 
-    # Initialize a line counter to update the legend entry and color.
-    line_counter = 0
-
-    # Loop through each scenario to plot curtailed energy data.
-    for s in self.instance.scenario:
-        time = [
-            (st[1], st[2]) for st in self.instance.full_set
-            for _ in range(st[2]) if st[0] == s
-        ]
-        if self.instance.grid_wheel:
-            y = array([
-                self.instance.energy_curtailed[(s, t)].value +
-                self.instance.energy_wheeled[(s, t)].value for t in time
-            ])
-        else:
-            y = array([
-                self.instance.energy_curtailed[(s, t)].value for t in time
-            ])
-        ax.plot(
-            range(time[0][0], time[-1][0] + time[-1][1]),
-            y,
-            color=cmap[line_counter],
-            linewidth=self.linewidth
-        )
-
-        # Update the line counter.
-        line_counter += 1
-        if line_counter >= len(cmap):
-            line_counter = 0
+    # Plot the curtailed (and wheeled) energy of each scenario.
+    curtailed = hourly_array(self, 'energy_curtailed')
+    if self.instance.grid_wheel:
+        curtailed = curtailed + hourly_array(self, 'energy_wheeled')
+    draw_paths(self, ax, curtailed)
 
     # Update the axes labels and title.
     ax.set(
@@ -215,28 +164,9 @@ def hydrogen_storage_tank_level(self):
     """
     # Initialize the subplots environment and employ the custom color scheme.
     fig, ax = subplots()
-    cmap = self.custom_cmap
 
-    # Initialize a line counter to update the legend entry and color.
-    line_counter = 0
-
-    # Loop through each scenario to plot hydrogen storage data.
-    for s in self.instance.scenario:
-        time = [
-            (st[1], st[2]) for st in self.instance.full_set
-            for _ in range(st[2]) if st[0] == s
-        ]
-        ax.plot(
-            range(time[0][0], time[-1][0] + time[-1][1]),
-            array([self.instance.gh2_storage[(s, t)].value for t in time]),
-            color=cmap[line_counter],
-            linewidth=self.linewidth
-        )
-
-        # Update the line counter.
-        line_counter += 1
-        if line_counter >= len(cmap):
-            line_counter = 0
+    # Plot the hydrogen storage of each scenario.
+    draw_paths(self, ax, hourly_array(self, 'gh2_storage'))
 
     # Update the axes labels and title.
     ax.set(
@@ -268,26 +198,9 @@ def origin_storage_tank_levels(self):
     """
     # Initialize the subplots environment and apply the custom color scheme.
     fig, ax = subplots()
-    cmap = self.custom_cmap
 
-    # Line counter to cycle through colors.
-    line_counter = 0
-
-    for s in self.instance.scenario:
-        # Extract time intervals for the current scenario.
-        time = [(st[1], st[2]) for st in self.instance.full_set for _ in range(st[2]) if st[0] == s]
-        for i in self.instance.vectors:
-            # Plot the storage levels for each vector.
-            ax.plot(
-                range(time[0][0], time[-1][0] + time[-1][1]),
-                array([self.instance.vector_storage_origin[(s, t[0], t[1]), i].value for t in time]),
-                label=i,
-                color=cmap[line_counter],
-                linewidth=self.linewidth
-            )
-        line_counter += 1
-        if line_counter >= len(cmap):
-            line_counter = 0
+    # Plot the storage levels of each vector and scenario.
+    draw_paths(self, ax, hourly_array(self, 'vector_storage_origin'), list(self.instance.vectors))
 
     # Update the axes.
     ax.set(
@@ -320,32 +233,12 @@ def hydrogen_production(self):
     """
     # Initialize the subplots environment and apply the custom color scheme.
     fig, ax = subplots()
-    cmap = self.custom_cmap
-
-    # Line counter to cycle through colors.
-    line_counter = 0
-
-    for s in self.instance.scenario:
-        # Extract time intervals for the current scenario.
-        time = [(st[1], st[2]) for st in self.instance.full_set for _ in range(st[2]) if st[0] == s]
-        y = zeros(int(size(time) / 2))
-
-        for i in self.instance.electrolysers:
-            # Update the y array for stacked plotting.
-            y += array([self.instance.energy_electrolysers[(s, t[0], t[1]), i].value for t in time])
-
-            # Plot the hydrogen production.
-            ax.plot(
-                range(time[0][0], time[-1][0] + time[-1][1]),
-                y,
-                label=i,
-                color=cmap[line_counter],
-                linewidth=self.linewidth
-            )
 
-        line_counter += 1
-        if line_counter >= len(cmap):
-            line_counter = 0
+    # Plot the production stacked over the electrolysers.
+    draw_paths(
+        self, ax, hourly_array(self, 'energy_electrolysers').cumsum(axis=2),
+        list(self.instance.electrolysers)
+    )
 
     # Update the axes.
     ax.set(
@@ -378,32 +271,12 @@ def vector_production(self):
     """
     # Initialize the subplots environment and apply the custom color scheme.
     fig, ax = subplots()
-    cmap = self.custom_cmap
 
-    # Line counter to cycle through colors.
-    line_counter = 0
-
-    for s in self.instance.scenario:
-        # Extract time intervals for the current scenario.
-        time = [(st[1], st[4], st[5]) for st in self.instance.vector_set_time for _ in range(st[2]) if st[3] == s]
-        y = zeros(int(size(time) / 3))
-
-        for i in self.instance.vectors:
-            # Update the y array for stacked plotting.
-            y += array([self.instance.energy_vector_production_flux[(s, t[1], t[2]), i].value for t in time])
-
-            # Plot the vector production.
-            ax.plot(
-                [t[0] for t in time],
-                y,
-                label=i,
-                color=cmap[line_counter],
-                linewidth=self.linewidth
-            )
-
-        line_counter += 1
-        if line_counter >= len(cmap):
-            line_counter = 0
+    # Plot the production stacked over the vectors.
+    draw_paths(
+        self, ax, hourly_array(self, 'energy_vector_production_flux').cumsum(axis=2),
+        list(self.instance.vectors)
+    )
 
     # Update the axes.
     ax.set(
@@ -435,32 +308,12 @@ def active_trains(self):
     """
     # Initialize the subplots environment and apply the custom color scheme.
     fig, ax = subplots()
-    cmap = self.custom_cmap
-
-    # Line counter to cycle through colors.
-    line_counter = 0
-
-    for s in self.instance.scenario:
-        # Extract time intervals for the current scenario.
-        time = [(st[1], st[4], st[5]) for st in self.instance.vector_set_time for _ in range(st[2]) if st[3] == s]
-        y = zeros(int(size(time) / 3))
-
-        for i in self.instance.vectors:
-            # Update the y array for stacked plotting.
-            y += array([self.instance.number_active_trains[(s, t[1], t[2]), i].value for t in time])
-
-            # Plot the number of active trains.
-            ax.plot(
-                [t[0] for t in time],
-                y,
-                label=i,
-                color=cmap[line_counter],
-                linewidth=self.linewidth
-            )
 
-        line_counter += 1
-        if line_counter >= len(cmap):
-            line_counter = 0
+    # Plot the trains stacked over the vectors.
+    draw_paths(
+        self, ax, hourly_array(self, 'number_active_trains').cumsum(axis=2),
+        list(self.instance.vectors)
+    )
 
     # Update the axes.
     ax.set(
@@ -494,23 +347,7 @@ def objective_cdf(self):
     # Initialize the subplots environment and apply the custom color scheme.
     fig, ax = subplots()
     cmap = self.custom_cmap
-    y = []
-
-    for s in self.instance.scenario:
-        # Calculate the discounted demand.
-        discounted_demand = (
-            (8760 / self.instance.end_time_index) *
-            self.instance.amortisation_plant *
-            sum(
-                sum(
-                    (self.instance.leaf_nodes[s, t, d]) *
-                    self.instance.energy_vector_production_flux[(s_v, t_v, d_v), q].value * d
-                    for s, t, d, s_v, t_v, d_v in self.instance.vector_set_time if s_v == s
-                ) / 120
-                for q in self.instance.vectors
-            )
-        )
-        y.append(1000 * (self.instance.CAPEX.value + self.instance.OPEX[s].value) / discounted_demand)
+    y = LCOHKernel.from_instance(self.instance).cdf()[0]
 
     # Plot the histogram of objective values.
     ax.hist(y, bins=7, alpha=0.7, color=cmap[0], edgecolor='black')
@@ -549,20 +386,7 @@ def LCOH_contributions(self, threshold):
         threshold (float): Minimum contribution value to include in the chart.
     """
     # Calculate discounted demand
-    self.instance.discounted_demand = (
-        (8760 / self.instance.end_time_index)
-        * self.instance.amortisation_plant
-        * sum(
-            sum(
-                (self.instance.leaf_nodes[s, t, d])
-                * self.instance.energy_vector_production_flux[(s_v, t_v, d_v), q].value
-                * d
-                for s, t, d, s_v, t_v, d_v in self.instance.vector_set_time
-            )
-            / 120
-            for q in self.instance.vectors
-        )
-    ) / len(self.instance.scenario.data())
+    self.instance.discounted_demand = LCOHKernel.from_instance(self.instance).expected_production
 
     # Initialize categories and contributions
     categories = ["Total LCOH"]
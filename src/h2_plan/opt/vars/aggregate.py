@@ -0,0 +1,192 @@
+"""
+This module implements the representative-period mode of the weather input.
+The hourly grid of the stochastic tree is split into chronological periods by
+merging adjacent hours with similar weather (Ward linkage over the samples of
+every scenario), and each period becomes a single node whose duration is the
+number of hours it represents. Periods never cross a stage, shipping, wheel
+or vector operating boundary, so the shipping and wheeling constraints keep
+their meaning, and the first and last hour stay single nodes.
+"""
+
+from heapq import heapify, heappop, heappush
+from math import ceil
+from numpy import array, asarray, bincount, float64, int64, searchsorted, sqrt
+
+
+def period_boundaries(n_hours, stage_duration, cluster_points=(), vector_operating_duration=1):
+    """
+    Returns the hours at which a period must start.
+
+    Args:
+        n_hours (int): Number of hours of the grid.
+        stage_duration (int): Duration of a stage in hours.
+        cluster_points (list): (period, offset) pairs passed to the clustering
+            of StochasticGrid; periods start at multiples of the period and
+            at the multiples shifted by the offset.
+        vector_operating_duration (int): Duration of a vector operating block.
+    """
+    boundaries = {0, 1, n_hours - 1}
+    for hour in range(n_hours):
+        if hour % stage_duration == 0:
+            boundaries.add(hour)
+        if vector_operating_duration > 1 and hour % vector_operating_duration == 0:
+            boundaries.add(hour)
+        for period, offset in cluster_points:
+            if hour % period == 0 or (hour - offset) % period == 0:
+                boundaries.add(hour)
+    return boundaries
+
+
+def segment_hours(features, boundaries, n_periods):
+    """
+    Merges adjacent hours into n_periods chronological periods, greedily
+    joining the pair of neighbouring periods with the lowest Ward cost
+    n_a * n_b / (n_a + n_b) * |mean_a - mean_b|^2.
+
+    Args:
+        features (list): Feature array of every hour. Only hours that may be
+            merged need arrays of the same length.
+        boundaries (set): Hours at which a period must start.
+        n_periods (int): Target number of periods; fewer merges are made if
+            the boundaries allow no more.
+
+    Returns:
+        ndarray: Sorted start hour of every period.
+    """
+    n_hours = len(features)
+    size = [1] * n_hours
+    total = [asarray(feature, dtype=float64).copy() for feature in features]
+    following = list(range(1, n_hours + 1))
+    preceding = list(range(-1, n_hours - 1))
+    alive = [True] * n_hours
+
+    def candidate(start):
+        end = following[start]
+        if start < 0 or end >= n_hours or end in boundaries:
+            return None
+        gap = total[start] / size[start] - total[end] / size[end]
+        cost = size[start] * size[end] / (size[start] + size[end]) * float(gap @ gap)
+        return cost, start, end, size[start], size[end]
+
+    heap = [entry for entry in map(candidate, range(n_hours)) if entry is not None]
+    heapify(heap)
+    count = n_hours
+    while count > n_periods and heap:
+        _, start, end, size_start, size_end = heappop(heap)
+        if (not alive[start] or not alive[end] or following[start] != end
+                or size[start] != size_start or size[end] != size_end):
+            continue
+        size[start] += size[end]
+        total[start] += total[end]
+        alive[end] = False
+        following[start] = following[end]
+        if following[end] < n_hours:
+            preceding[following[end]] = start
+        count -= 1
+        for entry in (candidate(preceding[start]), candidate(start)):
+            if entry is not None:
+                heappush(heap, entry)
+    return array([hour for hour in range(n_hours) if alive[hour]], dtype=int64)
+
+
+class AggregatedGrid:
+    """
+    A stochastic grid whose nodes are representative periods of an hourly
+    StochasticGrid. It offers the methods of StochasticGrid used by
+    generate_parameters, so it can stand in for it.
+
+    Attributes:
+    .. base: The hourly StochasticGrid the datasets were added to.
+    .. starts, durations: Start hour and length of every period.
+    .. hourly: The (s, t, 1) nodes of the hourly grid.
+    .. nodes: The (s, t, d) nodes of the aggregated grid.
+    .. owner: Position in nodes of the period containing every hourly node.
+    """
+
+    def __init__(self, base, datasets, boundaries, n_periods):
+        """
+        Splits the hourly grid of base into periods.
+
+        Args:
+            base: A StochasticGrid whose datasets were added without clustering.
+            datasets (list): Hourly samples (dictionaries keyed by node) of the
+                datasets to cluster on, e.g. the wind and solar power.
+            boundaries (set): Hours at which a period must start, see
+                period_boundaries.
+            n_periods (int): Target number of periods.
+        """
+        self.base = base
+        hourly = base.get_grid()
+        if any(d != 1 for _, _, d in hourly):
+            raise ValueError("Representative periods need a grid without clustering")
+        n_hours = max(t for _, t, _ in hourly) + 1
+        weights = base.leaf_nodes()
+
+        # Feature of an hour: the normalised samples of every node at that
+        # hour, weighted by the number of scenarios through the node
+        features = [[] for _ in range(n_hours)]
+        for samples in datasets:
+            scale = max(max(abs(value) for value in samples.values()), 1e-12)
+            for node in hourly:
+                features[node[1]].append(samples[node] / scale * sqrt(weights[node]))
+
+        self.starts = segment_hours(features, boundaries, n_periods)
+        self.durations = array(
+            [*(self.starts[1:] - self.starts[:-1]), n_hours - self.starts[-1]], dtype=int64
+        )
+        self.hourly = hourly
+        first_hours = set(self.starts.tolist())
+        self.nodes = [self.node(s, t) for s, t, _ in hourly if t in first_hours]
+
+        # Position of the period node containing every hourly node
+        position = {node: count for count, node in enumerate(self.nodes)}
+        self.owner = array([position[self.node(s, t)] for s, t, _ in hourly], dtype=int64)
+
+    def period(self, hour):
+        """
+        Returns the position of the period containing an hour.
+        """
+        return int(searchsorted(self.starts, hour, side='right') - 1)
+
+    def node(self, s, hour):
+        """
+        Returns the aggregated node of scenario representative s containing an hour.
+        """
+        period = self.period(hour)
+        return (s, int(self.starts[period]), int(self.durations[period]))
+
+    def get_grid(self):
+        return list(self.nodes)
+
+    def new_grid(self, k, offset=0):
+        """
+        Maps every node to the node of new_grid(k, offset) of the hourly grid
+        at its first hour, then to the period containing that node.
+        """
+        mapped = dict(zip(self.hourly, self.base.new_grid(k, offset)))
+        return [self.node(*mapped[s, t, 1][0:2]) for s, t, _ in self.nodes]
+
+    def remove_duplicates(self, nodes):
+        return self.base.remove_duplicates(nodes)
+
+    def leaf_nodes(self):
+        weights = self.base.leaf_nodes()
+        return {(s, t, d): weights[s, t, 1] for s, t, d in self.nodes}
+
+    def aggregate(self, samples):
+        """
+        Returns the mean of hourly samples over every period, keyed by the
+        aggregated nodes.
+        """
+        values = array([samples[node] for node in self.hourly], dtype=float64)
+        means = bincount(self.owner, weights=values, minlength=len(self.nodes))
+        means /= array([d for _, _, d in self.nodes], dtype=float64)
+        return dict(zip(self.nodes, means.tolist()))
+
+
+def target_periods(n_hours, aggregation_factor):
+    """
+    Returns the number of periods giving on average aggregation_factor hours
+    per period.
+    """
+    return max(1, ceil(n_hours / aggregation_factor))
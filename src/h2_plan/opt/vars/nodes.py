@@ -0,0 +1,316 @@
+"""
+This module maps the stochastic grid onto dense integer node ids, so that the
+tree structure can be handled with array operations rather than tuple lookups.
+"""
+
+from functools import cached_property
+from numpy import (
+    arange, argsort, array, asarray, concatenate, cumsum, full, ones, repeat, unique, zeros, int64
+)
+from scipy.sparse import csr_matrix
+from .series import node_values
+
+ARRAYS = (
+    'scenario', 'time', 'duration', 'parent', 'vector', 'vector_parent',
+    'shipping', 'shipping_parent', 'shipping_due', 'leaf_weight', 'leaves'
+)
+
+# Node id arrays making up each tuple set of the grid, in column order. The
+# sets hold one entry per node of full_set, so an entry is rebuilt from the id
+# of its first node.
+WIDE_SETS = {
+    'continuity_set': (('nodes', None), ('nodes', 'parent')),
+    'vector_set_time': (('nodes', None), ('vector_nodes', 'vector')),
+    'vector_continuity_set': (
+        ('nodes', None), ('nodes', 'parent'),
+        ('vector_nodes', 'vector'), ('vector_nodes', 'vector_parent')
+    ),
+    'shipping_set_time': (('nodes', None), ('shipping_nodes', 'shipping')),
+    'shipping_continuity_set': (
+        ('nodes', None), ('nodes', 'parent'), ('shipping_nodes', 'shipping'),
+        ('shipping_nodes', 'shipping_parent'), ('shipping_nodes', 'shipping_due')
+    ),
+}
+
+
+class NodeIndex:
+    """
+    Dense integer indexing of the (s, t, d) nodes of full_set.
+
+    Attributes:
+    .. nodes: The (s, t, d) tuples of full_set, in set order.
+    .. position: Dictionary mapping each node tuple to its integer id.
+    .. scenario, time, duration: Integer arrays of the node components.
+    .. parent: Id of the preceding node on the scenario path (root maps to itself).
+    .. leaf_weight: Number of scenarios passing through each node.
+    .. vector_nodes, vector, vector_parent: Nodes of vector_param_set and, per
+       node, the id of its current and preceding vector operating block.
+    .. shipping_nodes, shipping, shipping_parent, shipping_due: Nodes of
+       shipping_param_set and, per node, the id of its current and preceding
+       shipping block and of the block whose loading finishes at the node.
+    .. leaves: Id of the final node (s, end_time_index, 1) of each scenario.
+    .. vector_owner, shipping_owner: Id of the earliest node using each vector
+       and shipping block, built on first use (see block_owners).
+    """
+
+    def __init__(self, model):
+        """
+        Builds the index from the constructed grid sets of a model. A model
+        built in node-id mode carries its index, which is reused as is.
+
+        Args:
+            model: A model on which generate_parameters has been called.
+        """
+        if getattr(model, 'node_index', None) is not None:
+            self.__dict__.update(model.node_index.__dict__)
+            return
+        for name in ('full_set', 'continuity_set', 'vector_param_set',
+                     'vector_continuity_set', 'shipping_param_set',
+                     'shipping_continuity_set'):
+            component = getattr(model, name)
+            if not component.is_constructed():
+                component.construct()
+
+        self.nodes = list(model.full_set)
+        self.position = {node: count for count, node in enumerate(self.nodes)}
+        self.scenario, self.time, self.duration = (
+            array(column, dtype=int64) for column in zip(*self.nodes)
+        )
+
+        self.parent = arange(len(self.nodes))
+        for s, t, d, s_0, t_0, d_0 in model.continuity_set:
+            self.parent[self.position[s, t, d]] = self.position[s_0, t_0, d_0]
+
+        self.vector_nodes = list(model.vector_param_set)
+        vector_position = {node: count for count, node in enumerate(self.vector_nodes)}
+        self.vector = arange(len(self.nodes))
+        self.vector_parent = arange(len(self.nodes))
+        for s, t, d, _, _, _, s_v, t_v, d_v, s_v0, t_v0, d_v0 in model.vector_continuity_set:
+            self.vector[self.position[s, t, d]] = vector_position[s_v, t_v, d_v]
+            self.vector_parent[self.position[s, t, d]] = vector_position[s_v0, t_v0, d_v0]
+
+        self.shipping_nodes = list(model.shipping_param_set)
+        shipping_position = {node: count for count, node in enumerate(self.shipping_nodes)}
+        self.shipping = arange(len(self.nodes))
+        self.shipping_parent = arange(len(self.nodes))
+        self.shipping_due = arange(len(self.nodes))
+        for entry in model.shipping_continuity_set:
+            node = self.position[entry[0:3]]
+            self.shipping[node] = shipping_position[entry[6:9]]
+            self.shipping_parent[node] = shipping_position[entry[9:12]]
+            self.shipping_due[node] = shipping_position[entry[12:15]]
+
+        self.leaf_weight = node_values(model, 'leaf_nodes', self.nodes)
+        self.end_time = int(model.time.at(-1))
+        self.root = self.position[0, 0, 1]
+        self.leaves = array(
+            [self.position[s, self.end_time, 1] for s in model.scenario], dtype=int64
+        )
+
+    @classmethod
+    def from_grid(cls, nodes, parents, vector_nodes, vectors, vector_parents,
+                  shipping_nodes, shipping, shipping_parents, shipping_due,
+                  leaf_weight, end_time, scenarios):
+        """
+        Builds the index straight from the node lists of the stochastic grid,
+        without the tuple sets zipped from them.
+
+        Args:
+            nodes (list): The (s, t, d) nodes of the grid.
+            parents (list): Preceding node of every node.
+            vector_nodes (list): Nodes of vector_param_set.
+            vectors, vector_parents (list): Current and preceding vector
+                operating block of every node.
+            shipping_nodes (list): Nodes of shipping_param_set.
+            shipping, shipping_parents, shipping_due (list): Current and
+                preceding shipping block of every node, and the block whose
+                loading finishes at the node.
+            leaf_weight (array): Number of scenarios passing through every node.
+            end_time (int): The last time step.
+            scenarios (iterable): The scenarios of the model.
+        """
+        index = cls.__new__(cls)
+        index.nodes = nodes
+        index.position = position = {node: count for count, node in enumerate(nodes)}
+        index.scenario, index.time, index.duration = (
+            array(column, dtype=int64) for column in zip(*nodes)
+        )
+        index.parent = array([position[node] for node in parents], dtype=int64)
+
+        index.vector_nodes = vector_nodes
+        vector_position = {node: count for count, node in enumerate(vector_nodes)}
+        index.vector = array([vector_position[node] for node in vectors], dtype=int64)
+        index.vector_parent = array([vector_position[node] for node in vector_parents], dtype=int64)
+
+        index.shipping_nodes = shipping_nodes
+        shipping_position = {node: count for count, node in enumerate(shipping_nodes)}
+        index.shipping = array([shipping_position[node] for node in shipping], dtype=int64)
+        index.shipping_parent = array(
+            [shipping_position[node] for node in shipping_parents], dtype=int64
+        )
+        index.shipping_due = array([shipping_position[node] for node in shipping_due], dtype=int64)
+
+        index.leaf_weight = asarray(leaf_weight, dtype=float)
+        index.end_time = int(end_time)
+        index.root = position[0, 0, 1]
+        index.leaves = array(
+            [position[s, index.end_time, 1] for s in scenarios], dtype=int64
+        )
+        return index
+
+    def __len__(self):
+        return len(self.scenario)
+
+    def __deepcopy__(self, memo):
+        # The index is never modified, so clones of a model can share it
+        return self
+
+    def expand(self, node, name):
+        """
+        Returns the entry of a tuple set of the grid (see WIDE_SETS) for a node id.
+        """
+        entry = ()
+        for nodes, ids in WIDE_SETS[name]:
+            entry += getattr(self, nodes)[node if ids is None else getattr(self, ids)[node]]
+        return entry
+
+    @cached_property
+    def nodes(self):
+        return list(zip(self.scenario.tolist(), self.time.tolist(), self.duration.tolist()))
+
+    @cached_property
+    def position(self):
+        return {node: count for count, node in enumerate(self.nodes)}
+
+    @cached_property
+    def vector_nodes(self):
+        return [tuple(node) for node in self.vector_array.tolist()]
+
+    @cached_property
+    def shipping_nodes(self):
+        return [tuple(node) for node in self.shipping_array.tolist()]
+
+    @cached_property
+    def vector_position(self):
+        return {node: count for count, node in enumerate(self.vector_nodes)}
+
+    @cached_property
+    def shipping_position(self):
+        return {node: count for count, node in enumerate(self.shipping_nodes)}
+
+    def block_owners(self, blocks, n_blocks):
+        """
+        Returns, for every vector or shipping block, the id of the earliest
+        node using it. The block of a node may start inside another node, so
+        its (s, t, d) tuple need not be a node of full_set; every node using
+        the block descends from this one, so a scenario path uses the block
+        exactly when it passes through its owner.
+
+        Args:
+            blocks (array): Block of every node, e.g. self.vector.
+            n_blocks (int): Number of blocks, e.g. len(self.vector_nodes).
+        """
+        order = argsort(self.time, kind='stable')
+        used, first = unique(asarray(blocks)[order], return_index=True)
+        owners = full(n_blocks, self.root, dtype=int64)
+        owners[used] = order[first]
+        return owners
+
+    @cached_property
+    def vector_owner(self):
+        return self.block_owners(self.vector, len(self.vector_nodes))
+
+    @cached_property
+    def shipping_owner(self):
+        return self.block_owners(self.shipping, len(self.shipping_nodes))
+
+    def to_arrays(self):
+        """
+        Returns the index as a dictionary of arrays, see from_arrays.
+        """
+        arrays = {name: getattr(self, name) for name in ARRAYS}
+        arrays['vector_array'] = array(self.vector_nodes, dtype=int64).reshape(-1, 3)
+        arrays['shipping_array'] = array(self.shipping_nodes, dtype=int64).reshape(-1, 3)
+        arrays['scalars'] = array([self.end_time, self.root], dtype=int64)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        Restores an index from the arrays returned by to_arrays, without the
+        model it was built from. The arrays may be memory-mapped.
+        """
+        index = cls.__new__(cls)
+        for name in ARRAYS + ('vector_array', 'shipping_array'):
+            if name in arrays:
+                setattr(index, name, arrays[name])
+        index.end_time, index.root = (int(x) for x in arrays['scalars'])
+        return index
+
+    @staticmethod
+    def node_times(nodes):
+        """
+        Returns the time component of a list of node tuples as an array.
+        """
+        return array([node[1] for node in nodes], dtype=int64)
+
+    def ancestors(self, starts):
+        """
+        Returns a sparse incidence matrix with one row per start node, marking
+        every node on the path from that node back to the root (inclusive).
+
+        Args:
+            starts (array): Node ids from which to walk back along the tree.
+        """
+        current = asarray(starts, dtype=int64)
+        rows = arange(len(current))
+        active = ones(len(current), dtype=bool)
+        row_blocks, col_blocks = [], []
+        while active.any():
+            row_blocks.append(rows[active])
+            col_blocks.append(current[active])
+            following = self.parent[current]
+            active &= following != current
+            current = following
+        rows = concatenate(row_blocks) if row_blocks else array([], dtype=int64)
+        cols = concatenate(col_blocks) if col_blocks else array([], dtype=int64)
+        return csr_matrix(
+            (ones(len(rows)), (rows, cols)), shape=(len(starts), len(self))
+        )
+
+    @cached_property
+    def hour_nodes(self):
+        """
+        Id of the node active at every hour of every scenario path, as an
+        integer array of shape (scenario, hour).
+        """
+        path = self.ancestors(self.leaves).tocoo()
+        duration = self.duration[path.col]
+        offset = arange(duration.sum()) - repeat(cumsum(duration) - duration, duration)
+        hour_nodes = zeros((len(self.leaves), self.end_time + 1), dtype=int64)
+        hour_nodes[repeat(path.row, duration), repeat(self.time[path.col], duration) + offset] = (
+            repeat(path.col, duration)
+        )
+        return hour_nodes
+
+    def hourly(self, values):
+        """
+        Expands values given per node (along the first axis) to the hours of
+        every scenario path, giving an array of shape (scenario, hour, ...).
+        """
+        return asarray(values)[self.hour_nodes]
+
+
+def grid_set(model, name):
+    """
+    Iterates over a tuple set of the grid (see WIDE_SETS), from the Pyomo Set
+    or, for a model built in node-id mode, from its NodeIndex.
+
+    Args:
+        model: A model on which generate_parameters has been called.
+        name (str): Name of the set, e.g. 'vector_set_time'.
+    """
+    index = getattr(model, 'node_index', None)
+    if index is None:
+        return iter(getattr(model, name))
+    return (index.expand(node, name) for node in range(len(index)))
@@ -12,7 +12,14 @@ from pickle import load
 from pathlib import Path
 from PyStochOpt import StochasticGrid
 from pandas import read_pickle, read_csv
-from numpy import ones, int64
+from collections import OrderedDict
+from functools import lru_cache
+from numpy import arange, ones, int64
+from ..cache import SOLAR_FILENAME
+from .aggregate import AggregatedGrid, period_boundaries, target_periods
+from .nodes import NodeIndex
+from .series import NodeGrid, NodeSeries, selected
+from .weather import GridCache, WeatherGrid, grid_hash, grid_offsets
 
 
 def extract_values(dictionary, index):
@@ -40,9 +47,177 @@ def extract_values(dictionary, index):
     return extracted_dict
 
 
+# Mean energy of a unit of generating capacity over the scenarios, keyed by
+# the dataset and the grid_hash of its grid, so that repeated builds in a
+# process skip the reduction; the least recently used entries are evicted
+SCENARIO_ENERGY_ENTRIES = 32
+_SCENARIO_ENERGY = OrderedDict()
+
+
+@lru_cache(maxsize=None)
+def amortisation_factors(system_duration, discount_factor):
+    """
+    Returns the amortisation factors of equipment replaced every i years, for
+    i = 1, ..., system_duration - 1, followed by ones. The factor is one plus
+    the discounted cost of the replacements in years i, 2i, ... of the plant
+    lifetime.
+    Args:
+        system_duration (int): Lifetime of the plant in years.
+        discount_factor (float): Yearly discount rate.
+    Returns:
+        ndarray: Read-only array of length system_duration + 20.
+    """
+    equipment_lives = ones(system_duration + 20)
+    years = arange(1, system_duration)
+    replaced = years[None, :] % years[:, None] == 0
+    equipment_lives[:len(years)] += replaced @ (1 / (1 + discount_factor)) ** (years - 1)
+    equipment_lives.flags.writeable = False
+    return equipment_lives
+
+
+def scenario_energy(key, power, leaf_nodes, n_scenarios):
+    """
+    Returns the energy of a unit of capacity summed over a scenario path and
+    averaged over the scenarios, i.e. the sum of power * d * leaf_nodes over
+    the grid divided by the number of scenarios.
+    Args:
+        key (tuple): The dataset name and the grid_hash of the sampled grid,
+            or None to skip the memo.
+        power (NodeSeries): Power of a unit of capacity at every node.
+        leaf_nodes (NodeSeries): Number of scenarios through every node.
+        n_scenarios (int): Number of scenarios.
+    """
+    if key is None:
+        return power.weighted_sum(power.grid.duration, leaf_nodes) / n_scenarios
+    if key in _SCENARIO_ENERGY:
+        _SCENARIO_ENERGY.move_to_end(key)
+    else:
+        _SCENARIO_ENERGY[key] = power.weighted_sum(power.grid.duration, leaf_nodes) / n_scenarios
+        if len(_SCENARIO_ENERGY) > SCENARIO_ENERGY_ENTRIES:
+            _SCENARIO_ENERGY.popitem(last=False)
+    return _SCENARIO_ENERGY[key]
+
+
+def levelised_cost(capital_cost, operating_cost, replacement_factor, plant_factor, hourly_energy):
+    """
+    Returns the levelised cost of energy of a generator: its amortised capital
+    and operating costs over the discounted energy it produces.
+    Args:
+        capital_cost (float): Capital cost of a unit of capacity.
+        operating_cost (float): Yearly operating cost of a unit of capacity.
+        replacement_factor (float): Amortisation factor of the generator.
+        plant_factor (float): Amortisation factor of the plant lifetime.
+        hourly_energy (float): Mean energy produced by a unit of capacity per hour.
+    """
+    return (
+        (capital_cost * replacement_factor + operating_cost * plant_factor) /
+        (8760 * plant_factor * hourly_energy)
+    )
+
+
+def generate_node_sets(model, parameters, stochastic_grid, grid):
+    """
+    Generates the sets of the grid in node-id mode. Every (s, t, d) node is
+    given an integer id and the tuple sets zipped from the grid (continuity_set,
+    vector_set_time, vector_continuity_set, shipping_set_time and
+    shipping_continuity_set) are replaced by the id arrays of a NodeIndex,
+    stored as model.node_index. Constraints over these sets are indexed by the
+    node ids in model.nodes instead.
+    Args:
+        model: The optimization model to which the sets will be added.
+        parameters (dict): The extracted model parameters.
+        stochastic_grid: The StochasticGrid the datasets were added to.
+        grid (NodeGrid): The nodes of the grid.
+    Returns:
+        None
+    """
+    vector_grid = stochastic_grid.new_grid(parameters['vector_operating_duration'])
+    shipping_grid = stochastic_grid.new_grid(parameters['shipping_decision'])
+    vector_nodes = stochastic_grid.remove_duplicates(vector_grid)
+    shipping_nodes = stochastic_grid.remove_duplicates(shipping_grid)
+
+    model.node_index = NodeIndex.from_grid(
+        grid.nodes, stochastic_grid.new_grid(1, 1),
+        vector_nodes, vector_grid,
+        stochastic_grid.new_grid(parameters['vector_operating_duration'], 1),
+        shipping_nodes, shipping_grid,
+        stochastic_grid.new_grid(parameters['shipping_decision'], 1),
+        stochastic_grid.new_grid(
+            parameters['shipping_decision'], parameters['shipping']['loading_time']
+        ),
+        model.node_series['leaf_nodes'].values, model.time.at(-1), model.scenario
+    )
+    model.nodes = Set(initialize=range(len(grid)))
+    model.full_set = Set(initialize=grid.nodes, dimen=3)
+    model.vector_param_set = Set(initialize=vector_nodes)
+    model.shipping_param_set = Set(initialize=shipping_nodes)
+
+
+def sample_weather(model, parameters, filename, filepath, cluster_points, weather_path):
+    """
+    Samples the weather datasets on a new StochasticGrid, clustering or
+    aggregating the grid as configured, and records the result as a
+    WeatherGrid so that it can be stored in the grid cache.
+
+    Args:
+        model: The optimization model, with its booleans and time set.
+        parameters (dict): The extracted formulation parameters.
+        filename (str): Weather data file used to build the model.
+        filepath (str): Directory of the weather data file.
+        cluster_points (list): (period, offset) pairs the clustering must keep.
+        weather_path (Path): Directory of the solar data file.
+    """
+    stochastic_grid = StochasticGrid(
+        parameters['n_stages'], parameters['n_stochastics'],
+        parameters['stage_duration'], model.random_seed
+    )
+    aggregation_factor = parameters.get('aggregation_factor', 1)
+
+    # Add wind dataset
+    if aggregation_factor > 1:
+        # Representative periods: every dataset is sampled hourly and the
+        # hours are merged into periods on the samples (see AggregatedGrid)
+        samples = {'wind': stochastic_grid.add_dataset(filename, filepath, cluster=False)}
+        if model.solar:
+            samples['solar'] = stochastic_grid.add_dataset(SOLAR_FILENAME, str(weather_path))
+        datasets = [samples['wind']] if model.wind else []
+        if model.solar:
+            datasets.append(samples['solar'])
+        n_hours = len(model.time)
+        stochastic_grid = AggregatedGrid(
+            stochastic_grid, datasets,
+            period_boundaries(
+                n_hours, parameters['stage_duration'], cluster_points,
+                parameters['vector_operating_duration']
+            ),
+            target_periods(n_hours, aggregation_factor)
+        )
+        samples = {name: stochastic_grid.aggregate(values) for name, values in samples.items()}
+    elif model.wind and not model.solar:
+        samples = {'wind': stochastic_grid.add_dataset(
+            filename, filepath,
+            cluster=True, epsilon=0.001,
+            cluster_points=cluster_points
+        )}
+    else:
+        samples = {'wind': stochastic_grid.add_dataset(
+            filename, filepath, cluster=False
+        )}
+        if model.solar:
+            samples['solar'] = stochastic_grid.add_dataset(
+                SOLAR_FILENAME, str(weather_path),
+            )
+    return WeatherGrid.record(stochastic_grid, samples, grid_offsets(parameters))
+
+
 def generate_parameters(model, parameters, filename, filepath):
     """
     Generates and initializes parameters and sets for a stochastic optimization model.
+    The sampled grid is only read from and written to the grid cache if
+    model.weather_cache is set (as H2Planning does when built with cache=True).
+    If model.scenario_path is set to a scenario, the model only holds the nodes
+    on the path of that scenario (see WeatherGrid.scenario_grid), while the
+    parameters derived from the whole tree, such as the LCOE, are unchanged.
     Args:
         model: The optimization model to which parameters and sets will be added.
         parameters (dict): A dictionary containing various parameters required for the model.
@@ -56,21 +231,21 @@ def generate_parameters(model, parameters, filename, filepath):
     parameters = extract_values(parameters, 1)
 
     # Generate sets for vectors and electrolysers
-    model.vectors = Set(initialize=[
-        key for key, value in parameters['booleans']['vector_choice'].items() if value
-    ])
-    model.electrolysers = Set(initialize=[
-        key for key, value in parameters['booleans']['electrolysers'].items() if value
-    ])
+    vectors = selected(parameters['booleans']['vector_choice'])
+    electrolysers = selected(parameters['booleans']['electrolysers'])
+    model.vectors = Set(initialize=vectors)
+    model.electrolysers = Set(initialize=electrolysers)
     model.time = Set(initialize=range(
         (parameters['n_stages'] + 1) * parameters['stage_duration']
     ))
     model.time.construct()
 
     # Generate parameters for the stochastic system
-    model.scenario = Set(initialize=range(
-        parameters['n_stochastics'] ** parameters['n_stages']
-    ))
+    n_scenarios = parameters['n_stochastics'] ** parameters['n_stages']
+    scenario_path = getattr(model, 'scenario_path', None)
+    model.scenario = Set(
+        initialize=range(n_scenarios) if scenario_path is None else [scenario_path]
+    )
     model.stage = Set(initialize=range(parameters['n_stages'] + 1))
     model.vector_operating_duration = Param(
         initialize=parameters['vector_operating_duration']
@@ -127,107 +302,118 @@ def generate_parameters(model, parameters, filename, filepath):
         parameters['wheel_period'] = int(parameters['wheel_period'])
         model.wheel_period = Param(initialize=parameters['wheel_period'], mutable=False)
 
-    # Initialize stochastic grid
-    stochastic_grid = StochasticGrid(
-        parameters['n_stages'], parameters['n_stochastics'],
-        parameters['stage_duration'], model.random_seed
-    )
-
+    # Points the clustering of the grid must keep, i.e. the shipping and
+    # wheeling periods
+    cluster_points = [
+        (parameters['shipping_decision'], parameters['shipping']['loading_time'])
+    ]
+    if model.grid_wheel:
+        cluster_points.append((parameters['wheel_period'], 0))
     weather_path = Path(__file__).parent.parent.parent / "weathermodel/data/"
 
-    # Add wind dataset
-    if model.wind and not model.solar:
-        if model.grid_wheel:
-            wind_samples = stochastic_grid.add_dataset(
-                filename, filepath,
-                cluster=True, epsilon=0.001,
-                cluster_points=[
-                    (parameters['shipping_decision'], parameters['shipping']['loading_time']),
-                    (parameters['wheel_period'], 0)
-                ]
-            )
-        else:
-            wind_samples = stochastic_grid.add_dataset(
-                filename, filepath,
-                cluster=True, epsilon=0.001,
-                cluster_points=[
-                    (parameters['shipping_decision'], parameters['shipping']['loading_time'])
-                ]
-            )
-    else:
-        wind_samples = stochastic_grid.add_dataset(
-            filename, filepath, cluster=False
+    # Initialize stochastic grid, memory-mapped from the grid cache when the
+    # same weather and tree were sampled before
+    try:
+        grid_key = grid_hash(parameters, filename, filepath, model.random_seed)
+    except FileNotFoundError as e:
+        print(f'[INFO] Grid cache skipped: {e}')
+        grid_key = None
+    use_cache = getattr(model, 'weather_cache', False) and grid_key is not None
+    grid_cache = GridCache() if use_cache else None
+    stochastic_grid = grid_cache.fetch(grid_key) if grid_cache is not None else None
+    if stochastic_grid is None:
+        stochastic_grid = sample_weather(
+            model, parameters, filename, filepath, cluster_points, weather_path
         )
+        if grid_cache is not None:
+            grid_cache.store(grid_key, stochastic_grid)
+    wind_key = ('wind', grid_key) if grid_key is not None else None
+
+    # The energy of the whole tree prices the LCOE, also on a single scenario path
+    grid = NodeGrid(stochastic_grid.get_grid())
+    tree_leaf_nodes = NodeSeries(grid, stochastic_grid.leaf_weight)
+    tree_power = {
+        name: NodeSeries(grid, values) for name, values in stochastic_grid.samples.items()
+    }
+    if scenario_path is not None:
+        stochastic_grid = stochastic_grid.scenario_grid(scenario_path)
+        grid = NodeGrid(stochastic_grid.get_grid())
+    model.node_series = {
+        'leaf_nodes': NodeSeries(grid, stochastic_grid.leaf_weight)
+    }
 
-    # Generate sets for vector continuity and shipping
-    model.vector_continuity_set = Set(
-        initialize=zip( 
-            stochastic_grid.get_grid(),
-            stochastic_grid.new_grid(1, 1),
-            stochastic_grid.new_grid(parameters['vector_operating_duration']),
-            stochastic_grid.new_grid(parameters['vector_operating_duration'], 1)
-        ),
-        dimen=12
-    )
-
-    leaf_nodes = stochastic_grid.leaf_nodes()
+    if getattr(model, 'node_id_mode', False):
+        generate_node_sets(model, parameters, stochastic_grid, grid)
+    else:
+        # Generate sets for vector continuity and shipping
+        model.vector_continuity_set = Set(
+            initialize=zip( 
+                stochastic_grid.get_grid(),
+                stochastic_grid.new_grid(1, 1),
+                stochastic_grid.new_grid(parameters['vector_operating_duration']),
+                stochastic_grid.new_grid(parameters['vector_operating_duration'], 1)
+            ),
+            dimen=12
+        )
 
-    model.vector_set_time = Set(
-        initialize=zip(
-            stochastic_grid.get_grid(),
-            stochastic_grid.new_grid(parameters['vector_operating_duration'])
-        ),
-        dimen=6
-    )
-    model.vector_param_set = Set(
-        initialize=stochastic_grid.remove_duplicates(
-            stochastic_grid.new_grid(parameters['vector_operating_duration'])
+        model.vector_set_time = Set(
+            initialize=zip(
+                stochastic_grid.get_grid(),
+                stochastic_grid.new_grid(parameters['vector_operating_duration'])
+            ),
+            dimen=6
         )
-    )
-    model.shipping_set_time = Set(
-        initialize=zip(
-            stochastic_grid.get_grid(),
-            stochastic_grid.new_grid(parameters['shipping_decision'])
-        ),
-        dimen=6
-    )
-    model.full_set = Set(initialize=stochastic_grid.get_grid(), dimen=3)
-    model.continuity_set = Set(
-        initialize=zip(
-            stochastic_grid.get_grid(),
-            stochastic_grid.new_grid(1, 1)
-        ),
-        dimen=6
-    )
-    model.shipping_param_set = Set(
-        initialize=stochastic_grid.remove_duplicates(
-            stochastic_grid.new_grid(parameters['shipping_decision'])
+        model.vector_param_set = Set(
+            initialize=stochastic_grid.remove_duplicates(
+                stochastic_grid.new_grid(parameters['vector_operating_duration'])
+            )
         )
-    )
-    model.shipping_continuity_set = Set(
-        initialize=zip(
-            stochastic_grid.get_grid(),
-            stochastic_grid.new_grid(1, 1),
-            stochastic_grid.new_grid(parameters['shipping_decision']),
-            stochastic_grid.new_grid(parameters['shipping_decision'], 1),
-            stochastic_grid.new_grid(
-                parameters['shipping_decision'], parameters['shipping']['loading_time']
+        model.shipping_set_time = Set(
+            initialize=zip(
+                stochastic_grid.get_grid(),
+                stochastic_grid.new_grid(parameters['shipping_decision'])
+            ),
+            dimen=6
+        )
+        model.full_set = Set(initialize=grid.nodes, dimen=3)
+        model.continuity_set = Set(
+            initialize=zip(
+                stochastic_grid.get_grid(),
+                stochastic_grid.new_grid(1, 1)
+            ),
+            dimen=6
+        )
+        model.shipping_param_set = Set(
+            initialize=stochastic_grid.remove_duplicates(
+                stochastic_grid.new_grid(parameters['shipping_decision'])
             )
-        ),
-        dimen=15
-    )
+        )
+        model.shipping_continuity_set = Set(
+            initialize=zip(
+                stochastic_grid.get_grid(),
+                stochastic_grid.new_grid(1, 1),
+                stochastic_grid.new_grid(parameters['shipping_decision']),
+                stochastic_grid.new_grid(parameters['shipping_decision'], 1),
+                stochastic_grid.new_grid(
+                    parameters['shipping_decision'], parameters['shipping']['loading_time']
+                )
+            ),
+            dimen=15
+        )
 
     model.full_set.construct()
-    model.continuity_set.construct()
     model.vector_param_set.construct()
+    if not getattr(model, 'node_id_mode', False):
+        model.continuity_set.construct()
 
     # Add other decision variables
     model.end_time_index = Param(initialize=model.time.at(-1), mutable=False)
     model.time_values = Param(
         model.time, initialize={key: key for key in model.time}, mutable=False
     )
-    model.leaf_nodes = Param(model.full_set, initialize=leaf_nodes)
-    model.leaf_nodes.construct()
+    # The node parameters are looked up in their series when create_instance
+    # constructs them, so the abstract model holds no per-node copy
+    model.leaf_nodes = Param(model.full_set, initialize=model.node_series['leaf_nodes'])
 
     # Generate energy-related parameters
     n_samp = sum([
@@ -236,19 +422,17 @@ def generate_parameters(model, parameters, filename, filepath):
     ])
 
     if model.wind:
+        model.node_series['turbine_power'] = NodeSeries(grid, stochastic_grid.samples['wind'])
         model.turbine_power = Param(
-            model.full_set, initialize=wind_samples, mutable=False
+            model.full_set, initialize=model.node_series['turbine_power'], mutable=False
         )
-        model.turbine_power.construct()
 
     if model.solar:
-        solar_samples = stochastic_grid.add_dataset(
-            'CoastalChile_Solar.csv', str(weather_path),
-        )
+        solar_key = ('solar', grid_key) if grid_key is not None else None
+        model.node_series['solar_power'] = NodeSeries(grid, stochastic_grid.samples['solar'])
         model.solar_power = Param(
-            model.full_set, initialize=solar_samples, mutable=False
+            model.full_set, initialize=model.node_series['solar_power'], mutable=False
         )
-        model.solar_power.construct()
 
     model.fuel_cell_efficiency = Param(
         initialize=parameters['efficiencies']['fuel_cell'], mutable=False
@@ -262,7 +446,7 @@ def generate_parameters(model, parameters, filename, filepath):
     model.electrolyser_compression_energy = Param(
         model.electrolysers, initialize={
             key: parameters['miscillaneous']['electrolyser_compression_energy'][key]
-            for key, value in parameters['booleans']['electrolysers'].items() if value
+            for key in electrolysers
         }, mutable=False
     )
     model.storage_compression_penalty = Param(
@@ -271,14 +455,14 @@ def generate_parameters(model, parameters, filename, filepath):
     model.vector_compression_penalty = Param(
         model.vectors, initialize={
             key: parameters['miscillaneous']['vector_compression_penalty'][key]
-            for key, value in parameters['booleans']['vector_choice'].items() if value
+            for key in vectors
         }, mutable=False
     )
 
     model.electrolyser_efficiency = Param(
         model.electrolysers, initialize={
             key: parameters['efficiencies']['electrolysers'][key]
-            for key, value in parameters['booleans']['electrolysers'].items() if value
+            for key in electrolysers
         }, mutable=False
     )
 
@@ -290,21 +474,21 @@ def generate_parameters(model, parameters, filename, filepath):
     model.single_train_throughput_limit = Param(
         model.vectors, initialize={
             key: parameters['vector_production']['single_train_throughput'][key]
-            for key, value in parameters['booleans']['vector_choice'].items() if value
+            for key in vectors
         }, mutable=False
     )
 
     model.vector_calorific_value = Param(
         model.vectors, initialize={
             key: parameters['efficiencies']['vector_calorific_value'][key]
-            for key, value in parameters['booleans']['vector_choice'].items() if value
+            for key in vectors
         }, mutable=False
     )
     # Define the minimum process throughput for each vector
     model.minimum_process_throughput = Param(
         model.vectors, initialize={
             key: parameters['vector_production']['minimum_train_throughput'][key]
-            for key, value in parameters['booleans']['vector_choice'].items() if value
+            for key in vectors
         }, mutable=False
     )
 
@@ -312,7 +496,7 @@ def generate_parameters(model, parameters, filename, filepath):
     model.bol_energy_penalty = Param(
         model.vectors, initialize={
             key: parameters['vector_production']['boil_off_energy_penalty'][key]
-            for key, value in parameters['booleans']['vector_choice'].items() if value
+            for key in vectors
         }, mutable=False
     )
 
@@ -320,7 +504,7 @@ def generate_parameters(model, parameters, filename, filepath):
     model.bol_rate = Param(
         model.vectors, initialize={
             key: parameters['vector_production']['boil_off_percentage'][key] / 100
-            for key, value in parameters['booleans']['vector_choice'].items() if value
+            for key in vectors
         }, mutable=False
     )
 
@@ -328,7 +512,7 @@ def generate_parameters(model, parameters, filename, filepath):
     model.vector_fixed_energy_penalty = Param(
         model.vectors, initialize={
             key: parameters['vector_production']['fixed_energy_penalty'][key]
-            for key, value in parameters['booleans']['vector_choice'].items() if value
+            for key in vectors
         }, mutable=False
     )
 
@@ -336,7 +520,7 @@ def generate_parameters(model, parameters, filename, filepath):
     model.vector_variable_energy_penalty = Param(
         model.vectors, initialize={
             key: parameters['vector_production']['variable_energy_penalty'][key]
-            for key, value in parameters['booleans']['vector_choice'].items() if value
+            for key in vectors
         }, mutable=False
     )
 
@@ -344,7 +528,7 @@ def generate_parameters(model, parameters, filename, filepath):
     model.vector_fugitive_efficiency = Param(
         model.vectors, initialize={
             key: parameters['efficiencies']['vector_fugitive'][key]
-            for key, value in parameters['booleans']['vector_choice'].items() if value
+            for key in vectors
         }, mutable=False
     )
 
@@ -352,7 +536,7 @@ def generate_parameters(model, parameters, filename, filepath):
     model.vector_synthetic_efficiency = Param(
         model.vectors, initialize={
             key: parameters['efficiencies']['vector_synthesis'][key]
-            for key, value in parameters['booleans']['vector_choice'].items() if value
+            for key in vectors
         }, mutable=False
     )
 
@@ -360,7 +544,7 @@ def generate_parameters(model, parameters, filename, filepath):
     model.ramp_down_limit = Param(
         model.vectors, initialize={
             key: parameters['vector_production']['ramp_down_limit'][key]
-            for key, value in parameters['booleans']['vector_choice'].items() if value
+            for key in vectors
         }, mutable=False
     )
 
@@ -368,7 +552,7 @@ def generate_parameters(model, parameters, filename, filepath):
     model.ramp_up_limit = Param(
         model.vectors, initialize={
             key: parameters['vector_production']['ramp_up_limit'][key]
-            for key, value in parameters['booleans']['vector_choice'].items() if value
+            for key in vectors
         }, mutable=False
     )
 
@@ -382,18 +566,15 @@ def generate_parameters(model, parameters, filename, filepath):
     model.ship_storage_capacity = Param(
         model.vectors, initialize={
             key: parameters['shipping']['storage_capacity'][key]
-            for key, value in parameters['booleans']['vector_choice'].items() if value
+            for key in vectors
         }, mutable=False
     )
 
     # Calculate the amortisation factor for equipment replacement
-    equipment_lives = ones(parameters['replacement_frequencies']['system_duration'] + 20)
-
-    # Compute amortised costs for equipment replacement during the plant's lifetime
-    for i in range(1, parameters['replacement_frequencies']['system_duration']):
-        for j in range(1, parameters['replacement_frequencies']['system_duration']):
-            if j % i == 0:
-                equipment_lives[i - 1] += (1 / (1 + parameters['miscillaneous']['discount_factor'])) ** (j - 1)
+    equipment_lives = amortisation_factors(
+        parameters['replacement_frequencies']['system_duration'],
+        parameters['miscillaneous']['discount_factor']
+    )
 
     # Add amortised costs for each piece of equipment to the model
     model.amortisation_turbine = Param(
@@ -411,19 +592,19 @@ def generate_parameters(model, parameters, filename, filepath):
     model.amortisation_vector_production = Param(
         model.vectors, initialize={
             key: equipment_lives[floor(parameters['replacement_frequencies']['vector_production'][key] - 1)]
-            for key, value in parameters['booleans']['vector_choice'].items() if value
+            for key in vectors
         }, mutable=False
     )
     model.amortisation_electrolysers = Param(
         model.electrolysers, initialize={
             key: equipment_lives[floor(parameters['replacement_frequencies']['electrolysers'][key] - 1)]
-            for key, value in parameters['booleans']['electrolysers'].items() if value
+            for key in electrolysers
         }, mutable=False
     )
     model.amortisation_vector_storage = Param(
         model.vectors, initialize={
             key: equipment_lives[floor(parameters['replacement_frequencies']['vector_storage'][key] - 1)]
-            for key, value in parameters['booleans']['vector_choice'].items() if value
+            for key in vectors
         }, mutable=False
     )
     model.amortisation_compressor = Param(
@@ -432,29 +613,29 @@ def generate_parameters(model, parameters, filename, filepath):
     model.amortisation_plant = Param(initialize=equipment_lives[0], mutable=False)
 
     # Define hydrogen price
-    model.hydrogen_price = Param(initialize=parameters['hydrogen_price'])
+    model.hydrogen_price = Param(initialize=parameters['hydrogen_price'], mutable=True)
 
     # Calculate Levelized Cost of Energy (LCOE) for wind and solar
     lcoap = []
+    hours = int(model.time.at(-1) + 1)
     if model.wind:
-        lcowp = (
-            (parameters['capital_costs']['turbine'] * equipment_lives[parameters['replacement_frequencies']['turbine'] - 1] +
-             (parameters['operating_costs']['turbine'] * equipment_lives[0])) /
-            ((8760 * parameters['efficiencies']['turbine'] * equipment_lives[0] /
-              int(model.time.at(-1) + 1) *
-              sum([model.turbine_power[s, t, d] * d * model.leaf_nodes[s, t, d] for s, t, d in model.full_set]) /
-              parameters['n_stochastics'] ** parameters['n_stages']))
+        lcowp = levelised_cost(
+            parameters['capital_costs']['turbine'], parameters['operating_costs']['turbine'],
+            equipment_lives[parameters['replacement_frequencies']['turbine'] - 1], equipment_lives[0],
+            parameters['efficiencies']['turbine'] * scenario_energy(
+                wind_key, tree_power['wind'], tree_leaf_nodes, n_scenarios
+            ) / hours
         )
         model.LCOWP = Param(initialize=lcowp, mutable=False)
         lcoap.append(lcowp)
 
     if model.solar:
-        lcos = (
-            (parameters['capital_costs']['solar'] * equipment_lives[parameters['replacement_frequencies']['solar'] - 1] +
-             (parameters['operating_costs']['solar'] * equipment_lives[0])) /
-            ((8760 * equipment_lives[0] / int(model.time.at(-1) + 1) * 0.0036 *
-              sum([model.solar_power[s, t, d] * d * model.leaf_nodes[s, t, d] for s, t, d in model.full_set]) /
-              parameters['n_stochastics'] ** parameters['n_stages']))
+        lcos = levelised_cost(
+            parameters['capital_costs']['solar'], parameters['operating_costs']['solar'],
+            equipment_lives[parameters['replacement_frequencies']['solar'] - 1], equipment_lives[0],
+            0.0036 * scenario_energy(
+                solar_key, tree_power['solar'], tree_leaf_nodes, n_scenarios
+            ) / hours
         )
         model.LCOSP = Param(initialize=lcos, mutable=False)
         lcoap.append(lcos)
@@ -466,27 +647,27 @@ def generate_parameters(model, parameters, filename, filepath):
     model.vector_storage_unit_capital_cost = Param(
         model.vectors, initialize={
             key: parameters['capital_costs']['vector_storage'][key]
-            for key, value in parameters['booleans']['vector_choice'].items() if value
+            for key in vectors
         }, mutable=False
     )
     model.vector_storage_unit_operating_cost = Param(
         model.vectors, initialize={
             key: parameters['operating_costs']['vector_storage'][key]
-            for key, value in parameters['booleans']['vector_choice'].items() if value
+            for key in vectors
         }, mutable=False
     )
     model.vector_production_unit_capital_cost = Param(
         model.vectors, initialize={
             key: parameters['capital_costs']['vector_production'][key] *
                  (parameters['vector_production']['single_train_throughput'][key]) ** (2 / 3)
-            for key, value in parameters['booleans']['vector_choice'].items() if value
+            for key in vectors
         }, mutable=False
     )
     model.vector_production_unit_operating_cost = Param(
         model.vectors, initialize={
             key: parameters['operating_costs']['vector_production'][key] *
                  (parameters['vector_production']['single_train_throughput'][key]) ** (2 / 3)
-            for key, value in parameters['booleans']['vector_choice'].items() if value
+            for key in vectors
         }, mutable=False
     )
     model.hydrogen_storage_cost_sf = Param(
@@ -533,13 +714,13 @@ def generate_parameters(model, parameters, filename, filepath):
     model.electrolyser_unit_capital_cost = Param(
         model.electrolysers, initialize={
             key: parameters['capital_costs']['electrolysers'][key]
-            for key, value in parameters['booleans']['electrolysers'].items() if value
+            for key in electrolysers
         }, mutable=False
     )
     model.electrolyser_unit_operating_cost = Param(
         model.electrolysers, initialize={
             key: parameters['operating_costs']['electrolysers'][key]
-            for key, value in parameters['booleans']['electrolysers'].items() if value
+            for key in electrolysers
         }, mutable=False
     )
     model.grid_energy_factor = Param(
@@ -550,6 +731,6 @@ def generate_parameters(model, parameters, filename, filepath):
     model.capacity_vector_production = Param(
         model.vectors, initialize={
             key: parameters['equipment']['vector_production'][key]
-            for key, value in parameters['booleans']['vector_choice'].items() if value
+            for key in vectors
         }, mutable=False
     )
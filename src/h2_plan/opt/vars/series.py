@@ -0,0 +1,134 @@
+"""
+This module stores the time series parameters of the stochastic grid, such as
+the turbine and solar power and the number of leaf nodes, as NumPy arrays over
+the nodes of full_set instead of dictionaries keyed by (s, t, d) tuples. A
+NodeSeries is a read-only mapping, so it can initialise a Param directly, and
+its values are only looked up when that Param is constructed.
+"""
+
+from collections.abc import Mapping
+from functools import cached_property
+from numpy import array, asarray, float64, int64
+from pyomo.environ import value
+
+
+class NodeGrid:
+    """
+    The ordered (s, t, d) nodes shared by every NodeSeries of a grid.
+
+    Attributes:
+    .. nodes: The (s, t, d) tuples in grid order.
+    .. position: Dictionary mapping each node to its row, built on first use.
+    .. duration: Integer array of the node durations, built on first use.
+    """
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @cached_property
+    def position(self):
+        return {node: count for count, node in enumerate(self.nodes)}
+
+    @cached_property
+    def duration(self):
+        return array([node[2] for node in self.nodes], dtype=int64)
+
+    def __deepcopy__(self, memo):
+        # The grid is never modified, so clones of a model can share them
+        return self
+
+
+class NodeSeries(Mapping):
+    """
+    A read-only mapping from the nodes of a grid to the rows of a float array.
+
+    Attributes:
+    .. grid: The NodeGrid of the grid.
+    .. values: Float array with one entry per node, in the order of grid.
+    """
+
+    def __init__(self, grid, values):
+        values = asarray(values, dtype=float64)
+        if len(values) != len(grid):
+            raise ValueError(
+                f"A node series needs one value per node, got {len(values)} values "
+                f"for {len(grid)} nodes"
+            )
+        self.grid = grid
+        self.values = values
+
+    @classmethod
+    def from_dict(cls, grid, dictionary):
+        """
+        Packs a dictionary keyed by node tuples, such as the samples returned
+        by StochasticGrid.add_dataset, into the order of the grid.
+
+        Args:
+            grid (NodeGrid): The nodes of the grid.
+            dictionary (dict): Value of every node in the grid.
+        """
+        return cls(grid, [dictionary[node] for node in grid.nodes])
+
+    def __getitem__(self, node):
+        return float(self.values[self.grid.position[node]])
+
+    def __iter__(self):
+        return iter(self.grid.nodes)
+
+    def __len__(self):
+        return len(self.grid)
+
+    def __contains__(self, node):
+        return node in self.grid.position
+
+    def take(self, nodes):
+        """
+        Returns the values of a list of nodes as an array, without any lookup
+        when the nodes are the grid of the series.
+        """
+        if nodes is self.grid.nodes or nodes == self.grid.nodes:
+            return self.values
+        position = self.grid.position
+        return self.values[array([position[node] for node in nodes], dtype=int64)]
+
+    def weighted_sum(self, *weights):
+        """
+        Returns the sum over the nodes of the values times the product of
+        the given series or arrays.
+        """
+        product = self.values
+        for weight in weights:
+            product = product * (weight.values if isinstance(weight, NodeSeries) else weight)
+        return float(product.sum())
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def selected(choices):
+    """
+    Returns the keys of a dictionary of boolean choices that are enabled, e.g.
+    the energy vectors in parameters['booleans']['vector_choice'].
+    """
+    return [key for key, enabled in choices.items() if enabled]
+
+
+def node_values(model, name, nodes):
+    """
+    Returns the values of a node parameter for a list of nodes as an array,
+    from the NodeSeries of the model when it has one and from the Param
+    otherwise (e.g. for instances built before the series were stored).
+
+    Args:
+        model: A model on which generate_parameters has been called.
+        name (str): 'turbine_power', 'solar_power' or 'leaf_nodes'.
+        nodes (list): The (s, t, d) nodes to look up.
+    """
+    series = getattr(model, 'node_series', {}).get(name)
+    if series is not None:
+        return series.take(nodes)
+    param = getattr(model, name)
+    return array([value(param[node]) for node in nodes], dtype=float64)
@@ -0,0 +1,274 @@
+"""
+This module caches the sampled stochastic grid. StochasticGrid parses the
+weather CSV files and clusters the grid on every build; the result only
+depends on the weather files, the tree shape, the random seed and the
+clustering settings, so it is stored once as .npy arrays and memory-mapped by
+later builds with the same settings.
+"""
+
+import os
+import json
+import hashlib
+from functools import lru_cache
+from shutil import rmtree
+from pathlib import Path
+from numpy import array, asarray, load, ones, save, float64, int64
+from ..cache import SOLAR_FILENAME, file_digest, package_version, weather_file
+
+
+class WeatherGrid:
+    """
+    A sampled stochastic grid held as arrays. It offers the methods of
+    StochasticGrid used by generate_parameters, so it can stand in for it.
+
+    Attributes:
+    .. nodes: The (s, t, d) nodes of the grid as an integer array.
+    .. leaf_weight: Number of scenarios passing through every node.
+    .. samples: Dictionary of dataset name ('wind', 'solar') to the samples of
+       every node.
+    .. mappings: Dictionary of (k, offset) to the nodes returned by
+       new_grid(k, offset), as an integer array.
+    """
+
+    def __init__(self, nodes, leaf_weight, samples, mappings):
+        self.nodes = nodes
+        self.leaf_weight = leaf_weight
+        self.samples = samples
+        self.mappings = mappings
+
+    @classmethod
+    def record(cls, stochastic_grid, samples, offsets):
+        """
+        Records a sampled StochasticGrid (or AggregatedGrid).
+
+        Args:
+            stochastic_grid: The grid the datasets were added to.
+            samples (dict): Dataset name to the samples returned by add_dataset.
+            offsets (list): The (k, offset) pairs of new_grid to record.
+        """
+        nodes = stochastic_grid.get_grid()
+        leaf_nodes = stochastic_grid.leaf_nodes()
+        return cls(
+            array(nodes, dtype=int64).reshape(-1, 3),
+            array([leaf_nodes[node] for node in nodes], dtype=float64),
+            {
+                name: array([values[node] for node in nodes], dtype=float64)
+                for name, values in samples.items()
+            },
+            {
+                (k, offset): array(stochastic_grid.new_grid(k, offset), dtype=int64).reshape(-1, 3)
+                for k, offset in set(offsets)
+            }
+        )
+
+    def save(self, directory):
+        """
+        Writes the arrays to a directory, see load.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        save(directory / 'nodes.npy', self.nodes)
+        save(directory / 'leaf_weight.npy', self.leaf_weight)
+        for name, values in self.samples.items():
+            save(directory / f'samples_{name}.npy', values)
+        for count, values in enumerate(self.mappings.values()):
+            save(directory / f'grid_{count}.npy', values)
+        with open(directory / 'meta.json', 'w') as f:
+            json.dump({
+                'samples': list(self.samples),
+                'mappings': [list(pair) for pair in self.mappings],
+            }, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """
+        Reads a grid written by save, memory-mapping its arrays.
+        """
+        directory = Path(directory)
+        with open(directory / 'meta.json', 'r') as f:
+            meta = json.load(f)
+        return cls(
+            load(directory / 'nodes.npy', mmap_mode=mmap_mode),
+            load(directory / 'leaf_weight.npy', mmap_mode=mmap_mode),
+            {
+                name: load(directory / f'samples_{name}.npy', mmap_mode=mmap_mode)
+                for name in meta['samples']
+            },
+            {
+                tuple(pair): load(directory / f'grid_{count}.npy', mmap_mode=mmap_mode)
+                for count, pair in enumerate(meta['mappings'])
+            }
+        )
+
+    def scenario_grid(self, scenario):
+        """
+        Returns the grid of a single scenario path: the nodes from the root to
+        the leaf (scenario, end, 1), in grid order, each passed by one scenario.
+        The node tuples, samples and block mappings are those of this grid.
+
+        Args:
+            scenario (int): The scenario whose path is kept.
+        """
+        nodes = self.get_grid()
+        position = {node: count for count, node in enumerate(nodes)}
+        parents = self.new_grid(1, 1)
+        root = position[0, 0, 1]
+        count = position[scenario, int(self.nodes[:, 1].max()), 1]
+        path = [count]
+        while count != root:
+            count = position[parents[count]]
+            path.append(count)
+        path.sort()
+        return WeatherGrid(
+            asarray(self.nodes)[path],
+            ones(len(path), dtype=float64),
+            {name: asarray(values)[path] for name, values in self.samples.items()},
+            {pair: asarray(values)[path] for pair, values in self.mappings.items()}
+        )
+
+    @staticmethod
+    def _tuples(nodes):
+        return [tuple(node) for node in asarray(nodes).tolist()]
+
+    def get_grid(self):
+        return self._tuples(self.nodes)
+
+    def new_grid(self, k, offset=0):
+        if (k, offset) not in self.mappings:
+            raise ValueError(f"new_grid({k}, {offset}) was not recorded for this grid")
+        return self._tuples(self.mappings[k, offset])
+
+    def remove_duplicates(self, nodes):
+        return list(dict.fromkeys(nodes))
+
+    def leaf_nodes(self):
+        return dict(zip(self.get_grid(), self.leaf_weight.tolist()))
+
+
+@lru_cache(maxsize=32)
+def _digest(path, modified, size):
+    return file_digest(path)
+
+
+def weather_digest(path):
+    """
+    Returns the file_digest of a weather file, hashing its contents only once
+    per modification time and size.
+    """
+    path = Path(path)
+    stat = path.stat()
+    return _digest(path, stat.st_mtime_ns, stat.st_size)
+
+
+def grid_offsets(parameters):
+    """
+    Returns the (k, offset) pairs of new_grid used by generate_parameters.
+    """
+    return [
+        (1, 1),
+        (parameters['vector_operating_duration'], 0),
+        (parameters['vector_operating_duration'], 1),
+        (parameters['shipping_decision'], 0),
+        (parameters['shipping_decision'], 1),
+        (parameters['shipping_decision'], parameters['shipping']['loading_time']),
+    ]
+
+
+def grid_hash(parameters, filename, filepath, random_seed):
+    """
+    Returns a stable hash of everything the sampled grid depends on: the
+    weather files, the tree shape, the random seed, the clustering settings
+    and the package version.
+
+    Args:
+        parameters (dict): The extracted formulation parameters.
+        filename (str): Weather data file used to build the model.
+        filepath (str): Directory of the weather data file.
+        random_seed (int): Random seed of the model.
+
+    Raises:
+        FileNotFoundError: If a weather file cannot be found (see weather_file).
+    """
+    booleans = parameters['booleans']
+    weather = [weather_digest(weather_file(filename, filepath))]
+    if booleans['solar']:
+        weather.append(weather_digest(weather_file(SOLAR_FILENAME)))
+    payload = json.dumps(
+        {
+            'weather': weather,
+            'tree': [parameters['n_stages'], parameters['n_stochastics'], parameters['stage_duration']],
+            'random_seed': random_seed,
+            'datasets': [booleans['wind'], booleans['solar']],
+            'clustering': [
+                parameters['shipping_decision'], parameters['shipping']['loading_time'],
+                parameters['wheel_period'] if booleans['grid_wheel'] else None,
+                parameters['vector_operating_duration'],
+                parameters.get('aggregation_factor', 1),
+            ],
+            'version': package_version(),
+        },
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class GridCache:
+    """
+    Stores sampled grids under their grid hash, evicting the least recently
+    used entries once the cache holds more than max_entries grids.
+
+    Attributes:
+    .. directory: Folder holding one subfolder per cached grid.
+    .. max_entries: Maximum number of grids kept in the cache.
+    """
+
+    def __init__(self, directory=None, max_entries=64):
+        if directory is None:
+            directory = Path(__file__).resolve().parent.parent.parent / 'tmp' / 'cache' / 'grid'
+        self.directory = Path(directory)
+        self.max_entries = max_entries
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path(self, digest):
+        return self.directory / digest
+
+    def fetch(self, digest):
+        """
+        Returns the cached grid, memory-mapped, and marks it as recently used,
+        or None if the grid is not in the cache.
+        """
+        path = self.path(digest)
+        try:
+            os.utime(path)
+            return WeatherGrid.load(path)
+        except OSError:
+            # Missing, or evicted by the prune of another process while loading
+            return None
+
+    def store(self, digest, grid):
+        """
+        Adds a grid to the cache and evicts the oldest entries.
+        """
+        temporary = self.directory / f'{digest}.{os.getpid()}.tmp'
+        grid.save(temporary)
+        try:
+            os.replace(temporary, self.path(digest))
+        except OSError:
+            # Another process stored the same grid first
+            rmtree(temporary, ignore_errors=True)
+        self.prune()
+
+    def prune(self):
+        entries = []
+        for path in self.directory.iterdir():
+            if path.suffix == '.tmp':
+                continue
+            try:
+                if path.is_dir():
+                    entries.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                # Removed by another process since the listing
+                continue
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            rmtree(path, ignore_errors=True)
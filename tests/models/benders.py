@@ -0,0 +1,46 @@
+"""
+This code builds a stochastic model and solves its LP relaxation by Benders decomposition.
+"""
+
+import sys
+from h2_plan.algs import Benders
+from h2_plan.data.default import DefaultParams
+
+booleans = {
+    'vector_choice': {
+        'LH2': sys.argv[3] == 'LH2',
+        'NH3': sys.argv[3] == 'NH3'
+    },
+    'electrolysers': {
+        'alkaline': True,
+        'PEM': True,
+        'SOFC': True
+    },
+    'grid_connection': False,
+    'wind': sys.argv[6] in ['Wind', 'Both'],
+    'solar': sys.argv[6] in ['Solar', 'Both'],
+    'net_present_value': True,
+    'grid_wheel': False,
+    'geographical_storage': False,
+}
+
+parameters = DefaultParams().formulation_parameters
+parameters.update({
+    'booleans': booleans,
+    'wheel_period': 24,
+    'stage_duration': int(sys.argv[5]),
+    'n_stages': int(sys.argv[1]),
+    'n_stochastics': int(sys.argv[2]),
+    'hydrogen_price': 5,  # $/kg
+    'random_seed': int(sys.argv[4]),
+    'relaxed_ramping': True,
+    'vector_operating_duration': 1,
+    'shipping_decision': 168
+})
+
+if __name__ == '__main__':
+    benders = Benders(sys.argv[7], parameters, 'CoastalChile_15-20_Wind.csv').solve(
+        workers=int(sys.argv[8]), solver='gurobi'
+    )
+    print(f'LCOH: {benders.lcoh():.4f} $/kg')
+    print(benders.capacity_dict())
@@ -4,10 +4,12 @@ from os import getcwd, chdir, environ, popen, system
 from dill import dump
 import numpy as np
 from h2_plan.opt import H2Planning
+from h2_plan.opt.solvers import Deadline
 from h2_plan.data.default import DefaultParams
 from h2_plan.algs import *
 
 start_time = time.time()
+deadline = Deadline(int(sys.argv[8]), start=start_time)
 
 booleans = {
     'vector_choice': {
@@ -40,10 +42,9 @@ parameters.update({
 })
 
 model = H2Planning(parameters, key=sys.argv[7],filename = 'CoastalChile_15-20_Wind.csv', filepath = None )
-time_elapsed = time.time() - start_time
 
 model = H2Planning.class_solve(
     key=sys.argv[7],
-    time=int(sys.argv[8]) - time_elapsed,
+    deadline=deadline,
     solver='gurobi',
 )
@@ -0,0 +1,69 @@
+"""
+This script builds the same model through the Pyomo and matrix build modes,
+solves both with HiGHS and compares the objective values. It exits with a
+non-zero status if they differ by more than the two MIP gaps allow.
+"""
+
+import sys
+import time
+from pyomo.environ import SolverFactory, value
+from h2_plan.opt import H2Planning
+from h2_plan.data.default import DefaultParams
+
+booleans = {
+   'vector_choice': {
+      'LH2': sys.argv[3] == 'LH2',
+      'NH3': sys.argv[3] == 'NH3'
+   },
+   'electrolysers': {
+      'alkaline': True,
+      'PEM': True,
+      'SOFC': True
+   },
+   'grid_connection': False,
+   'wind': sys.argv[6] in ['Wind', 'Both'],
+   'solar': sys.argv[6] in ['Solar', 'Both'],
+   'net_present_value': True,
+   'grid_wheel': False,
+   'geographical_storage': False,
+}
+
+parameters = DefaultParams().formulation_parameters
+parameters.update({
+   'booleans': booleans,
+   'wheel_period': 24,
+   'stage_duration': int(sys.argv[5]),
+   'n_stages': int(sys.argv[1]),
+   'n_stochastics': int(sys.argv[2]),
+   'hydrogen_price': 5,  # $/kg
+   'random_seed': int(sys.argv[4]),
+   'relaxed_ramping': True,
+   'vector_operating_duration': 1,
+   'shipping_decision': 168
+})
+
+# Relative MIP gaps of the two solves; both optima lie within their gap of the
+# true optimum, so the objectives may differ by at most their sum
+MATRIX_GAP = 1e-4
+PYOMO_GAP = 1e-4
+
+matrix = H2Planning(
+   parameters, key=sys.argv[7], filename='CoastalChile_15-20_Wind.csv', mode='matrix'
+).matrix.solve(mip_percentage=100 * MATRIX_GAP)
+
+model = H2Planning(parameters, key=sys.argv[7], filename='CoastalChile_15-20_Wind.csv')
+start_time = time.time()
+solver = SolverFactory('appsi_highs')
+solver.config.mip_gap = PYOMO_GAP
+solver.solve(model.instance)
+print(f'[INFO] Pyomo model solved in {time.time() - start_time:.2f} seconds')
+
+pyomo_objective = value(model.instance.Obj)
+print(f'Pyomo objective:  {pyomo_objective:.6f}')
+print(f'Matrix objective: {matrix.objective:.6f}')
+
+tolerance = (MATRIX_GAP + PYOMO_GAP) * max(abs(pyomo_objective), abs(matrix.objective), 1e-6)
+if abs(pyomo_objective - matrix.objective) > tolerance:
+    print(f'[ERROR] The objectives differ by {abs(pyomo_objective - matrix.objective):.6g}, '
+          f'more than the tolerance of {tolerance:.6g}')
+    sys.exit(1)
@@ -0,0 +1,8 @@
+"""
+This code builds, solves and post-processes the points of a Pareto front in parallel.
+"""
+
+import sys
+from h2_plan.algs import Pareto
+
+Pareto.sweep(sys.argv[1], workers=int(sys.argv[2]))